@@ -4,6 +4,8 @@ S3_BUCKET=$S3_BUCKET_NAME
 S3_PREFIX=$S3_PREFIX_NAME
 WEBHOOK_URL="https://hooks.slack.com/services/${WEBHOOK_PATH}"
 
+source "$(dirname "$0")/catalog.sh"
+
 # slack notification
 slack_notify() {
     echo "Push container information to slack channel"
@@ -20,10 +22,19 @@ slack_notify() {
 BACKUP_DATE_TIME=$(date +"%Y%m%d%H%M%S")
 PARTITION_DATE=$(date +"%Y")-$(date +"%m")-$(date +"%d")
 echo "Container is terminating. Uploading data to S3..."
-if [ ! -d backup/${PARTITION_DATE} ]; then
-    mkdir -p backup/${PARTITION_DATE}
+# 既定(tar)は全体のtar.gz、BACKUP_FORMAT=chunks なら前回から変わったチャンクだけを送る差分バックアップ
+if [[ "${BACKUP_FORMAT:-tar}" != "chunks" ]]; then
+    FILE_NAME='minecraft-'${BACKUP_DATE_TIME}'.tar.gz'
+    BACKUP_COMMAND="create"
+else
+    FILE_NAME='minecraft-'${BACKUP_DATE_TIME}'.manifest.json.gz'
+    BACKUP_COMMAND="snapshot --prefix ${S3_PREFIX}"
+fi
+BACKUP_KEY=${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}
+# ローカルにtarを作らず、並列にgzip圧縮しながらS3へマルチパートアップロードする
+if CATALOG_LINE=$(python3 "$(dirname "$0")/backup_tool.py" ${BACKUP_COMMAND} --bucket ${S3_BUCKET} --key ${BACKUP_KEY} -C /data world world_nether world_the_end); then
+    slack_notify "<!channel>\n\n:creeper:バックアップを作成しました！！\n\nバックアップファイル名: *${S3_BUCKET}/${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}* \n\n*削除*したい場合は、以下のリンクから削除を行ってください。\n\nhttps://s3.console.aws.amazon.com/s3/object/${S3_BUCKET}?region=ap-northeast-1&prefix=${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}"
+    catalog_append "$CATALOG_LINE"
+else
+    slack_notify ":warning:バックアップのアップロードに失敗しました。\n\nバックアップファイル名: *${S3_BUCKET}/${BACKUP_KEY}*"
 fi
-FILE_NAME='minecraft-'${BACKUP_DATE_TIME}'.tar.gz'
-tar -zcvf backup/${PARTITION_DATE}/${FILE_NAME} -C /data world/ world_nether/ world_the_end/
-slack_notify "<!channel>\n\n:creeper:バックアップを作成しました！！\n\nバックアップファイル名: *${S3_BUCKET}/${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}* \n\n*削除*したい場合は、以下のリンクから削除を行ってください。\n\nhttps://s3.console.aws.amazon.com/s3/object/${S3_BUCKET}?region=ap-northeast-1&prefix=${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}"
-aws s3 cp backup/${PARTITION_DATE}/${FILE_NAME} s3://${S3_BUCKET}/${S3_PREFIX}/${PARTITION_DATE}/
@@ -0,0 +1,1123 @@
+#!/usr/bin/env python3
+"""Stream world backups to and from S3 without a local archive.
+
+    backup_tool.py create --bucket B --key K [-C /data] world world_nether ...
+    backup_tool.py snapshot --bucket B --prefix P --key K [-C /data] world ...
+    backup_tool.py restore --bucket B --prefix P [--timestamp T] [-C /data]
+
+The worlds are written as one tar stream (GNU format, paths relative to
+-C like ``tar -C /data world/``). The stream is cut into blocks that are
+gzip-compressed on all cores; each block is an independent gzip member,
+and concatenated members are a valid .tar.gz for ``tar -xzf``. The
+compressed bytes go straight into an S3 multipart upload whose parts are
+sent concurrently, and are hashed on the way.
+
+On success the backup catalog line (key, size, timestamp, sha256, worlds)
+is printed on stdout for catalog.sh; progress and MB/s go to stderr.
+
+``snapshot`` writes an incremental backup instead: Anvil region files
+(.mca) are split into their per-chunk payloads, every chunk and every
+other file is stored once by sha256 in pack objects under chunks/, and
+the backup itself is a small gzip JSON manifest at K
+(minecraft-<timestamp>.manifest.json.gz, next to the tar.gz backups)
+listing the files and where their blobs live. Files whose size and mtime
+match the previous manifest under P are not read again, and only blobs
+that manifest does not already reference are uploaded. Each manifest is
+self-contained, so any of them can be restored on its own.
+
+``restore`` takes the backup (tar.gz or manifest) at --timestamp, or the
+newest one found by walking the date partitions newest first. A tar.gz
+is fetched with concurrent ranged GETs consumed in order and extracted
+while it arrives into a staging directory next to -C. A manifest is
+restored into the same staging directory by creating every file at its
+final size (region files rebuilt with their chunks back to back), then
+fetching the blobs with coalesced ranged GETs and checking each against
+its sha256. The object's sha256 is checked against the catalog before
+the staged worlds replace the current ones, so a broken download leaves
+the existing data alone. A JSON line with the key and its LastModified
+is printed on stdout.
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+MiB = 1024 * 1024
+BLOCK_SIZE = 8 * MiB
+PART_SIZE = 16 * MiB
+UPLOAD_CONCURRENCY = 4
+COMPRESS_LEVEL = 6
+DOWNLOAD_CHUNK_SIZE = 16 * MiB
+DOWNLOAD_CONCURRENCY = 8
+CATALOG_KEY = "catalog/backups.jsonl"
+PARTITION = re.compile(r"/\d{4}-\d{2}-\d{2}/$")
+BACKUP_NAME = re.compile(
+    r"minecraft-(\d{14})\.(?:tar\.gz|manifest\.json\.gz)$"
+)
+MANIFEST_NAME = re.compile(r"minecraft-(\d{14})\.manifest\.json\.gz$")
+MANIFEST_FORMAT = 1
+# チャンクのpackはprefixの外に置く(日付パーティションの一覧やカタログの作り直しに混ざらない)
+CHUNK_STORE = "chunks/"
+PACK_SIZE = 32 * MiB
+# これ以下の隙間なら2つのblobを1回の範囲GETでまとめて取る
+RANGE_GAP = 1 * MiB
+SECTOR_SIZE = 4096
+REGION_HEADER_SIZE = 2 * SECTOR_SIZE
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def gzip_member(data, level):
+    """One complete gzip member; zlib releases the GIL while compressing."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipWriter:
+    """File-like sink for tarfile that compresses blocks on a thread pool
+    and hands the members to ``sink`` in order."""
+
+    def __init__(self, sink, workers, level=COMPRESS_LEVEL):
+        self.sink = sink
+        self.level = level
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # 先行して圧縮するブロック数の上限(メモリ使用量を抑える)
+        self.max_pending = workers * 2
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.raw_bytes = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.raw_bytes += len(data)
+        while len(self.buffer) >= BLOCK_SIZE:
+            block = bytes(self.buffer[:BLOCK_SIZE])
+            del self.buffer[:BLOCK_SIZE]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block):
+        self.pending.append(
+            self.executor.submit(gzip_member, block, self.level)
+        )
+        while len(self.pending) >= self.max_pending:
+            self.sink.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buffer or not self.raw_bytes:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self.sink.write(self.pending.popleft().result())
+        self.executor.shutdown()
+
+
+class MultipartUpload:
+    """Write-only stream into an S3 multipart upload.
+
+    Parts of ``part_size`` are uploaded by a pool of ``concurrency``
+    threads; at most that many parts wait in memory besides the one
+    being filled. The stream is sha256-hashed as it passes.
+    """
+
+    def __init__(self, s3, bucket, key, part_size, concurrency):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.buffer = bytearray()
+        self.parts = []
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.upload_id = s3.create_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            ContentType="application/gzip",
+        )["UploadId"]
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[: self.part_size])
+            del self.buffer[: self.part_size]
+            self._upload(part)
+
+    def _upload(self, body):
+        number = len(self.parts) + 1
+        self.slots.acquire()
+        future = self.executor.submit(self._upload_part, number, body)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.parts.append(future)
+
+    def _upload_part(self, number, body):
+        etag = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=body,
+        )["ETag"]
+        return {"PartNumber": number, "ETag": etag}
+
+    def complete(self):
+        if self.buffer or not self.parts:
+            self._upload(bytes(self.buffer))
+            self.buffer = bytearray()
+        parts = [future.result() for future in self.parts]
+        self.executor.shutdown()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.s3.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        )
+
+
+class FileSink:
+    """Local stand-in for MultipartUpload (--file), same hashing."""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        self.file.write(data)
+
+    def complete(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+
+
+class _FixedSize:
+    """Exactly ``size`` bytes of ``fileobj``, zero-padded if it shrank.
+
+    The server may still be writing while the backup runs; GNU tar warns
+    and carries on in that case, so the stream must not break either.
+    """
+
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.remaining = size
+
+    def read(self, n=-1):
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.fileobj.read(n)
+        if len(data) < n:
+            data += b"\0" * (n - len(data))
+        self.remaining -= n
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+
+def add_tree(tar, root, name):
+    """Add ``root/name`` recursively in sorted order, like tar -C root name/.
+
+    Returns the number of files, or None when ``name`` does not exist.
+    """
+    path = os.path.join(root, name)
+    if not os.path.lexists(path):
+        log(f"skip missing {path}")
+        return None
+    files = 0
+    for directory, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        arcdir = os.path.relpath(directory, root)
+        tar.addfile(tar.gettarinfo(directory, arcdir))
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            arcname = os.path.join(arcdir, filename)
+            try:
+                info = tar.gettarinfo(source, arcname)
+                if not info.isreg():
+                    tar.addfile(info)
+                    continue
+                with open(source, "rb") as f:
+                    tar.addfile(info, _FixedSize(f, info.size))
+            except FileNotFoundError:
+                # 走査中に消えたファイル(セーブ中の一時ファイルなど)は飛ばす
+                continue
+            files += 1
+    return files
+
+
+def catalog_line(key, size, sha256, worlds, **extra):
+    timestamp = BACKUP_NAME.search(key)
+    return json.dumps(
+        {
+            "key": key,
+            "size": size,
+            "timestamp": (
+                timestamp.group(1)
+                if timestamp
+                else re.sub(r"[^0-9]", "", os.path.basename(key))
+            ),
+            "sha256": sha256,
+            "worlds": worlds,
+            **extra,
+        },
+        separators=(",", ":"),
+    )
+
+
+def create(args):
+    if args.file:
+        sink = FileSink(args.file)
+    else:
+        import boto3
+
+        sink = MultipartUpload(
+            boto3.client("s3"),
+            args.bucket,
+            args.key,
+            args.part_size * MiB,
+            args.upload_concurrency,
+        )
+    gzip_writer = ParallelGzipWriter(sink, args.workers, args.level)
+    start = time.perf_counter()
+    files = 0
+    worlds = []
+    try:
+        with tarfile.open(
+            fileobj=gzip_writer, mode="w|", format=tarfile.GNU_FORMAT
+        ) as tar:
+            for world in args.worlds:
+                added = add_tree(tar, args.directory, world)
+                if added is not None:
+                    files += added
+                    worlds.append(world)
+        gzip_writer.close()
+        sink.complete()
+    except BaseException:
+        sink.abort()
+        raise
+    elapsed = time.perf_counter() - start
+    log(
+        f"{files} files, {gzip_writer.raw_bytes / MiB:.1f} MB -> "
+        f"{sink.size / MiB:.1f} MB in {elapsed:.1f}s "
+        f"({gzip_writer.raw_bytes / MiB / elapsed:.1f} MB/s read, "
+        f"{sink.size / MiB / elapsed:.1f} MB/s uploaded)"
+    )
+    print(catalog_line(args.key, sink.size, sink.sha256.hexdigest(), worlds))
+
+
+# --- streams: backup_tool.pyが正。slash_commandのbackup_contents.pyに同じものを置く
+class OrderedRangeReader(io.RawIOBase):
+    """Read-only stream of an S3 object fetched as concurrent ranged GETs.
+
+    Up to ``concurrency`` chunks are in flight; they are handed out in
+    object order, so the consumer sees one sequential stream and at most
+    ``concurrency`` chunks besides the one being read are held in memory.
+    Only the first ``size`` bytes are read. With ``digest`` (a hashlib
+    object) the bytes are hashed as they are consumed.
+    """
+
+    def __init__(
+        self, s3, bucket, key, size, chunk_size, concurrency, digest=None
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.chunk_size = chunk_size
+        self.digest = digest
+        self.bytes_read = 0
+        self.requests = 0
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.window = deque()
+        self.next_offset = 0
+        self.chunk = memoryview(b"")
+        for _ in range(concurrency):
+            self._fetch_next()
+
+    def readable(self):
+        return True
+
+    def _fetch(self, first, last):
+        body = self.s3.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={first}-{last}"
+        )["Body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        if len(data) != last - first + 1:
+            raise IOError(f"short read at {first}: {len(data)} bytes")
+        return data
+
+    def _fetch_next(self):
+        if self.next_offset >= self.size:
+            return
+        first = self.next_offset
+        last = min(first + self.chunk_size, self.size) - 1
+        self.next_offset = last + 1
+        self.requests += 1
+        self.window.append(self.executor.submit(self._fetch, first, last))
+
+    def readinto(self, b):
+        if not self.chunk:
+            if not self.window:
+                return 0
+            data = self.window.popleft().result()
+            # 1つ受け取ったら次の範囲を投げて、常にconcurrency個を先読みする
+            self._fetch_next()
+            if self.digest is not None:
+                self.digest.update(data)
+            self.chunk = memoryview(data)
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        self.bytes_read += n
+        return n
+
+    def close(self):
+        # 読み終える前に閉じたときは、先読み中のGETを待たない
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().close()
+
+
+class GunzipStream(io.RawIOBase):
+    """Decompress a stream of one or more concatenated gzip members.
+
+    Parallel compressors write one member per block, and tarfile's own
+    "r|gz" stops after the first; ``members`` counts them. A stream that
+    ends inside a member raises EOFError.
+    """
+
+    def __init__(self, raw, read_size=1024 * 1024):
+        self.raw = raw
+        self.read_size = read_size
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.pending = b""
+        self.members = 1
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            if self.decompressor.eof:
+                # 次のgzipメンバーの先頭から展開し直す
+                data = self.decompressor.unused_data or self.raw.read(
+                    self.read_size
+                )
+                if not data:
+                    return 0
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self.members += 1
+            else:
+                data = self.decompressor.unconsumed_tail or self.raw.read(
+                    self.read_size
+                )
+                if not data:
+                    raise EOFError("compressed stream ended early")
+            self.pending = self.decompressor.decompress(data, len(b))
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+# --- streams end
+
+
+def newest_in(s3, bucket, partition, timestamp="", pattern=BACKUP_NAME):
+    """Newest key in one partition matching ``pattern`` whose timestamp
+    starts with ``timestamp``, or None."""
+    paginator = s3.get_paginator("list_objects_v2")
+    found = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=partition):
+        for obj in page.get("Contents", []):
+            match = pattern.search(obj["Key"])
+            if match and match.group(1).startswith(timestamp):
+                found.append((match.group(1), obj["Key"]))
+    return max(found)[1] if found else None
+
+
+def find_backup_key(s3, bucket, prefix, timestamp=None, pattern=BACKUP_NAME):
+    """Key of the backup to restore (a tar.gz or a manifest).
+
+    With ``timestamp`` (YYYYmmdd[HHMMSS], a prefix is enough) only its
+    date partition is listed. Otherwise the YYYY-MM-DD/ partitions are
+    listed with a delimiter and walked newest first, so the whole prefix
+    is never listed.
+    """
+    if timestamp:
+        partition = datetime.strptime(timestamp[:8], "%Y%m%d")
+        return newest_in(
+            s3, bucket, f"{prefix}/{partition:%Y-%m-%d}/", timestamp, pattern
+        )
+    paginator = s3.get_paginator("list_objects_v2")
+    partitions = []
+    for page in paginator.paginate(
+        Bucket=bucket, Prefix=f"{prefix}/", Delimiter="/"
+    ):
+        partitions += [
+            p["Prefix"]
+            for p in page.get("CommonPrefixes", [])
+            if PARTITION.search(p["Prefix"])
+        ]
+    for partition in sorted(partitions, reverse=True):
+        key = newest_in(s3, bucket, partition, pattern=pattern)
+        if key is not None:
+            return key
+    return None
+
+
+def catalog_sha256(s3, bucket, key):
+    """The sha256 recorded in the backup catalog for ``key``, or None."""
+    try:
+        body = s3.get_object(Bucket=bucket, Key=CATALOG_KEY)["Body"].read()
+    except Exception as e:
+        log(f"backup catalog unavailable: {e}")
+        return None
+    for line in body.decode("utf-8").splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get("key") == key:
+            return entry.get("sha256") or None
+    return None
+
+
+def extract(tar, directory):
+    if hasattr(tarfile, "data_filter"):
+        # パス外への書き込みや特殊ファイルを弾く(Python 3.10.12以降)
+        tar.extractall(directory, filter="data")
+    else:
+        tar.extractall(directory)
+
+
+def swap_in(staging, directory):
+    """Move every top-level entry of ``staging`` over ``directory``."""
+    for name in sorted(os.listdir(staging)):
+        target = os.path.join(directory, name)
+        old = None
+        if os.path.lexists(target):
+            old = os.path.join(staging, f".old-{name}")
+            os.rename(target, old)
+        os.rename(os.path.join(staging, name), target)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _staged_path(staging, path):
+    """``path`` from a manifest under ``staging``, refusing to leave it."""
+    target = os.path.normpath(os.path.join(staging, path))
+    if os.path.isabs(path) or not target.startswith(staging + os.sep):
+        raise ValueError(f"unsafe path in manifest: {path}")
+    return target
+
+
+class _Handles:
+    """A bounded set of files open for writing at arbitrary offsets."""
+
+    def __init__(self, limit=256):
+        self.limit = limit
+        self.files = {}
+
+    def write(self, path, offset, *data):
+        f = self.files.get(path)
+        if f is None:
+            if len(self.files) >= self.limit:
+                self.files.pop(next(iter(self.files))).close()
+            f = self.files[path] = open(path, "r+b")
+        f.seek(offset)
+        for part in data:
+            f.write(part)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+def restore_manifest(s3, args, key, expected, staging):
+    """Rebuild the worlds of the manifest at ``key`` under ``staging``.
+
+    Every file is first created at its final size (region files with
+    their header, chunks laid out back to back), then the blobs are
+    fetched from the packs as ranged GETs, coalesced across small gaps,
+    checked against their sha256 and written into place. Returns the
+    number of bytes downloaded.
+    """
+    manifest, actual = load_manifest(s3, args.bucket, key)
+    if expected is not None and actual != expected:
+        raise ValueError(f"sha256 mismatch for {key}: {actual} != {expected}")
+    blobs = manifest["blobs"]
+    # blob番号 -> [(書き込み先, offset, region内のチャンクか)]
+    placements = {}
+    for directory in manifest["dirs"]:
+        os.makedirs(_staged_path(staging, directory), exist_ok=True)
+    for entry in manifest["files"]:
+        path = _staged_path(staging, entry["path"])
+        with open(path, "wb") as f:
+            if "blob" in entry:
+                f.truncate(blobs[entry["blob"]][3])
+                placements.setdefault(entry["blob"], []).append(
+                    (path, 0, False)
+                )
+            elif entry["chunks"] or entry["size"]:
+                header, offsets, size = region_layout(
+                    (slot, timestamp, blobs[index][3])
+                    for slot, timestamp, index in entry["chunks"]
+                )
+                f.write(header)
+                f.truncate(size)
+                for (_, _, index), offset in zip(entry["chunks"], offsets):
+                    placements.setdefault(index, []).append(
+                        (path, offset, True)
+                    )
+
+    chunk_size = args.chunk_size * MiB
+    ranges = []
+    by_pack = {}
+    for index in placements:
+        _, pack, offset, length = blobs[index]
+        by_pack.setdefault(pack, []).append((offset, length, index))
+    for pack, items in sorted(by_pack.items()):
+        current = None
+        for offset, length, index in sorted(items):
+            if (
+                current is not None
+                and offset - current[2] <= RANGE_GAP
+                and offset + length - current[1] <= chunk_size
+            ):
+                current[2] = max(current[2], offset + length)
+                current[3].append((offset, length, index))
+            else:
+                current = [pack, offset, offset + length, []]
+                current[3].append((offset, length, index))
+                ranges.append(current)
+
+    def fetch(pack, first, end):
+        body = s3.get_object(
+            Bucket=args.bucket,
+            Key=manifest["packs"][pack],
+            Range=f"bytes={first}-{end - 1}",
+        )["Body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        if len(data) != end - first:
+            raise IOError(f"short read of {manifest['packs'][pack]}")
+        return data
+
+    handles = _Handles()
+    fetched = 0
+
+    def place(first, items, data):
+        for offset, length, index in items:
+            blob = data[offset - first : offset - first + length]
+            if hashlib.sha256(blob).hexdigest() != blobs[index][0]:
+                raise ValueError(f"sha256 mismatch for blob {blobs[index][0]}")
+            for path, at, framed in placements[index]:
+                if framed:
+                    handles.write(path, at, struct.pack(">I", length), blob)
+                else:
+                    handles.write(path, at, blob)
+
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    window = deque()
+    try:
+        for pack, first, end, items in ranges:
+            window.append(
+                (first, items, executor.submit(fetch, pack, first, end))
+            )
+            if len(window) >= args.concurrency:
+                first, items, future = window.popleft()
+                data = future.result()
+                fetched += len(data)
+                place(first, items, data)
+        while window:
+            first, items, future = window.popleft()
+            data = future.result()
+            fetched += len(data)
+            place(first, items, data)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        handles.close()
+    for entry in manifest["files"]:
+        path = _staged_path(staging, entry["path"])
+        os.chmod(path, entry["mode"])
+        os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    return fetched
+
+
+def restore_archive(s3, args, key, size, expected, staging):
+    """Extract the tar.gz at ``key`` under ``staging`` while it downloads.
+
+    Returns the number of bytes downloaded.
+    """
+    reader = OrderedRangeReader(
+        s3,
+        args.bucket,
+        key,
+        size,
+        args.chunk_size * MiB,
+        args.concurrency,
+        hashlib.sha256(),
+    )
+    try:
+        with tarfile.open(fileobj=GunzipStream(reader), mode="r|") as tar:
+            extract(tar, staging)
+        # tarの終端より後ろ(gzipのパディングなど)もハッシュに含める
+        while reader.read(MiB):
+            pass
+    finally:
+        reader.close()
+    actual = reader.digest.hexdigest()
+    if expected is not None and actual != expected:
+        raise ValueError(f"sha256 mismatch for {key}: {actual} != {expected}")
+    return reader.bytes_read
+
+
+def restore(args):
+    import boto3
+
+    s3 = boto3.client("s3")
+    key = find_backup_key(s3, args.bucket, args.prefix, args.timestamp)
+    if key is None:
+        sys.exit(
+            f"no backup under s3://{args.bucket}/{args.prefix}/"
+            + (f" matching {args.timestamp}" if args.timestamp else "")
+        )
+    head = s3.head_object(Bucket=args.bucket, Key=key)
+    expected = catalog_sha256(s3, args.bucket, key)
+
+    start = time.perf_counter()
+    # 展開先は同じファイルシステム上に作り、検証が済んでからrenameで差し替える
+    staging = tempfile.mkdtemp(prefix=".restore-", dir=args.directory)
+    try:
+        if MANIFEST_NAME.search(key):
+            fetched = restore_manifest(s3, args, key, expected, staging)
+        else:
+            fetched = restore_archive(
+                s3, args, key, head["ContentLength"], expected, staging
+            )
+        swap_in(staging, args.directory)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    elapsed = time.perf_counter() - start
+    log(
+        f"restored {key}: {fetched / MiB:.1f} MB in {elapsed:.1f}s "
+        f"({fetched / MiB / elapsed:.1f} MB/s), "
+        f"sha256 {'verified' if expected else 'not in catalog'}"
+    )
+    print(
+        json.dumps(
+            {
+                "key": key,
+                "last_modified": head["LastModified"]
+                .astimezone()
+                .strftime("%Y-%m-%d %H:%M:%S"),
+                "sha256_verified": expected is not None,
+            },
+            ensure_ascii=False,
+        )
+    )
+
+
+def region_chunks(data):
+    """``(slot, timestamp, payload)`` for each chunk of an Anvil region
+    file, or None when the header does not describe the bytes (a file
+    caught mid-write, or not a region file at all).
+
+    The payload is what follows the chunk's length field: the compression
+    type byte and the compressed NBT. Chunks stored in an external .mcc
+    file keep only their type byte here; the .mcc file is backed up as an
+    ordinary file.
+    """
+    if not data:
+        return []
+    if len(data) < REGION_HEADER_SIZE:
+        return None
+    locations = struct.unpack_from(">1024I", data, 0)
+    timestamps = struct.unpack_from(">1024I", data, SECTOR_SIZE)
+    chunks = []
+    for slot, location in enumerate(locations):
+        if not location:
+            continue
+        start = (location >> 8) * SECTOR_SIZE
+        if start < REGION_HEADER_SIZE or start + 5 > len(data):
+            return None
+        (length,) = struct.unpack_from(">I", data, start)
+        end = start + 4 + length
+        if length < 1 or end > len(data):
+            return None
+        chunks.append((slot, timestamps[slot], data[start + 4 : end]))
+    return chunks
+
+
+def region_layout(chunks):
+    """Header, chunk offsets and file size for ``(slot, timestamp, length)``
+    chunks laid out back to back from sector 2 in the given order."""
+    locations = [0] * 1024
+    timestamps = [0] * 1024
+    offsets = []
+    sector = REGION_HEADER_SIZE // SECTOR_SIZE
+    for slot, timestamp, length in chunks:
+        sectors = -(-(4 + length) // SECTOR_SIZE)
+        locations[slot] = sector << 8 | sectors
+        timestamps[slot] = timestamp
+        offsets.append(sector * SECTOR_SIZE)
+        sector += sectors
+    header = struct.pack(">1024I", *locations) + struct.pack(
+        ">1024I", *timestamps
+    )
+    return header, offsets, sector * SECTOR_SIZE
+
+
+class PackStore:
+    """Content-addressed blob store in S3 for ``snapshot``.
+
+    Blobs are identified by their sha256. Blobs the previous manifest
+    already points at are referenced where they are; new ones are
+    appended to pack objects of about PACK_SIZE, named after the sha256
+    of their contents and uploaded on a thread pool, so a backup costs a
+    handful of PUTs instead of one per chunk.
+    """
+
+    def __init__(self, s3, bucket, concurrency, previous=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.uploads = []
+        # マニフェストに書き出す表: packのキーと [sha256, pack番号, offset, length]
+        self.packs = []
+        self.blobs = []
+        self.pack_index = {}
+        self.blob_index = {}
+        self.known = {}
+        if previous is not None:
+            for sha, pack, offset, length in previous["blobs"]:
+                self.known[sha] = (previous["packs"][pack], offset, length)
+        self.buffer = bytearray()
+        self.unsealed = []
+        self.new_blobs = 0
+        self.uploaded = 0
+
+    def _pack(self, key):
+        if key not in self.pack_index:
+            self.pack_index[key] = len(self.packs)
+            self.packs.append(key)
+        return self.pack_index[key]
+
+    def ref(self, sha):
+        """Index of an already stored blob, or None if it is new."""
+        index = self.blob_index.get(sha)
+        if index is None and sha in self.known:
+            key, offset, length = self.known[sha]
+            index = len(self.blobs)
+            self.blob_index[sha] = index
+            self.blobs.append([sha, self._pack(key), offset, length])
+        return index
+
+    def add(self, data):
+        sha = hashlib.sha256(data).hexdigest()
+        index = self.ref(sha)
+        if index is not None:
+            return index
+        index = len(self.blobs)
+        self.blob_index[sha] = index
+        # packのキーは中身が揃うまで決まらないので、閉じるときに埋める
+        self.blobs.append([sha, None, len(self.buffer), len(data)])
+        self.unsealed.append(index)
+        self.buffer += data
+        self.new_blobs += 1
+        if len(self.buffer) >= PACK_SIZE:
+            self._seal()
+        return index
+
+    def _seal(self):
+        body = bytes(self.buffer)
+        self.buffer = bytearray()
+        key = f"{CHUNK_STORE}{hashlib.sha256(body).hexdigest()}.pack"
+        pack = self._pack(key)
+        for index in self.unsealed:
+            self.blobs[index][1] = pack
+        self.unsealed = []
+        self.uploaded += len(body)
+        self.slots.acquire()
+        future = self.executor.submit(
+            self.s3.put_object,
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType="application/octet-stream",
+        )
+        future.add_done_callback(lambda _: self.slots.release())
+        self.uploads.append(future)
+
+    def close(self):
+        if self.buffer:
+            self._seal()
+        for future in self.uploads:
+            future.result()
+        self.executor.shutdown()
+
+    def abort(self):
+        # 上げ終わったpackは参照されないだけで害はない
+        self.executor.shutdown(cancel_futures=True)
+
+
+def snapshot_file(store, source, arcname, previous):
+    """Manifest entry for one file, reusing the previous backup's entry
+    when size and mtime are unchanged (the file is not even read)."""
+    st = os.stat(source)
+    old = previous.files.get(arcname)
+    if (
+        old is not None
+        and old["size"] == st.st_size
+        and old["mtime_ns"] == st.st_mtime_ns
+    ):
+        entry = dict(old)
+        if "chunks" in old:
+            entry["chunks"] = [
+                [slot, timestamp, store.ref(previous.blobs[index][0])]
+                for slot, timestamp, index in old["chunks"]
+            ]
+        else:
+            entry["blob"] = store.ref(previous.blobs[old["blob"]][0])
+        return entry, False
+    with open(source, "rb") as f:
+        data = f.read()
+    entry = {
+        "path": arcname,
+        "mode": st.st_mode & 0o7777,
+        "mtime_ns": st.st_mtime_ns,
+        "size": len(data),
+    }
+    chunks = region_chunks(data) if source.endswith(".mca") else None
+    if chunks is None:
+        entry["blob"] = store.add(data)
+    else:
+        entry["chunks"] = [
+            [slot, timestamp, store.add(payload)]
+            for slot, timestamp, payload in chunks
+        ]
+    return entry, True
+
+
+class PreviousManifest:
+    __slots__ = ("files", "blobs")
+
+    def __init__(self, manifest=None):
+        manifest = manifest or {"files": [], "blobs": []}
+        self.files = {entry["path"]: entry for entry in manifest["files"]}
+        self.blobs = manifest["blobs"]
+
+
+def snapshot_tree(store, manifest, root, name, previous):
+    """Add ``root/name`` to ``manifest`` like add_tree does to a tar.
+
+    Returns (files, files read), or None when ``name`` does not exist.
+    """
+    path = os.path.join(root, name)
+    if not os.path.lexists(path):
+        log(f"skip missing {path}")
+        return None
+    files = read = 0
+    for directory, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        manifest["dirs"].append(os.path.relpath(directory, root))
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            if not os.path.isfile(source) or os.path.islink(source):
+                continue
+            arcname = os.path.relpath(source, root)
+            try:
+                entry, changed = snapshot_file(
+                    store, source, arcname, previous
+                )
+            except FileNotFoundError:
+                # 走査中に消えたファイル(セーブ中の一時ファイルなど)は飛ばす
+                continue
+            manifest["files"].append(entry)
+            files += 1
+            read += changed
+    return files, read
+
+
+def load_manifest(s3, bucket, key):
+    """(manifest, sha256 of the stored object)."""
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    manifest = json.loads(gzip.decompress(body))
+    if manifest.get("format") != MANIFEST_FORMAT:
+        raise ValueError(f"unsupported manifest format in {key}")
+    return manifest, hashlib.sha256(body).hexdigest()
+
+
+def snapshot(args):
+    import boto3
+
+    s3 = boto3.client("s3")
+    start = time.perf_counter()
+    previous_key = find_backup_key(
+        s3, args.bucket, args.prefix, pattern=MANIFEST_NAME
+    )
+    previous = None
+    if previous_key is not None:
+        try:
+            previous, _ = load_manifest(s3, args.bucket, previous_key)
+            log(f"incremental from {previous_key}")
+        except Exception as e:
+            log(f"ignoring previous manifest {previous_key}: {e}")
+    store = PackStore(s3, args.bucket, args.upload_concurrency, previous)
+    previous = PreviousManifest(previous)
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "timestamp": BACKUP_NAME.search(args.key).group(1),
+        "worlds": [],
+        "dirs": [],
+        "files": [],
+    }
+    files = read = 0
+    try:
+        for world in args.worlds:
+            added = snapshot_tree(
+                store, manifest, args.directory, world, previous
+            )
+            if added is not None:
+                files += added[0]
+                read += added[1]
+                manifest["worlds"].append(world)
+        store.close()
+    except BaseException:
+        store.abort()
+        raise
+    manifest["packs"] = store.packs
+    manifest["blobs"] = store.blobs
+    body = gzip.compress(
+        json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+    )
+    s3.put_object(
+        Bucket=args.bucket,
+        Key=args.key,
+        Body=body,
+        ContentType="application/gzip",
+    )
+    world_size = sum(entry["size"] for entry in manifest["files"])
+    elapsed = time.perf_counter() - start
+    log(
+        f"{files} files ({read} read), {world_size / MiB:.1f} MB, "
+        f"{len(store.blobs)} blobs ({store.new_blobs} new) -> "
+        f"{store.uploaded / MiB:.1f} MB in {len(store.uploads)} packs + "
+        f"{len(body) / MiB:.2f} MB manifest in {elapsed:.1f}s"
+    )
+    print(
+        catalog_line(
+            args.key,
+            store.uploaded + len(body),
+            hashlib.sha256(body).hexdigest(),
+            manifest["worlds"],
+            format="chunks",
+            world_size=world_size,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    create_parser = commands.add_parser("create", help="upload a backup")
+    create_parser.add_argument("--bucket")
+    create_parser.add_argument("--key", required=True)
+    create_parser.add_argument("-C", dest="directory", default="/data")
+    create_parser.add_argument("--file", help="write locally, not to S3")
+    create_parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1
+    )
+    create_parser.add_argument("--level", type=int, default=COMPRESS_LEVEL)
+    create_parser.add_argument(
+        "--part-size", type=int, default=PART_SIZE // MiB, help="MiB"
+    )
+    create_parser.add_argument(
+        "--upload-concurrency", type=int, default=UPLOAD_CONCURRENCY
+    )
+    create_parser.add_argument("worlds", nargs="+")
+    snapshot_parser = commands.add_parser(
+        "snapshot", help="upload an incremental backup"
+    )
+    snapshot_parser.add_argument("--bucket", required=True)
+    snapshot_parser.add_argument("--prefix", required=True)
+    snapshot_parser.add_argument("--key", required=True)
+    snapshot_parser.add_argument("-C", dest="directory", default="/data")
+    snapshot_parser.add_argument(
+        "--upload-concurrency", type=int, default=UPLOAD_CONCURRENCY
+    )
+    snapshot_parser.add_argument("worlds", nargs="+")
+    restore_parser = commands.add_parser("restore", help="restore a backup")
+    restore_parser.add_argument("--bucket", required=True)
+    restore_parser.add_argument("--prefix", required=True)
+    restore_parser.add_argument(
+        "--timestamp", help="YYYYmmdd[HHMMSS], default: newest"
+    )
+    restore_parser.add_argument("-C", dest="directory", default="/data")
+    restore_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DOWNLOAD_CHUNK_SIZE // MiB,
+        help="MiB",
+    )
+    restore_parser.add_argument(
+        "--concurrency", type=int, default=DOWNLOAD_CONCURRENCY
+    )
+    args = parser.parse_args()
+    if args.command == "create":
+        if not args.file and not args.bucket:
+            parser.error("--bucket is required unless --file is given")
+        if args.part_size < 5:
+            parser.error("--part-size must be at least 5 (S3 minimum)")
+        create(args)
+    elif args.command == "snapshot":
+        if not MANIFEST_NAME.search(args.key):
+            parser.error(
+                "--key must end in minecraft-<timestamp>.manifest.json.gz"
+            )
+        snapshot(args)
+    elif args.command == "restore":
+        restore(args)
+
+
+if __name__ == "__main__":
+    main()
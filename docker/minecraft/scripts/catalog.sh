@@ -0,0 +1,44 @@
+#!/bin/bash
+
+# バックアップカタログ s3://${S3_BUCKET}/catalog/backups.jsonl の更新
+# 1行に1バックアップ {"key", "size", "timestamp", "sha256", "worlds"} を記録し、
+# slash commandの list/show はこのオブジェクト1つを読むだけで答える
+# (S3_BUCKET が設定されていること)
+
+CATALOG_KEY="catalog/backups.jsonl"
+
+# catalog_append <カタログの1行(JSON)>
+# 行は backup_tool.py create/snapshot がアップロードしながら計算したサイズとsha256から作って標準出力に出す
+# (snapshotの差分バックアップは format: "chunks" と展開後のサイズ world_size も持つ)
+catalog_append() {
+    local line="$1"
+    local etag tmp attempt
+    if [[ -z "$line" ]]; then
+        echo "Error: catalog line is empty"
+        return 1
+    fi
+
+    # S3には追記がないので読んで1行足して書き戻す。他の書き込みと競合したら読み直してやり直す
+    tmp=$(mktemp)
+    for attempt in 1 2 3; do
+        if etag=$(aws s3api get-object --bucket ${S3_BUCKET} --key ${CATALOG_KEY} "$tmp" --query ETag --output text 2>/dev/null); then
+            echo "$line" >> "$tmp"
+            if aws s3api put-object --bucket ${S3_BUCKET} --key ${CATALOG_KEY} --body "$tmp" \
+                --content-type application/x-ndjson --if-match "$etag" > /dev/null; then
+                rm -f "$tmp"
+                return 0
+            fi
+        else
+            echo "$line" > "$tmp"
+            if aws s3api put-object --bucket ${S3_BUCKET} --key ${CATALOG_KEY} --body "$tmp" \
+                --content-type application/x-ndjson --if-none-match '*' > /dev/null; then
+                rm -f "$tmp"
+                return 0
+            fi
+        fi
+        sleep "$attempt"
+    done
+    rm -f "$tmp"
+    echo "Error: failed to append ${line} to the backup catalog (run /mc catalog rebuild)"
+    return 1
+}
@@ -9,6 +9,8 @@ S3_BUCKET=$S3_BUCKET_NAME
 S3_PREFIX=$S3_PREFIX_NAME
 WEBHOOK_URL="https://hooks.slack.com/services/${WEBHOOK_PATH}"
 
+source "$(dirname "$0")/catalog.sh"
+
 # slack notification
 slack_notify() {
     echo "Push container information to slack channel"
@@ -27,13 +29,22 @@ cleanup() {
     BACKUP_DATE_TIME=$(date +"%Y%m%d%H%M%S")
     PARTITION_DATE=$(date +"%Y")-$(date +"%m")-$(date +"%d")
     echo "Container is terminating. Uploading data to S3..."
-    if [ ! -d backup/${PARTITION_DATE} ]; then
-        mkdir -p backup/${PARTITION_DATE}
+    # 既定(tar)は全体のtar.gz、BACKUP_FORMAT=chunks なら前回から変わったチャンクだけを送る差分バックアップ
+    if [[ "${BACKUP_FORMAT:-tar}" != "chunks" ]]; then
+        FILE_NAME='minecraft-'${BACKUP_DATE_TIME}'.tar.gz'
+        BACKUP_COMMAND="create"
+    else
+        FILE_NAME='minecraft-'${BACKUP_DATE_TIME}'.manifest.json.gz'
+        BACKUP_COMMAND="snapshot --prefix ${S3_PREFIX}"
+    fi
+    BACKUP_KEY=${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}
+    # ローカルにtarを作らず、並列にgzip圧縮しながらS3へマルチパートアップロードする
+    if CATALOG_LINE=$(python3 "$(dirname "$0")/backup_tool.py" ${BACKUP_COMMAND} --bucket ${S3_BUCKET} --key ${BACKUP_KEY} -C /data world world_nether world_the_end); then
+        slack_notify ":creeper:バックアップを作成しました！！\n\nバックアップファイル名: *${S3_BUCKET}/${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}* \n\n*削除*したい場合は、以下のリンクから削除を行ってください。\n\nhttps://s3.console.aws.amazon.com/s3/object/${S3_BUCKET}?region=ap-northeast-1&prefix=${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}"
+        catalog_append "$CATALOG_LINE"
+    else
+        slack_notify ":warning:バックアップのアップロードに失敗しました。\n\nバックアップファイル名: *${S3_BUCKET}/${BACKUP_KEY}*"
     fi
-    FILE_NAME='minecraft-'${BACKUP_DATE_TIME}'.tar.gz'
-    tar -zcvf backup/${PARTITION_DATE}/${FILE_NAME} -C /data world/ world_nether/ world_the_end/
-    slack_notify ":creeper:バックアップを作成しました！！\n\nバックアップファイル名: *${S3_BUCKET}/${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}* \n\n*削除*したい場合は、以下のリンクから削除を行ってください。\n\nhttps://s3.console.aws.amazon.com/s3/object/${S3_BUCKET}?region=ap-northeast-1&prefix=${S3_PREFIX}/${PARTITION_DATE}/${FILE_NAME}"
-    aws s3 cp backup/${PARTITION_DATE}/${FILE_NAME} s3://${S3_BUCKET}/${S3_PREFIX}/${PARTITION_DATE}/
 
     # ラッパースクリプトで先にSIGTERMをハンドリングする
     kill -TERM "$child" 2>/dev/null
@@ -41,14 +52,14 @@ cleanup() {
 
 # function executed when container is started
 echo "Container is starting. Downloading data from S3..."
-TARGET_BACKUP=$(aws s3 ls --recursive s3://${S3_BUCKET}/${S3_PREFIX}/ | grep "$RESTORE_DATE_TIME" | awk '{print $4}')
-LAST_MODIFIED=$(aws s3api head-object --bucket ${S3_BUCKET} --key ${TARGET_BACKUP} | jq -r .LastModified | xargs -I {} date -d "{}" "+%Y-%m-%d %H:%M:%S")
-
-# donwload s3 and unzip it to /data/world/
-aws s3 cp s3://${S3_BUCKET}/${TARGET_BACKUP} /data/world/
-find /data/world/ -name "*.tar.gz" -exec tar -xzvf {} -C /data \;
-rm -rf /data/world/*.tar.gz
-slack_notify ":creeper:バックアップをリストアしました！！\n\nバックアップファイルの作成日時: *${LAST_MODIFIED}*\nバックアップファイルPATH: *${S3_BUCKET}/${TARGET_BACKUP}*"
+# 日時(前方一致)からパーティション(YYYY-MM-DD/)が決まるので、その配下だけを列挙する
+if RESTORED=$(python3 "$(dirname "$0")/backup_tool.py" restore --bucket ${S3_BUCKET} --prefix ${S3_PREFIX} --timestamp "$RESTORE_DATE_TIME" -C /data); then
+    TARGET_BACKUP=$(echo "$RESTORED" | jq -r .key)
+    LAST_MODIFIED=$(echo "$RESTORED" | jq -r .last_modified)
+    slack_notify ":creeper:バックアップをリストアしました！！\n\nバックアップファイルの作成日時: *${LAST_MODIFIED}*\nバックアップファイルPATH: *${S3_BUCKET}/${TARGET_BACKUP}*"
+else
+    slack_notify ":warning:バックアップ(${RESTORE_DATE_TIME})のリストアに失敗しました。既存のデータのままサーバーを起動します。"
+fi
 
 
 # trap SIGTERM signal and call cleanup
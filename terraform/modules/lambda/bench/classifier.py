@@ -0,0 +1,90 @@
+"""Throughput of the combined classifier regex on a Paper server log.
+
+Lines are split like fluent-bit's single_line parser does, then classified
+with the combined pattern and, for comparison, with every pattern tried
+one by one.
+
+    python bench/classifier.py --repeat 2000
+    python bench/classifier.py --log /path/to/latest.log --show
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, "..", "fixtures", "python3.13"))
+
+import classifier  # noqa: E402
+
+# docker/fluentbit/parsers_custom.conf の single_line と同じ形式
+SINGLE_LINE = re.compile(
+    r"^\[(?P<log_time>\d{2}:\d{2}:\d{2}) (?P<level>[A-Z]*)\]: (?P<log>.*)$"
+)
+
+
+def load_messages(path):
+    messages = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = SINGLE_LINE.match(line.rstrip("\n"))
+            if match:
+                messages.append(match.group("log"))
+    return messages
+
+
+def sequential_classifier():
+    compiled = [
+        (event_type, re.compile(f"^(?:{pattern})$"))
+        for event_type, pattern in classifier.EVENT_PATTERNS
+    ]
+
+    def classify(line):
+        for event_type, pattern in compiled:
+            match = pattern.match(line)
+            if match:
+                return classifier.Event(event_type, match.groupdict())
+        return classifier.Event(classifier.OTHER, {})
+
+    return classify
+
+
+def measure(classify, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            classify(message)
+    elapsed = time.perf_counter() - start
+    return len(messages) * repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--log", default=os.path.join(HERE, "corpus", "paper-latest.log")
+    )
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--show", action="store_true")
+    args = parser.parse_args()
+
+    messages = load_messages(args.log)
+    counts = Counter(classifier.classify(m).type for m in messages)
+    print(f"{len(messages)} lines: {dict(counts.most_common())}")
+    if args.show:
+        for message in messages:
+            event = classifier.classify(message)
+            print(f"{event.type:16s} {event.fields} | {message}")
+
+    for name, classify in (
+        ("combined", classifier.classify),
+        ("sequential", sequential_classifier()),
+    ):
+        rate = measure(classify, messages, args.repeat)
+        print(f"{name:10s} {rate:,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Synthetic CloudWatch Logs subscription events for the log notifier.
+
+Records look like what fluent-bit ships from the minecraft container
+(docker/fluentbit): the Paper log message split into log_time/level/log,
+plus the container and tag fields. Messages are drawn from the sample
+corpus with their numbers perturbed so repeated lines are not identical.
+"""
+
+import base64
+import gzip
+import json
+import os
+import random
+import re
+import time
+
+HERE = os.path.dirname(__file__)
+CORPUS = os.path.join(HERE, "corpus", "paper-latest.log")
+SINGLE_LINE = re.compile(
+    r"^\[(?P<log_time>\d{2}:\d{2}:\d{2}) (?P<level>[A-Z]*)\]: (?P<log>.*)$"
+)
+NUMBER = re.compile(r"\d+")
+
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding="utf-8") as f:
+        return [
+            match.groupdict()
+            for match in map(SINGLE_LINE.match, f.read().splitlines())
+            if match
+        ]
+
+
+def fluent_bit_record(entry, rng, now):
+    log = NUMBER.sub(
+        lambda m: str(rng.randint(0, 10 ** len(m.group()))), entry["log"]
+    )
+    return {
+        "log_time": entry["log_time"],
+        "level": entry["level"],
+        "log": log,
+        "container_name": "minecraft",
+        "source": "stdout",
+        "tag": f"{entry['level'].lower()}-log",
+        "jst_time": time.strftime(
+            "%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime(now)
+        ),
+    }
+
+
+def make_payload(count, seed=0, corpus=None, now=None):
+    """Return the decoded subscription payload dict with ``count`` events."""
+    rng = random.Random(seed)
+    corpus = corpus or load_corpus()
+    now = time.time() if now is None else now
+    events = []
+    for i in range(count):
+        record = fluent_bit_record(rng.choice(corpus), rng, now)
+        events.append(
+            {
+                "id": f"{i:056d}",
+                "timestamp": int(now * 1000) + i,
+                "message": json.dumps(record, ensure_ascii=False),
+            }
+        )
+    return {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": "/aws/ecs/minecraft-firelens-logs",
+        "logStream": "minecraft-firelens-0123456789abcdef",
+        "subscriptionFilters": ["user-action-subscription-1"],
+        "logEvents": events,
+    }
+
+
+def encode_event(payload):
+    """Wrap a payload the way CloudWatch Logs invokes the function."""
+    data = gzip.compress(
+        json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    )
+    return {"awslogs": {"data": base64.b64encode(data).decode("ascii")}}
+
+
+def make_event(count, seed=0, corpus=None):
+    return encode_event(make_payload(count, seed, corpus))
+
+
+class LambdaContext:
+    """Enough of the Lambda context object for the notifier handler."""
+
+    invoked_function_arn = (
+        "arn:aws:lambda:ap-northeast-1:123456789012:function:"
+        "user-action-filter-function"
+    )
+    log_group_name = "/aws/lambda/user-action-filter-function"
+    log_stream_name = "2024/06/24/[$LATEST]0123456789abcdef"
+
+    def __init__(self, timeout_ms=360000):
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
@@ -0,0 +1,180 @@
+"""Benchmark lambda_handler of the log notifier across batch sizes.
+
+Each batch size runs in its own interpreter so peak RSS is per size. The
+handler talks to an in-process SNS stand-in and a local Slack webhook
+stand-in; results (throughput, p50/p99 latency, peak RSS, outbound calls)
+are written as JSON so runs from different commits can be compared.
+
+    python bench/run.py                       # 1..10000 events
+    python bench/run.py --sizes 100 1000 --iterations 20
+    python bench/run.py --compare results/abc1234.json results/def5678.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "..", "fixtures", "python3.13")
+SHARED = os.path.join(HERE, "..", "..", "shared", "python3.13")
+DEFAULT_SIZES = (1, 10, 100, 1000, 10000)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_size(size, iterations, sns_rtt_ms, slack_rtt_ms):
+    """Run in a worker process; returns the result dict for one size."""
+    sys.path[:0] = [FIXTURES, SHARED]
+    from payloads import LambdaContext, make_event
+    from standins import LocalSlackWebhook, LocalSns
+
+    os.environ.setdefault("SNS_TOPIC_ARN", "arn:aws:sns:local:0:bench")
+    os.environ.setdefault("ALARM_SUBJECT", "bench")
+
+    with LocalSlackWebhook(slack_rtt_ms) as slack_standin:
+        os.environ["WEB_HOOK_URL"] = slack_standin.url
+        import aggregate
+        import clients
+        import index
+
+        sns_standin = LocalSns(sns_rtt_ms)
+        clients.register("sns", sns_standin)
+        event = make_event(size)
+        samples = []
+        sink = io.StringIO()
+        for _ in range(iterations):
+            # 毎回同じ条件で測るため、コンテナ跨ぎの抑制キャッシュは空にする
+            aggregate._suppression.clear()
+            start = time.perf_counter()
+            with redirect_stdout(sink):
+                index.lambda_handler(event, LambdaContext())
+            samples.append(time.perf_counter() - start)
+            sink.seek(0)
+            sink.truncate()
+
+    total = sum(samples)
+    return {
+        "events": size,
+        "iterations": iterations,
+        "throughput_eps": round(size * iterations / total, 1),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "sns_calls": sns_standin.calls / iterations,
+        "sns_delivered": sns_standin.delivered / iterations,
+        "slack_posts": slack_standin.posts / iterations,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_all(args):
+    results = []
+    for size in args.sizes:
+        iterations = args.iterations or max(3, min(200, 20000 // size))
+        output = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--worker",
+                str(size),
+                "--iterations",
+                str(iterations),
+                "--sns-rtt-ms",
+                str(args.sns_rtt_ms),
+                "--slack-rtt-ms",
+                str(args.slack_rtt_ms),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        results.append(result)
+        print(
+            f"{size:6d} events  {result['throughput_eps']:>10,.0f} ev/s  "
+            f"p50 {result['p50_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+            f"rss {result['peak_rss_mb']:>6.1f}MB  "
+            f"sns {result['sns_calls']:.0f}  slack {result['slack_posts']:.0f}"
+        )
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "python": platform.python_version(),
+        "sns_rtt_ms": args.sns_rtt_ms,
+        "slack_rtt_ms": args.slack_rtt_ms,
+        "results": results,
+    }
+    path = args.output or os.path.join(HERE, "results", f"{revision}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {path}")
+
+
+def compare(base_path, head_path):
+    with open(base_path) as f:
+        base = {r["events"]: r for r in json.load(f)["results"]}
+    with open(head_path) as f:
+        head = json.load(f)["results"]
+    for result in head:
+        before = base.get(result["events"])
+        if before is None:
+            continue
+        changes = "  ".join(
+            f"{key} {before[key]}->{result[key]} "
+            f"({(result[key] - before[key]) / before[key] * 100:+.1f}%)"
+            for key in ("throughput_eps", "p99_ms", "peak_rss_mb")
+            if before[key]
+        )
+        print(f"{result['events']:6d} events  {changes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--iterations", type=int, default=0)
+    parser.add_argument("--sns-rtt-ms", type=float, default=0.0)
+    parser.add_argument("--slack-rtt-ms", type=float, default=0.0)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"))
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.worker:
+        result = run_size(
+            args.worker, args.iterations, args.sns_rtt_ms, args.slack_rtt_ms
+        )
+        print(json.dumps(result))
+    else:
+        run_all(args)
+
+
+if __name__ == "__main__":
+    main()
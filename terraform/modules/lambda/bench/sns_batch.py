@@ -0,0 +1,95 @@
+"""Compare per-event SNS publish with the PublishBatch sink.
+
+Runs against an in-process SNS stand-in that sleeps for a fixed round-trip
+time per API call and can fail a fraction of entries, so the numbers show
+how call count (not boto3 itself) drives notifier throughput.
+
+    python bench/sns_batch.py --events 500 --rtt-ms 20 --failure-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "fixtures", "python3.13")
+)
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__), "..", "..", "shared", "python3.13"
+    ),
+)
+
+import sns  # noqa: E402
+from decode import LogRecord  # noqa: E402
+from standins import LocalSns  # noqa: E402
+
+
+def make_records(count):
+    return [
+        LogRecord(
+            str(i),
+            1700000000000 + i,
+            {"log": f"[Server thread/ERROR]: line {i}", "level": "ERROR"},
+            f"[Server thread/ERROR]: line {i}",
+            "ERROR",
+        )
+        for i in range(count)
+    ]
+
+
+def run_per_event(records, client):
+    for record in records:
+        client.publish(
+            TopicArn="arn:aws:sns:local:0:topic",
+            Message=json.dumps({**record.fields, "log_url": "url"}),
+            Subject="bench",
+        )
+
+
+def run_batched(records, client):
+    return sns.publish_records(
+        records, "url", "arn:aws:sns:local:0:topic", "bench", client=client
+    )
+
+
+def client_construction_ms(samples=20):
+    try:
+        import boto3
+    except ImportError:
+        return None
+    start = time.perf_counter()
+    for _ in range(samples):
+        boto3.client("sns", region_name="ap-northeast-1")
+    return (time.perf_counter() - start) * 1000 / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    sns.RETRY_BASE_SECONDS = 0
+    records = make_records(args.events)
+    for name, run in (("publish", run_per_event), ("batch", run_batched)):
+        client = LocalSns(args.rtt_ms, args.failure_rate)
+        start = time.perf_counter()
+        run(records, client)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:8s} events={args.events} calls={client.calls} "
+            f"delivered={client.delivered} elapsed={elapsed:.3f}s "
+            f"throughput={args.events / elapsed:.0f} events/s"
+        )
+    construction = client_construction_ms()
+    if construction is not None:
+        print(f"boto3.client('sns') construction: {construction:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
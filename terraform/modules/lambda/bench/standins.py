@@ -0,0 +1,105 @@
+"""In-process stand-ins for the notifier's outbound services."""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalSns:
+    """Minimal stand-in for the boto3 SNS client.
+
+    Sleeps for a fixed round-trip time per API call and can fail a fraction
+    of batch entries, so call count is what drives the measured cost.
+    """
+
+    def __init__(self, rtt_ms=20.0, failure_rate=0.0, seed=0):
+        self.rtt = rtt_ms / 1000
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.delivered = 0
+
+    def _round_trip(self):
+        with self.lock:
+            self.calls += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def publish(self, TopicArn, Message, Subject=None):
+        self._round_trip()
+        with self.lock:
+            self.delivered += 1
+        return {"MessageId": str(self.calls)}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        self._round_trip()
+        successful, failed = [], []
+        for entry in PublishBatchRequestEntries:
+            if self.random.random() < self.failure_rate:
+                failed.append(
+                    {
+                        "Id": entry["Id"],
+                        "Code": "InternalError",
+                        "SenderFault": False,
+                    }
+                )
+            else:
+                successful.append({"Id": entry["Id"]})
+        with self.lock:
+            self.delivered += len(successful)
+        return {"Successful": successful, "Failed": failed}
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.posts += 1
+            server.blocks += len(json.loads(body).get("blocks", []))
+        if server.rtt:
+            time.sleep(server.rtt)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalSlackWebhook:
+    """Plain-HTTP stand-in for hooks.slack.com served from a thread."""
+
+    def __init__(self, rtt_ms=0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _WebhookHandler)
+        self.server.lock = threading.Lock()
+        self.server.posts = 0
+        self.server.blocks = 0
+        self.server.rtt = rtt_ms / 1000
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/services/T/B/X"
+
+    @property
+    def posts(self):
+        return self.server.posts
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
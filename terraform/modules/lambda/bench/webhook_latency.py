@@ -0,0 +1,141 @@
+"""Per-post latency of urllib.urlopen versus the pooled WebhookClient.
+
+Starts a local HTTPS stand-in for hooks.slack.com with a throwaway
+self-signed certificate (needs the openssl CLI) and posts the same JSON
+payload through both clients.
+
+    python bench/webhook_latency.py --posts 200
+"""
+
+import argparse
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "fixtures", "python3.13")
+)
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__), "..", "..", "shared", "python3.13"
+    ),
+)
+
+from webhook import WebhookClient  # noqa: E402
+
+
+class SlackStandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def make_certificate(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-subj",
+            "/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost,IP:127.0.0.1",
+            "-days",
+            "1",
+            "-keyout",
+            key,
+            "-out",
+            cert,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def start_server(cert, key):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlackStandIn)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(post, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        post()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(name, samples):
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(
+        f"{name:10s} posts={len(samples)} "
+        f"mean={statistics.mean(samples):.2f}ms "
+        f"p50={statistics.median(samples):.2f}ms p99={p99:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=200)
+    args = parser.parse_args()
+
+    payload = {"text": "```[Server thread/ERROR]: bench```"}
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(directory)
+        server = start_server(cert, key)
+        url = f"https://127.0.0.1:{server.server_port}/services/T/B/X"
+        context = ssl.create_default_context(cafile=cert)
+
+        def urlopen_post():
+            r = request.Request(
+                url=url,
+                data=json.dumps(payload).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            with request.urlopen(r, context=context) as response:
+                response.read()
+
+        client = WebhookClient(ssl_context=context)
+        summarize("urlopen", measure(urlopen_post, args.posts))
+        summarize(
+            "pooled",
+            measure(lambda: client.post_json(url, payload), args.posts),
+        )
+        print(f"pooled client stats: {client.stats()}")
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# INFO(チャットなど)は1件ずつ通知し、WARN/ERRORだけを集約する
+AGGREGATE_LEVELS = frozenset(("WARN", "ERROR"))
+SUPPRESS_TTL_SECONDS = float(os.environ.get("SUPPRESS_TTL_SECONDS", "300"))
+SUPPRESS_MAX_TEMPLATES = 1024
+
+_MASKS = (
+    (
+        re.compile(
+            r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b",
+            re.IGNORECASE,
+        ),
+        "<uuid>",
+    ),
+    (re.compile(r"/\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?"), "/<ip>"),
+    (re.compile(r"^<[^>]+>"), "<player>"),
+    (
+        re.compile(
+            r"\b[A-Za-z0-9_]{3,16}(?= (?:joined|left) the game"
+            r"|\[/<ip>\] logged in| lost connection| moved too quickly"
+            r"| moved wrongly)"
+        ),
+        "<player>",
+    ),
+    (
+        re.compile(r"UUID of player [A-Za-z0-9_]{3,16}"),
+        "UUID of player <player>",
+    ),
+    (re.compile(r"-?\d+(?:\.\d+)?"), "#"),
+)
+
+
+def template(message: str) -> str:
+    """Reduce a log line to its shape by masking variable parts."""
+    for pattern, replacement in _MASKS:
+        message = pattern.sub(replacement, message)
+    return message
+
+
+class SuppressionCache:
+    """Templates notified recently, kept across warm invocations.
+
+    A template seen again within the TTL is dropped and counted; the count
+    is carried into the next notification once the TTL has passed. If the
+    template does not come back, ``flush`` hands the first dropped record
+    back with the count once the entry has expired (or been evicted), so
+    the next invocation still reports it.
+    """
+
+    def __init__(
+        self, ttl=SUPPRESS_TTL_SECONDS, max_size=SUPPRESS_MAX_TEMPLATES
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        # 上限で追い出された、抑制件数付きのレコード
+        self.evicted = []
+        self.lock = threading.Lock()
+
+    def admit(self, key, record, now: float) -> int:
+        """Return how many occurrences of ``record`` to report, or 0."""
+        with self.lock:
+            # entry: [期限, 抑制した件数, 抑制した最初のレコード]
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                entry[1] += record.count
+                if entry[2] is None:
+                    entry[2] = record
+                else:
+                    entry[2].last_timestamp = record.last_timestamp
+                return 0
+            suppressed = entry[1] if entry is not None else 0
+            self.entries[key] = [now + self.ttl, 0, None]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                if evicted[1]:
+                    self.evicted.append(_pending(evicted))
+            return record.count + suppressed
+
+    def flush(self, now: float) -> list:
+        """Suppressed records whose entry expired or was evicted, counted."""
+        with self.lock:
+            flushed, self.evicted = self.evicted, []
+            # 追加順 = 期限順なので、期限内のものが出たらそこで止める
+            while self.entries:
+                key, entry = next(iter(self.entries.items()))
+                if entry[0] > now:
+                    break
+                del self.entries[key]
+                if entry[1]:
+                    flushed.append(_pending(entry))
+            return flushed
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.evicted.clear()
+
+
+def _pending(entry):
+    record = entry[2]
+    record.count = entry[1]
+    return record
+
+
+_suppression = SuppressionCache()
+
+
+def collapse(records: list, cache=_suppression, now=None) -> list:
+    """Merge repeated WARN/ERROR lines of a batch into counted records.
+
+    The first record of each (level, template) group is kept in batch order
+    with ``count`` and ``last_timestamp`` updated; other records pass through.
+    Counts suppressed in earlier invocations whose TTL has passed come first.
+    """
+    now = time.time() if now is None else now
+    flushed = cache.flush(now) if cache is not None else []
+    groups = {}
+    output = []
+    for record in records:
+        if record.level not in AGGREGATE_LEVELS:
+            output.append((None, record))
+            continue
+        key = (record.level, template(record.log))
+        first = groups.get(key)
+        if first is None:
+            groups[key] = record
+            output.append((key, record))
+        else:
+            first.count += record.count
+            first.last_timestamp = record.last_timestamp
+    admitted = []
+    for key, record in output:
+        if key is not None and cache is not None:
+            record.count = cache.admit(key, record, now)
+            if not record.count:
+                continue
+        admitted.append(record)
+    return flushed + admitted
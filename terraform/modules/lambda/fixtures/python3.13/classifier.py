@@ -0,0 +1,143 @@
+import re
+
+PLAYER = r"[A-Za-z0-9_]{3,16}"
+NUMBER = r"-?\d+(?:\.\d+)?"
+
+DEATH_CAUSES = (
+    r"was (?:slain|shot|killed|blown up|pummeled|fireballed|impaled|"
+    r"squashed|squished|pricked|poked|stung|skewered|frozen|obliterated|"
+    r"struck by lightning|doomed to fall|roasted|burnt to a crisp)\b.*",
+    r"drowned\b.*",
+    r"burned to death\b.*",
+    r"blew up\b.*",
+    r"fell\b.*",
+    r"hit the ground too hard\b.*",
+    r"tried to swim in lava\b.*",
+    r"went up in flames\b.*",
+    r"walked into (?:fire|a cactus|the danger zone)\b.*",
+    r"suffocated in a wall\b.*",
+    r"starved to death\b.*",
+    r"experienced kinetic energy\b.*",
+    r"withered away\b.*",
+    r"froze to death\b.*",
+    r"went off with a bang\b.*",
+    r"discovered the floor was lava\b.*",
+    r"didn't want to live in the same world as .*",
+    r"left the confines of this world\b.*",
+    r"died\b.*",
+)
+
+# (event type, pattern) in priority order. Group names are local to each
+# pattern and are prefixed with the event type when the patterns are
+# combined, so every event type can use natural field names. A "_alt"
+# suffix lets two alternatives of one pattern fill the same field.
+EVENT_PATTERNS = (
+    ("chat", rf"(?:\[Not Secure\] )?<(?P<player>{PLAYER})> (?P<message>.*)"),
+    ("join", rf"(?P<player>{PLAYER}) joined the game"),
+    ("leave", rf"(?P<player>{PLAYER}) left the game"),
+    (
+        "login",
+        rf"(?P<player>{PLAYER})\[/(?P<address>[^\]]+)\] logged in with "
+        rf"entity id (?P<entity_id>\d+) at \((?:\[(?P<world>[^\]]+)\])?"
+        rf"(?P<x>{NUMBER}), (?P<y>{NUMBER}), (?P<z>{NUMBER})\)",
+    ),
+    (
+        "disconnect",
+        rf"(?P<player>{PLAYER}) lost connection: (?P<reason>.*)",
+    ),
+    (
+        "advancement",
+        rf"(?P<player>{PLAYER}) has (?P<kind>made the advancement|"
+        r"completed the challenge|reached the goal) \[(?P<advancement>.+)\]",
+    ),
+    (
+        "lag",
+        r"Can't keep up! Is the server overloaded\? Running "
+        r"(?P<ms_behind>\d+)ms or (?P<ticks_behind>\d+) ticks behind",
+    ),
+    (
+        "plugin_exception",
+        r"(?:Could not pass event (?P<event>\w+) to "
+        r"(?P<plugin>[\w.-]+) v?(?P<version>\S+)"
+        r"|Error occurred while (?P<phase>enabling|disabling|loading) "
+        r"(?P<plugin_alt>[\w.-]+).*)",
+    ),
+    (
+        "exception",
+        r"(?:Caused by: )?(?P<exception>(?:[a-z_$][\w$]*\.)+"
+        r"[A-Z][\w$]*(?:Exception|Error))(?:: (?P<detail>.*))?",
+    ),
+    (
+        "player_list",
+        r"There are (?P<online>\d+) of a max of (?P<max>\d+) players online"
+        r"(?::\s*(?P<players>.*))?",
+    ),
+    (
+        "tps",
+        r"TPS from last 1m, 5m, 15m: \*?(?P<tps_1m>[\d.]+), "
+        r"\*?(?P<tps_5m>[\d.]+), \*?(?P<tps_15m>[\d.]+)",
+    ),
+    ("death", rf"(?P<player>{PLAYER}) (?P<cause>{'|'.join(DEATH_CAUSES)})"),
+    (
+        "server_ready",
+        r"Done \((?P<startup_seconds>[\d.]+)s\)! For help, type \"help\"",
+    ),
+    ("server_stop", r"Stopping (?:the )?server"),
+)
+
+OTHER = "other"
+# 定期的に出るINFO行。メトリクスにだけ使い、通知はしない
+METRIC_ONLY = frozenset({"tps", "player_list"})
+
+
+class Event:
+    __slots__ = ("type", "fields")
+
+    def __init__(self, type, fields):
+        self.type = type
+        self.fields = fields
+
+    def __repr__(self):
+        return f"Event({self.type!r}, {self.fields!r})"
+
+
+def _prefix_groups(event_type, pattern):
+    return re.sub(r"\(\?P<(\w+)>", rf"(?P<{event_type}__\1>", pattern)
+
+
+def _compile(patterns):
+    alternatives = [
+        f"(?P<{event_type}>{_prefix_groups(event_type, pattern)})"
+        for event_type, pattern in patterns
+    ]
+    combined = re.compile(rf"^(?:{'|'.join(alternatives)})$")
+    # event type -> [(group name, field name)], resolved once at import
+    fields = {event_type: [] for event_type, _ in patterns}
+    for group in combined.groupindex:
+        event_type, sep, field = group.partition("__")
+        if sep:
+            fields[event_type].append((group, field.removesuffix("_alt")))
+    return combined, fields
+
+
+_COMBINED, _FIELDS = _compile(EVENT_PATTERNS)
+
+
+def classify(line: str) -> Event:
+    """Classify one Paper/Spigot log message with a single regex match."""
+    match = _COMBINED.match(line)
+    if match is None:
+        return Event(OTHER, {})
+    event_type = match.lastgroup
+    fields = {}
+    for group, field in _FIELDS[event_type]:
+        value = match.group(group)
+        if value is not None:
+            fields[field] = value
+    return Event(event_type, fields)
+
+
+def classify_records(records: list) -> list:
+    for record in records:
+        record.event = classify(record.log)
+    return records
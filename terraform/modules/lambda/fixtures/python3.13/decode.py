@@ -0,0 +1,106 @@
+import base64
+import json
+import zlib
+
+# CloudWatch Logs delivers at most ~1MB of uncompressed log data per
+# subscription batch. Anything far above that is a corrupt or hostile payload.
+MAX_DECOMPRESSED_BYTES = 8 * 1024 * 1024
+INPUT_CHUNK_BYTES = 64 * 1024
+
+
+class LogRecord:
+    """One CloudWatch log event with its fluent-bit JSON decoded once."""
+
+    __slots__ = (
+        "id",
+        "timestamp",
+        "fields",
+        "log",
+        "level",
+        "count",
+        "last_timestamp",
+        "event",
+    )
+
+    def __init__(self, id, timestamp, fields, log, level):
+        self.id = id
+        self.timestamp = timestamp
+        self.fields = fields
+        self.log = log
+        self.level = level
+        # number of identical lines this record stands for after aggregation
+        self.count = 1
+        self.last_timestamp = timestamp
+        # classifier.Event, filled in by classifier.classify_records
+        self.event = None
+
+    def __repr__(self):
+        return f"LogRecord({self.id!r}, {self.level!r}, {self.log!r})"
+
+
+class LogBatch:
+    __slots__ = ("message_type", "log_group", "log_stream", "records")
+
+    def __init__(self, message_type, log_group, log_stream, records):
+        self.message_type = message_type
+        self.log_group = log_group
+        self.log_stream = log_stream
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+
+def decompress_payload(data: str, limit=MAX_DECOMPRESSED_BYTES) -> bytes:
+    """Inflate the gzip body of a subscription event in bounded steps."""
+    compressed = memoryview(base64.b64decode(data))
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    out = bytearray()
+    for start in range(0, len(compressed), INPUT_CHUNK_BYTES):
+        chunk = compressed[start : start + INPUT_CHUNK_BYTES]
+        # max_length keeps a single chunk from expanding past the limit
+        while chunk:
+            out += decompressor.decompress(chunk, limit + 1 - len(out))
+            if len(out) > limit:
+                raise ValueError(
+                    f"log payload exceeds {limit} bytes when decompressed"
+                )
+            chunk = decompressor.unconsumed_tail
+    out += decompressor.flush()
+    if len(out) > limit:
+        raise ValueError(
+            f"log payload exceeds {limit} bytes when decompressed"
+        )
+    return bytes(out)
+
+
+def parse_log_event(log_event: dict) -> LogRecord:
+    message = log_event["message"]
+    try:
+        fields = json.loads(message)
+    except ValueError:
+        fields = None
+    if not isinstance(fields, dict):
+        # fluent-bit以外から流れてきたプレーンテキストはそのまま扱う
+        fields = {"log": message}
+    return LogRecord(
+        log_event.get("id"),
+        log_event.get("timestamp"),
+        fields,
+        fields.get("log", message),
+        fields.get("level"),
+    )
+
+
+def decode_log_batch(event) -> LogBatch:
+    payload = json.loads(decompress_payload(event["awslogs"]["data"]))
+    log_events = payload.get("logEvents", [])
+    records = [parse_log_event(log_event) for log_event in log_events]
+    # drop the raw event list so only the compact records stay alive
+    log_events.clear()
+    return LogBatch(
+        payload.get("messageType"),
+        payload.get("logGroup"),
+        payload.get("logStream"),
+        records,
+    )
@@ -0,0 +1,125 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger()
+
+# 後処理とログ出力のためにLambdaのタイムアウト前に残しておく時間
+DEADLINE_RESERVE_MS = int(os.environ.get("DEADLINE_RESERVE_MS", "3000"))
+SINK_TIMEOUT_SECONDS = float(os.environ.get("SINK_TIMEOUT_SECONDS", "60"))
+
+
+class Deadline:
+    """Remaining-time budget of one invocation, minus a safety reserve.
+
+    ``until`` (a time.monotonic() value) caps it further, for a sink that
+    has less time than the whole invocation.
+    """
+
+    __slots__ = ("context", "reserve_ms", "until")
+
+    def __init__(self, context, reserve_ms=DEADLINE_RESERVE_MS, until=None):
+        self.context = context
+        self.reserve_ms = reserve_ms
+        self.until = until
+
+    def remaining_seconds(self) -> float:
+        remaining = self.context.get_remaining_time_in_millis()
+        seconds = max(remaining - self.reserve_ms, 0) / 1000
+        if self.until is not None:
+            seconds = min(seconds, max(self.until - time.monotonic(), 0))
+        return seconds
+
+    def expired(self) -> bool:
+        return self.remaining_seconds() <= 0
+
+    def within(self, seconds: float) -> "Deadline":
+        """This deadline, or ``seconds`` from now if that comes first."""
+        until = time.monotonic() + seconds
+        if self.until is not None:
+            until = min(until, self.until)
+        return Deadline(self.context, self.reserve_ms, until)
+
+
+def delivery(sent=0, failed=0, skipped=0) -> dict:
+    return {"sent": sent, "failed": failed, "skipped": skipped}
+
+
+def fan_out(sinks: dict, deadline: Deadline, timeouts=None) -> dict:
+    """Run every sink concurrently and collect their delivery reports.
+
+    ``sinks`` maps a name to ``(callable, routed)``: the callable takes a
+    deadline and returns a ``delivery`` dict, and ``routed`` is how many
+    records it was given, all counted as failed if it raises. Each sink gets its own deadline, the earlier of its
+    timeout and the invocation deadline, and starts no send after it has
+    passed; its report then counts the rest as skipped and is marked
+    timed out. Only a sink still inside one send when the invocation
+    deadline comes is given up on, with its counts unknown (None).
+
+    The pool lives for one call only, so a send that is given up on
+    cannot hold a worker that a later warm invocation is waiting for.
+    """
+    timeouts = timeouts or {}
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(
+        max_workers=max(len(sinks), 1), thread_name_prefix="sink"
+    )
+    try:
+        return _collect(executor, sinks, deadline, timeouts, started)
+    finally:
+        # 送信中のスレッドは待たずに返る
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _collect(executor, sinks, deadline, timeouts, started) -> dict:
+    futures = {}
+    for name, (sink, routed) in sinks.items():
+        sink_deadline = deadline.within(
+            timeouts.get(name, SINK_TIMEOUT_SECONDS)
+        )
+        futures[name] = (
+            sink_deadline,
+            routed,
+            executor.submit(_timed, sink, sink_deadline),
+        )
+    report = {}
+    for name, (sink_deadline, routed, future) in futures.items():
+        try:
+            # 期限切れのシンクは次の送信を始めないので、実際の件数が返るまで待つ
+            result = future.result(timeout=deadline.remaining_seconds())
+        except TimeoutError:
+            logger.error(f"[{name}_notice_exception: ] timed out mid-send")
+            report[name] = {
+                **delivery(None, None, None),
+                "timed_out": True,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+            continue
+        except Exception as e:
+            logger.error(f"[{name}_notice_exception: ] {e}")
+            report[name] = {**delivery(failed=routed), "error": str(e)}
+            continue
+        if result["skipped"] and sink_deadline.expired():
+            logger.error(f"[{name}_notice_exception: ] timed out")
+            result["timed_out"] = True
+        report[name] = result
+    return report
+
+
+def _timed(sink, deadline: Deadline) -> dict:
+    start = time.monotonic()
+    result = sink(deadline)
+    result["elapsed_ms"] = round((time.monotonic() - start) * 1000, 1)
+    return result
+
+
+def undelivered(report: dict) -> dict:
+    return {
+        name: result
+        for name, result in report.items()
+        if result["failed"]
+        or result["skipped"]
+        or result.get("timed_out")
+        or result.get("error")
+    }
@@ -1,26 +1,33 @@
-import base64
 import json
-import zlib
 import os
-from urllib import request
-import boto3
 import logging
 
+import aggregate
+import classifier
+import fanout
+import metrics
+import slack
+import sns
+import tracing
+import webhook
+from decode import decode_log_batch
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.info("Loading function")
 
 
 def lambda_handler(event, context):
+    with tracing.invocation("notifier"):
+        return handle(event, context)
+
+
+def handle(event, context):
+    """Deliver one log batch; returns the report by sink, {} if none ran."""
     try:
-        data = zlib.decompress(
-            base64.b64decode(event["awslogs"]["data"]), 16 + zlib.MAX_WBITS
-        )
-        data_dict = json.loads(data)
-        log_entire_json = json.loads(
-            json.dumps(data_dict["logEvents"], ensure_ascii=False)
-        )
-        log_entire_len = len(log_entire_json)
+        batch = decode_log_batch(event)
+        if batch.message_type == "CONTROL_MESSAGE":
+            return {}
         region = context.invoked_function_arn.split(":")[3]
         log_group_name = context.log_group_name
         log_stream_name = context.log_stream_name
@@ -34,54 +41,71 @@ def lambda_handler(event, context):
             + ";stream="
             + log_stream_name
         )
-        post_sns_topic(log_entire_len, data_dict, log_url)
-        post_to_slack(log_entire_len, data_dict, log_url)
+        # 集約前の全レコードからメトリクスを取る
+        classifier.classify_records(batch.records)
+        try:
+            metrics.emit(
+                metrics.collect(batch.records), {"LogGroup": batch.log_group}
+            )
+        except Exception as e:
+            logger.error(f"[metrics_exception: ] {e}")
+        tracing.annotate(records=len(batch))
+        records = aggregate.collapse(
+            [
+                record
+                for record in batch.records
+                if record.event.type not in classifier.METRIC_ONLY
+            ]
+        )
+        if not records:
+            logger.info(
+                f"all {len(batch)} records were metrics-only or repeats"
+            )
+            return {}
+        deadline = fanout.Deadline(context)
+        report = fanout.fan_out(
+            {
+                "sns": (
+                    lambda d: post_sns_topic(records, log_url, d),
+                    len(records),
+                ),
+                "slack": (
+                    lambda d: post_to_slack(records, log_url, d),
+                    len(records),
+                ),
+            },
+            deadline,
+        )
+        logger.info(
+            json.dumps(
+                {
+                    "records": len(batch),
+                    "notifications": len(records),
+                    "delivery": report,
+                    "webhook": webhook.default_client.stats(),
+                }
+            )
+        )
+        undelivered = fanout.undelivered(report)
+        if undelivered:
+            logger.error(
+                f"undelivered notifications: {json.dumps(undelivered)}"
+            )
+        return report
     except Exception as e:
         logger.error(f"lambda_handler exception: {e}")
+        return {}
 
 
-def post_sns_topic(log_entire_len: int, data_dict: dict, log_url: str):
-    for i in range(log_entire_len):
-        log_dict = json.loads(
-            json.dumps(data_dict["logEvents"][i], ensure_ascii=False)
-        )
-        try:
-            message_str = log_dict["message"]
-            message_dict = json.loads(message_str)
-            message_dict["log_url"] = log_url
-            message = json.dumps(message_dict)
-            sns = boto3.client("sns")
+def post_sns_topic(records: list, log_url: str, deadline=None) -> dict:
+    return sns.publish_records(
+        records,
+        log_url,
+        os.environ["SNS_TOPIC_ARN"],
+        os.environ["ALARM_SUBJECT"],
+        deadline=deadline,
+    )
 
-            # SNS Publish
-            sns.publish(
-                TopicArn=os.environ["SNS_TOPIC_ARN"],
-                Message=message,
-                Subject=os.environ["ALARM_SUBJECT"],
-            )
-        except Exception as e:
-            logger.error(f"[sns_notice_exception: ] {e}")
 
-
-def post_to_slack(log_entire_len: int, data_dict: dict, log_url: str):
-    for i in range(log_entire_len):
-        log_dict = json.loads(
-            json.dumps(data_dict["logEvents"][i], ensure_ascii=False)
-        )
-        try:
-            message_str = log_dict["message"]
-            message_dict = json.loads(message_str)
-            user_action_info = message_dict["log"]
-            send_data = {
-                "username": "【UserEvent Notification】",
-                "icon_emoji": ":loudspeaker:",
-                "text": f"```{user_action_info}```",
-            }
-            r = request.Request(
-                url=os.environ["WEB_HOOK_URL"],
-                data=json.dumps(send_data).encode("utf-8"),
-            )
-            with request.urlopen(r) as response:
-                response_body = response.read().decode("utf-8")
-                logger.info(response_body)
-        except Exception as e:
-            logger.error(f"[slack_notice_exception: ] {e}")
+def post_to_slack(records: list, log_url: str, deadline=None) -> dict:
+    return slack.post_records(records, os.environ["WEB_HOOK_URL"], deadline)
@@ -0,0 +1,147 @@
+import json
+import os
+import sys
+import time
+
+NAMESPACE = os.environ.get("METRIC_NAMESPACE", "Minecraft/Server")
+# EMF accepts at most 100 values per metric in one document
+MAX_VALUES_PER_METRIC = 100
+
+UNITS = {
+    "MsBehind": "Milliseconds",
+    "TicksBehind": "Count",
+    "LagEvents": "Count",
+    "LagEventsPerMinute": "Count",
+    "PlayerJoins": "Count",
+    "PlayerLeaves": "Count",
+    "PlayersOnline": "Count",
+    "TPS1m": "None",
+}
+
+
+class ServerMetrics:
+    """Per-invocation aggregate of the performance signal in a log batch."""
+
+    def __init__(self):
+        self.ms_behind = []
+        self.ticks_behind = []
+        self.joins = 0
+        self.leaves = 0
+        self.players_online = None
+        self.tps = []
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def add(self, record):
+        event = record.event
+        if event is None:
+            return
+        if event.type == "lag":
+            self.ms_behind.append(int(event.fields["ms_behind"]))
+            self.ticks_behind.append(int(event.fields["ticks_behind"]))
+            self._seen(record.timestamp)
+        elif event.type == "join":
+            self.joins += 1
+        elif event.type == "leave":
+            self.leaves += 1
+        elif event.type == "player_list":
+            self.players_online = int(event.fields["online"])
+        elif event.type == "tps":
+            self.tps.append(float(event.fields["tps_1m"]))
+
+    def _seen(self, timestamp):
+        if timestamp is None:
+            return
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+
+    def lag_events_per_minute(self) -> float:
+        if not self.ms_behind:
+            return 0.0
+        span_ms = (self.last_timestamp or 0) - (self.first_timestamp or 0)
+        return len(self.ms_behind) / max(span_ms / 60000, 1.0)
+
+    def values(self) -> dict:
+        """Metric name -> value or list of values, omitting empty metrics."""
+        values = {}
+        if self.ms_behind:
+            values["MsBehind"] = self.ms_behind
+            values["TicksBehind"] = self.ticks_behind
+            values["LagEvents"] = len(self.ms_behind)
+            values["LagEventsPerMinute"] = round(
+                self.lag_events_per_minute(), 3
+            )
+        if self.joins:
+            values["PlayerJoins"] = self.joins
+        if self.leaves:
+            values["PlayerLeaves"] = self.leaves
+        if self.players_online is not None:
+            values["PlayersOnline"] = self.players_online
+        if self.tps:
+            values["TPS1m"] = self.tps
+        return values
+
+
+def collect(records: list) -> ServerMetrics:
+    metrics = ServerMetrics()
+    for record in records:
+        metrics.add(record)
+    return metrics
+
+
+def _chunks(values: dict):
+    """Split list-valued metrics so no document exceeds the EMF limit."""
+    longest = max(
+        (len(v) for v in values.values() if isinstance(v, list)), default=0
+    )
+    for start in range(0, max(longest, 1), MAX_VALUES_PER_METRIC):
+        chunk = {}
+        for name, value in values.items():
+            if isinstance(value, list):
+                part = value[start : start + MAX_VALUES_PER_METRIC]
+                if part:
+                    chunk[name] = part
+            elif start == 0:
+                chunk[name] = value
+        yield chunk
+
+
+def build_documents(metrics: ServerMetrics, dimensions: dict, now=None):
+    values = metrics.values()
+    if not values:
+        return []
+    timestamp = int((time.time() if now is None else now) * 1000)
+    documents = []
+    for chunk in _chunks(values):
+        documents.append(
+            {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": NAMESPACE,
+                            "Dimensions": [list(dimensions)],
+                            "Metrics": [
+                                {"Name": name, "Unit": UNITS[name]}
+                                for name in chunk
+                            ],
+                        }
+                    ],
+                },
+                **dimensions,
+                **chunk,
+            }
+        )
+    return documents
+
+
+def emit(metrics: ServerMetrics, dimensions: dict, stream=None):
+    """Write EMF documents as single stdout lines for CloudWatch to extract."""
+    stream = stream or sys.stdout
+    documents = build_documents(metrics, dimensions)
+    for document in documents:
+        stream.write(json.dumps(document) + "\n")
+    stream.flush()
+    return documents
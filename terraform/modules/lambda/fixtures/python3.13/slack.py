@@ -0,0 +1,209 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import webhook
+from fanout import delivery
+
+logger = logging.getLogger()
+
+USERNAME = "【UserEvent Notification】"
+ICON_EMOJI = ":loudspeaker:"
+
+# Slack limits: section text is capped at 3000 chars, a message at 50 blocks,
+# and the text of a message is truncated after 40000 chars.
+MAX_BLOCK_CHARS = 3000
+MAX_BLOCKS = 50
+MAX_MESSAGE_CHARS = 40000
+CODE_FENCE = "```"
+# mrkdwnの制御文字はエスケープし、バッククォートはコードブロックを閉じないよう
+# 見た目の近い文字(U+02CB)に置き換える
+ESCAPES = str.maketrans(
+    {"&": "&amp;", "<": "&lt;", ">": "&gt;", "`": "\u02cb"}
+)
+
+# イベント種別ごとにコードブロックの前に付けるラベル
+EVENT_EMOJI = {
+    "chat": ":speech_balloon:",
+    "join": ":wave:",
+    "leave": ":door:",
+    "login": ":key:",
+    "disconnect": ":electric_plug:",
+    "death": ":skull:",
+    "advancement": ":trophy:",
+    "lag": ":snail:",
+    "plugin_exception": ":jigsaw:",
+    "exception": ":boom:",
+    "server_ready": ":white_check_mark:",
+    "server_stop": ":octagonal_sign:",
+}
+
+JST = timezone(timedelta(hours=+9), "JST")
+
+MAX_ATTEMPTS = 4
+MAX_RETRY_AFTER_SECONDS = 30
+
+
+def format_time(timestamp_ms) -> str:
+    return datetime.fromtimestamp(timestamp_ms / 1000, JST).strftime(
+        "%H:%M:%S"
+    )
+
+
+def format_record(record) -> str:
+    if record.count <= 1:
+        return record.log
+    return (
+        f"{record.log}  (x{record.count}, "
+        f"{format_time(record.timestamp)}-"
+        f"{format_time(record.last_timestamp)})"
+    )
+
+
+def event_label(record) -> str:
+    if record.event is None:
+        return ""
+    return EVENT_EMOJI.get(record.event.type, "")
+
+
+def split_line(line: str, width: int):
+    """Escape ``line`` and cut it into pieces of at most ``width`` chars.
+
+    A piece never ends inside an entity such as ``&amp;``.
+    """
+    text = line.translate(ESCAPES)
+    if len(text) == len(line):
+        # 長さが変わらなければ、どこで切っても実体参照は分断されない
+        for start in range(0, len(text), width):
+            yield text[start : start + width]
+        if not text:
+            yield text
+        return
+    piece = ""
+    for char in line:
+        escaped = char.translate(ESCAPES)
+        if len(piece) + len(escaped) > width:
+            yield piece
+            piece = ""
+        piece += escaped
+    yield piece
+
+
+def build_blocks(entries):
+    """Pack (label, line) pairs, in order, into labelled code blocks.
+
+    Consecutive lines with the same label share a block; no block text is
+    longer than MAX_BLOCK_CHARS. Lines are escaped so that log text
+    cannot close the code block or be read as a mention or link.
+    """
+    blocks = []
+    current = []
+    size = width = 0
+    label = None
+    for entry_label, line in entries:
+        if entry_label != label:
+            if current:
+                blocks.append((label, current))
+            label = entry_label
+            current = []
+            size = 0
+            width = MAX_BLOCK_CHARS - 2 * len(CODE_FENCE) - len(label) - 1
+        for piece in split_line(line, width):
+            extra = len(piece) + (1 if current else 0)
+            if current and size + extra > width:
+                blocks.append((label, current))
+                current = []
+                size = 0
+                extra = len(piece)
+            current.append(piece)
+            size += extra
+    if current:
+        blocks.append((label, current))
+    return [
+        (f"{label} " if label else "")
+        + CODE_FENCE
+        + "\n".join(lines)
+        + CODE_FENCE
+        for label, lines in blocks
+    ]
+
+
+def build_messages(entries):
+    """Group code blocks into as few webhook payloads as Slack accepts."""
+    messages = []
+    blocks = []
+    size = 0
+    for text in build_blocks(entries):
+        if blocks and (
+            len(blocks) >= MAX_BLOCKS or size + len(text) > MAX_MESSAGE_CHARS
+        ):
+            messages.append(blocks)
+            blocks = []
+            size = 0
+        blocks.append(text)
+        size += len(text)
+    if blocks:
+        messages.append(blocks)
+    return [
+        {
+            "username": USERNAME,
+            "icon_emoji": ICON_EMOJI,
+            # 通知のプレビューに使われるフォールバックテキスト
+            "text": texts[0][:MAX_BLOCK_CHARS],
+            "blocks": [
+                {"type": "section", "text": {"type": "mrkdwn", "text": t}}
+                for t in texts
+            ],
+        }
+        for texts in messages
+    ]
+
+
+def retry_after_seconds(response) -> float:
+    try:
+        seconds = float(response.headers.get("Retry-After", 1))
+    except (TypeError, ValueError):
+        seconds = 1.0
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+def post_message(url: str, payload: dict, deadline=None, client=None) -> bool:
+    client = client or webhook.default_client
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = client.post_json(url, payload)
+        if 200 <= response.status < 300:
+            return True
+        error = f"HTTP {response.status}: {response.body[:200]!r}"
+        if response.status != 429 or attempt == MAX_ATTEMPTS:
+            logger.error(f"[slack_notice_exception: ] {error}")
+            return False
+        wait = retry_after_seconds(response)
+        if deadline is not None and wait >= deadline.remaining_seconds():
+            logger.error(f"[slack_notice_exception: ] {error}")
+            return False
+        logger.warning(f"slack rate limited, retrying in {wait}s")
+        time.sleep(wait)
+    return False
+
+
+def post_records(records: list, url: str, deadline=None) -> dict:
+    """Post one batch to Slack, counting messages sent, failed and skipped.
+
+    No new post is started once the deadline has expired.
+    """
+    messages = build_messages(
+        [(event_label(record), format_record(record)) for record in records]
+    )
+    sent = failed = 0
+    for payload in messages:
+        if deadline is not None and deadline.expired():
+            break
+        try:
+            if post_message(url, payload, deadline):
+                sent += 1
+            else:
+                failed += 1
+        except Exception as e:
+            logger.error(f"[slack_notice_exception: ] {e}")
+            failed += 1
+    return delivery(sent, failed, len(messages) - sent - failed)
@@ -0,0 +1,122 @@
+import json
+import logging
+import time
+
+import clients
+from fanout import delivery
+
+logger = logging.getLogger()
+
+# PublishBatch accepts up to 10 entries and 256KiB of messages per call
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 0.2
+
+
+def get_client():
+    # warm invocations reuse the client instead of rebuilding it per event
+    return clients.get("sns")
+
+
+def build_message(record, log_url: str) -> str:
+    message = {**record.fields, "log_url": log_url}
+    if record.event is not None:
+        message["event_type"] = record.event.type
+        message["event"] = record.event.fields
+    if record.count > 1:
+        message["count"] = record.count
+        message["first_timestamp"] = record.timestamp
+        message["last_timestamp"] = record.last_timestamp
+    return json.dumps(message)
+
+
+def build_entries(records: list, log_url: str, subject: str) -> list:
+    return [
+        {
+            "Id": str(index),
+            "Message": build_message(record, log_url),
+            "Subject": subject,
+        }
+        for index, record in enumerate(records)
+    ]
+
+
+def chunk_entries(entries: list):
+    """Yield entry lists that fit in a single PublishBatch request."""
+    batch = []
+    size = 0
+    for entry in entries:
+        entry_size = len(entry["Message"].encode("utf-8"))
+        if batch and (
+            len(batch) >= MAX_BATCH_ENTRIES
+            or size + entry_size > MAX_BATCH_BYTES
+        ):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(entry)
+        size += entry_size
+    if batch:
+        yield batch
+
+
+def publish_batch(client, topic_arn: str, entries: list) -> list:
+    """Publish one batch, retrying only the entries SNS reports as failed.
+
+    Returns the entries that were still undelivered after the last attempt.
+    """
+    pending = entries
+    rejected = []
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        result = client.publish_batch(
+            TopicArn=topic_arn, PublishBatchRequestEntries=pending
+        )
+        failed = {f["Id"]: f for f in result.get("Failed", [])}
+        retry = []
+        for entry in pending:
+            failure = failed.get(entry["Id"])
+            if failure is None:
+                continue
+            if failure.get("SenderFault"):
+                # 送信内容が原因のエラーは再送しても成功しない
+                logger.error(
+                    f"[sns_notice_exception: ] {entry['Id']}: "
+                    f"{failure.get('Code')} {failure.get('Message')}"
+                )
+                rejected.append(entry)
+            else:
+                retry.append(entry)
+        pending = retry
+        if not pending:
+            break
+        if attempt < MAX_ATTEMPTS:
+            time.sleep(RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    return rejected + pending
+
+
+def publish_records(
+    records: list,
+    log_url: str,
+    topic_arn: str,
+    subject: str,
+    client=None,
+    deadline=None,
+) -> dict:
+    """Publish one batch to SNS, counting entries sent, failed and skipped.
+
+    No new PublishBatch call is started once the deadline has expired.
+    """
+    client = client or get_client()
+    sent = failed = 0
+    for batch in chunk_entries(build_entries(records, log_url, subject)):
+        if deadline is not None and deadline.expired():
+            break
+        try:
+            undelivered = len(publish_batch(client, topic_arn, batch))
+        except Exception as e:
+            logger.error(f"[sns_notice_exception: ] {e}")
+            undelivered = len(batch)
+        sent += len(batch) - undelivered
+        failed += undelivered
+    return delivery(sent, failed, len(records) - sent - failed)
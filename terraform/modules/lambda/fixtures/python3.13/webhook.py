@@ -0,0 +1,150 @@
+import http.client
+import json
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+import tracing
+
+# keep-alive接続が切れていた場合に発生する例外
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class WebhookResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class WebhookClient:
+    """JSON POST client that keeps one idle keep-alive connection per host.
+
+    Module-level instances survive warm Lambda invocations, so only the
+    first post of a container pays the TCP and TLS handshake. A pooled
+    connection the server has since closed is replaced transparently.
+    Each post is traced as a span called ``name``.
+    """
+
+    def __init__(
+        self,
+        timeout=10.0,
+        ssl_context=None,
+        max_idle_per_host=2,
+        name="webhook",
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.max_idle_per_host = max_idle_per_host
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.posts = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _connect(self, scheme, host, port):
+        with self.lock:
+            self.connects += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(
+                host, port, timeout=self.timeout, context=self.ssl_context
+            )
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _acquire(self, key):
+        with self.lock:
+            pool = self.idle.get(key)
+            if pool:
+                return pool.pop(), True
+        return self._connect(*key), False
+
+    def _release(self, key, conn):
+        with self.lock:
+            pool = self.idle.setdefault(key, [])
+            if len(pool) < self.max_idle_per_host:
+                pool.append(conn)
+                return
+        conn.close()
+
+    def _send(self, conn, path, body, headers):
+        conn.request("POST", path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def post_json(self, url: str, payload) -> WebhookResponse:
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+        start = time.perf_counter()
+        with tracing.span(self.name, len(body)) as span:
+            conn, reused = self._acquire(key)
+            try:
+                try:
+                    response, data = self._send(conn, path, body, headers)
+                except STALE_CONNECTION_ERRORS:
+                    if not reused:
+                        raise
+                    conn.close()
+                    with self.lock:
+                        self.reconnects += 1
+                    span.retries += 1
+                    conn = self._connect(*key)
+                    response, data = self._send(conn, path, body, headers)
+            except Exception:
+                conn.close()
+                raise
+            span.status = response.status
+            span.response_bytes = len(data)
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        self._record((time.perf_counter() - start) * 1000)
+        return WebhookResponse(response.status, response.headers, data)
+
+    def _record(self, elapsed_ms):
+        with self.lock:
+            self.posts += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "posts": self.posts,
+                "connects": self.connects,
+                "reconnects": self.reconnects,
+                "avg_ms": (
+                    round(self.total_ms / self.posts, 1) if self.posts else 0.0
+                ),
+                "max_ms": round(self.max_ms, 1),
+            }
+
+    def close(self):
+        with self.lock:
+            pools, self.idle = self.idle, {}
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+
+
+default_client = WebhookClient(name="slack")
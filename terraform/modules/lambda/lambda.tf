@@ -12,7 +12,11 @@ module "user_action_filter_function" {
 
   recreate_missing_package = false
 
-  source_path = ["${path.module}/fixtures/python3.13/index.py"]
+  # shared/ はclients.pyなど両Lambdaで共通のモジュール(zipの直下に入る)
+  source_path = [
+    "${path.module}/fixtures/python3.13",
+    "${path.module}/../shared/python3.13",
+  ]
 
   environment_variables = {
     SNS_TOPIC_ARN = var.sns_topic_arn
@@ -18,7 +18,7 @@ variable "filter_patterns" {
   type        = list(string)
   default = [
     "{ ($.log = \"<*\") }",
-    "{ ($.log = \"ERROR*\") }",
+    "{ ($.log = \"ERROR*\") || ($.log = \"Can't keep up!*\") || ($.log = \"TPS from last*\") || ($.log = \"There are *\") }",
   ]
 }
 
@@ -0,0 +1,271 @@
+"""Measure cold-start cost of the notifier and slash-command Lambdas.
+
+Every measurement runs in a fresh interpreter, the way a new Lambda
+container would see it:
+
+* import: ``python -X importtime -c "import index"``, summed per
+  top-level package (boto3, botocore, requests, ...).
+* first invoke: import index, then the first call of each command. AWS
+  clients are really built (fake credentials, no network) before the
+  in-process stand-in answers, so boto3 import and client construction
+  land in the invocation that triggers them.
+
+    python shared/bench/cold_start.py
+    python shared/bench/cold_start.py --commands status list --runs 5
+    python shared/bench/cold_start.py --output results/cold.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODULES = os.path.join(HERE, "..", "..")
+SHARED = os.path.join(HERE, "..", "python3.13")
+TARGETS = {
+    "notifier": os.path.join(MODULES, "lambda"),
+    "slash": os.path.join(MODULES, "slash_command"),
+}
+DEFAULT_COMMANDS = ("status", "list", "show", "start", "restart")
+# github_auth / github_dispatch を遅延importするコマンド
+DISPATCH_COMMANDS = {"backup", "restore", "create", "start", "stop"}
+FAKE_AWS_ENV = {
+    "AWS_ACCESS_KEY_ID": "cold-start",
+    "AWS_SECRET_ACCESS_KEY": "cold-start",
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+}
+
+
+def target_path(target):
+    base = TARGETS[target]
+    return [
+        os.path.join(base, "fixtures", "python3.13"),
+        SHARED,
+        os.path.join(base, "bench"),
+    ]
+
+
+def import_breakdown(target):
+    """Self import time in ms per top-level package for ``import index``."""
+    env = dict(os.environ, **FAKE_AWS_ENV)
+    env["PYTHONPATH"] = os.pathsep.join(target_path(target)[:2])
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import index"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+    return dict(sorted(packages.items(), key=lambda item: -item[1]))
+
+
+def real_then(standins):
+    """A clients._build that builds the real client, returns a stand-in."""
+    import clients
+
+    build = clients._build
+
+    def _build(service_name, **kwargs):
+        build(service_name, **kwargs)
+        return standins[service_name]
+
+    return _build
+
+
+class LocalSsm:
+    def __init__(self, value):
+        self.value = value
+
+    def get_parameter(self, Name, WithDecryption=False):
+        return {"Parameter": {"Name": Name, "Value": self.value}}
+
+
+def first_invoke_slash(command_text):
+    from unittest import mock
+
+    os.environ.update(
+        REPO_OWNER="local",
+        REPO_NAME="minecraft",
+        S3_BUCKET_NAME="local-backups",
+        ECS_CLUSTER_NAME="minecraft",
+        ECS_SERVICE_NAME="minecraft",
+    )
+    # ハーネス側のimportは計測に含めない
+    import local_harness as harness
+    from standins import LocalEcs, LocalElbv2, LocalLambda, LocalS3
+
+    start = time.perf_counter()
+    import clients
+    import index
+    import tracing
+
+    import_ms = (time.perf_counter() - start) * 1000
+    tracing.set_sink(tracing.MemorySink())
+
+    lambda_standin = LocalLambda()
+    standins = {
+        "lambda": lambda_standin,
+        "ecs": LocalEcs(0),
+        "elbv2": LocalElbv2(0),
+        "ssm": LocalSsm(harness.SIGNING_SECRET),
+        "s3": LocalS3(
+            (
+                f"backups/2024-06-{day:02d}/minecraft-202406{day:02d}120000"
+                ".tar.gz",
+                None,
+                1 << 20,
+            )
+            for day in range(20, 25)
+        ),
+    }
+    if command_text.split()[0] == "show":
+        command_text = "show 20240624120000"
+    event = harness.slash_event(command_text, "http://127.0.0.1:9/x")
+
+    with (
+        mock.patch.object(clients, "_build", real_then(standins)),
+        mock.patch.object(tracing.urllib.request, "urlopen"),
+    ):
+        start = time.perf_counter()
+        if command_text.split()[0] in DISPATCH_COMMANDS:
+            import github_auth
+            import github_dispatch
+
+            github_auth.get_github_token = lambda: "local"
+            github_dispatch._session = harness.LocalGitHub()
+        ack = index.lambda_handler(event, harness.LambdaContext())
+        ack_ms = (time.perf_counter() - start) * 1000
+        worker_ms = 0.0
+        if lambda_standin.invocations:
+            payload = lambda_standin.invocations.pop()
+            start = time.perf_counter()
+            index.lambda_handler(payload, harness.LambdaContext())
+            worker_ms = (time.perf_counter() - start) * 1000
+    return {
+        "import_ms": import_ms,
+        "ack_ms": ack_ms,
+        "worker_ms": worker_ms,
+        "status_code": ack["statusCode"],
+    }
+
+
+def first_invoke_notifier(command_text):
+    from contextlib import redirect_stdout
+    from io import StringIO
+
+    from payloads import LambdaContext, make_event
+    from standins import LocalSlackWebhook, LocalSns
+
+    os.environ.setdefault("SNS_TOPIC_ARN", "arn:aws:sns:local:0:bench")
+    os.environ.setdefault("ALARM_SUBJECT", "bench")
+    event = make_event(int(command_text))
+    with LocalSlackWebhook() as slack_standin:
+        os.environ["WEB_HOOK_URL"] = slack_standin.url
+        start = time.perf_counter()
+        import clients
+        import index
+        import tracing
+
+        import_ms = (time.perf_counter() - start) * 1000
+        tracing.set_sink(tracing.MemorySink())
+        build = real_then({"sns": LocalSns(0)})
+        clients._build = build
+        start = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            index.lambda_handler(event, LambdaContext())
+        invoke_ms = (time.perf_counter() - start) * 1000
+    return {"import_ms": import_ms, "ack_ms": invoke_ms, "worker_ms": 0.0}
+
+
+def first_invoke(target, command_text):
+    env = dict(os.environ, **FAKE_AWS_ENV)
+    proc = subprocess.run(
+        [sys.executable, __file__, "--worker", target, command_text],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{target} {command_text!r}: {proc.stderr}")
+    return json.loads(proc.stdout.splitlines()[-1])
+
+
+def median_of(runs, field):
+    return round(statistics.median(run[field] for run in runs), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", nargs="*", default=DEFAULT_COMMANDS)
+    parser.add_argument(
+        "--events", type=int, default=1, help="notifier batch size"
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--output")
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        target, command_text = args.worker
+        sys.path[:0] = target_path(target)
+        if target == "slash":
+            result = first_invoke_slash(command_text)
+        else:
+            result = first_invoke_notifier(command_text)
+        print(json.dumps(result))
+        return
+
+    report = {}
+    invocations = {
+        "notifier": [str(args.events)],
+        "slash": list(args.commands),
+    }
+    for target, commands in invocations.items():
+        packages = import_breakdown(target)
+        total = sum(packages.values())
+        print(f"{target}: import index {total:7.1f}ms (self time, summed)")
+        for package, ms in list(packages.items())[: args.top]:
+            print(f"    {package:<24} {ms:7.1f}ms")
+        report[target] = {
+            "import_total_ms": round(total, 1),
+            "import_ms": {
+                package: round(ms, 1) for package, ms in packages.items()
+            },
+            "first_invoke": {},
+        }
+        for command_text in commands:
+            runs = [
+                first_invoke(target, command_text) for _ in range(args.runs)
+            ]
+            summary = {
+                field: median_of(runs, field)
+                for field in ("import_ms", "ack_ms", "worker_ms")
+            }
+            report[target]["first_invoke"][command_text] = summary
+            label = command_text if target == "slash" else "events"
+            print(
+                f"  first {label:<10} import {summary['import_ms']:7.1f}ms  "
+                f"ack {summary['ack_ms']:7.1f}ms  "
+                f"worker {summary['worker_ms']:7.1f}ms"
+            )
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
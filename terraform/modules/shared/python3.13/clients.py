@@ -0,0 +1,58 @@
+"""Lazily built boto3 clients shared by everything in one Lambda container.
+
+Packaged next to each function's own modules (see the source_path of the
+lambda and slash_command modules). A client is created on the first
+``get()`` for its service and reused by later invocations in the same
+container; boto3 itself is only imported then, so an invocation that
+never reaches AWS does not pay for importing it. Every client built here
+is instrumented by ``tracing``.
+"""
+
+import threading
+
+import tracing
+
+# boto3のセッションはスレッドセーフではないため、生成はロックの中で行う
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+
+def get(service_name, **kwargs):
+    """The container-wide client for ``service_name``.
+
+    ``kwargs`` (region_name, config, ...) are part of the cache key, so
+    differently configured clients for one service do not collide.
+    """
+    key = (service_name, tuple(sorted(kwargs.items())))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _build(service_name, **kwargs)
+            _clients[key] = client
+    return client
+
+
+def _build(service_name, **kwargs):
+    global _session
+    if _session is None:
+        import boto3.session
+
+        _session = boto3.session.Session()
+    return tracing.instrument_client(_session.client(service_name, **kwargs))
+
+
+def register(service_name, client, **kwargs):
+    """Install ``client`` in place of a real one (benchmarks, harnesses)."""
+    with _lock:
+        _clients[(service_name, tuple(sorted(kwargs.items())))] = client
+
+
+def clear():
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
@@ -0,0 +1,328 @@
+"""Spans for every outbound call, summarised once per invocation.
+
+``invocation()`` wraps a handler. While it is open, each AWS API call
+made through a ``clients.get()`` client (botocore before-call /
+after-call hooks), each request on an ``instrument_session()`` requests
+session, and each ``urlopen()`` / ``span()`` block is recorded with its
+name, duration, retry count and payload sizes. When the handler returns,
+one EMF document (latency per service, call and retry counts) and one
+JSON log line with the spans are handed to the sink: stdout in Lambda, a
+``MemorySink`` in benches and harnesses.
+
+A Lambda container runs one invocation at a time, so the open invocation
+is module state and spans from worker threads land in it too.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+NAMESPACE = os.environ.get("TRACE_NAMESPACE", "Minecraft/Lambda")
+_HOOK_ID = "tracing"
+
+_lock = threading.Lock()
+_active = None
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "started_at",
+        "duration_ms",
+        "retries",
+        "request_bytes",
+        "response_bytes",
+        "status",
+        "error",
+    )
+
+    def __init__(self, name, request_bytes=0):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.duration_ms = 0.0
+        self.retries = 0
+        self.request_bytes = request_bytes
+        self.response_bytes = 0
+        self.status = None
+        self.error = None
+
+    @property
+    def service(self):
+        return self.name.split(".", 1)[0]
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.started_at) * 1000
+        record(self)
+
+    def as_dict(self):
+        span = {
+            "name": self.name,
+            "ms": round(self.duration_ms, 1),
+            "retries": self.retries,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+        }
+        if self.status is not None:
+            span["status"] = self.status
+        if self.error is not None:
+            span["error"] = self.error
+        return span
+
+
+class Invocation:
+    def __init__(self, function, fields):
+        self.function = function
+        self.fields = fields
+        self.started_at = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def services(self):
+        """service -> (calls, total ms, retries), in first-call order."""
+        totals = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            calls, ms, retries = totals.get(span.service, (0, 0.0, 0))
+            totals[span.service] = (
+                calls + 1,
+                ms + span.duration_ms,
+                retries + span.retries,
+            )
+        return totals
+
+    def documents(self, now=None):
+        """The EMF document and the JSON log line for this invocation."""
+        duration_ms = (time.perf_counter() - self.started_at) * 1000
+        services = self.services()
+        calls = sum(calls for calls, _, _ in services.values())
+        retries = sum(retries for _, _, retries in services.values())
+        values = {
+            "Duration": round(duration_ms, 1),
+            "OutboundCalls": calls,
+            "OutboundRetries": retries,
+        }
+        units = {
+            "Duration": "Milliseconds",
+            "OutboundCalls": "Count",
+            "OutboundRetries": "Count",
+        }
+        for service, (_, ms, _) in services.items():
+            values[f"{service}Ms"] = round(ms, 1)
+            units[f"{service}Ms"] = "Milliseconds"
+        timestamp = int((time.time() if now is None else now) * 1000)
+        emf = {
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": NAMESPACE,
+                        "Dimensions": [["Function"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, unit in units.items()
+                        ],
+                    }
+                ],
+            },
+            "Function": self.function,
+            **values,
+        }
+        with self.lock:
+            spans = [span.as_dict() for span in self.spans]
+        log = {
+            "invocation": self.function,
+            **self.fields,
+            "duration_ms": values["Duration"],
+            "calls": calls,
+            "retries": retries,
+            "spans": spans,
+        }
+        return [emf, log]
+
+
+def _stdout_sink(document):
+    sys.stdout.write(json.dumps(document, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+class MemorySink:
+    """Keeps emitted documents instead of printing them."""
+
+    def __init__(self):
+        self.documents = []
+
+    def __call__(self, document):
+        self.documents.append(document)
+
+    def logs(self):
+        return [d for d in self.documents if "invocation" in d]
+
+
+_sink = _stdout_sink
+
+
+def set_sink(sink):
+    """Route summaries to ``sink`` (None restores stdout); returns the old."""
+    global _sink
+    previous, _sink = _sink, sink or _stdout_sink
+    return previous
+
+
+@contextmanager
+def invocation(default_function, **fields):
+    """Collect spans for one handler call and emit the summary at the end."""
+    global _active
+    function = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", default_function)
+    current = Invocation(function, fields)
+    with _lock:
+        _active = current
+    try:
+        yield current
+    finally:
+        with _lock:
+            _active = None
+        try:
+            for document in current.documents():
+                _sink(document)
+        except Exception as e:
+            # 計測の失敗で本処理の結果を変えない
+            sys.stderr.write(f"tracing summary failed: {e}\n")
+
+
+def annotate(**fields):
+    """Add fields (e.g. the command) to the open invocation's log line."""
+    current = _active
+    if current is not None:
+        current.fields.update(fields)
+
+
+def record(span):
+    current = _active
+    if current is not None:
+        current.add(span)
+
+
+@contextmanager
+def span(name, request_bytes=0):
+    """Time the block as one outbound call; exceptions mark it failed."""
+    current = Span(name, request_bytes)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.finish()
+
+
+def _body_size(body):
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    return 0
+
+
+def _retries(context):
+    # botocoreはリトライのたびに context["retries"]["attempt"] を更新する
+    return max(0, context.get("retries", {}).get("attempt", 1) - 1)
+
+
+def instrument_client(client):
+    """Record every API call of a boto3 client as ``<service>.<Operation>``."""
+    service = client.meta.service_model.service_name
+    events = client.meta.events
+
+    def before_call(model, params, context, **kwargs):
+        context["_trace_span"] = Span(
+            f"{service}.{model.name}", _body_size(params.get("body"))
+        )
+
+    def after_call(http_response, parsed, context, **kwargs):
+        current = context.pop("_trace_span", None)
+        if current is None:
+            return
+        current.status = http_response.status_code
+        current.retries = _retries(context)
+        current.response_bytes = int(
+            http_response.headers.get("content-length", 0) or 0
+        )
+        if current.status >= 400:
+            current.error = parsed.get("Error", {}).get("Code")
+        current.finish()
+
+    def after_call_error(exception, context, **kwargs):
+        current = context.pop("_trace_span", None)
+        if current is None:
+            return
+        current.retries = _retries(context)
+        current.error = type(exception).__name__
+        current.finish()
+
+    events.register("before-call", before_call, unique_id=f"{_HOOK_ID}-b")
+    events.register("after-call", after_call, unique_id=f"{_HOOK_ID}-a")
+    events.register(
+        "after-call-error", after_call_error, unique_id=f"{_HOOK_ID}-e"
+    )
+    return client
+
+
+def instrument_session(session, name):
+    """Record each request of a requests.Session as span ``name``."""
+    send = session.request
+
+    def request(method, url, *args, **kwargs):
+        body = kwargs.get("data") or b""
+        if kwargs.get("json") is not None:
+            body = json.dumps(kwargs["json"])
+        with span(name, _body_size(body)) as current:
+            api_response = send(method, url, *args, **kwargs)
+            current.status = api_response.status_code
+            current.response_bytes = len(api_response.content)
+            history = getattr(
+                getattr(api_response.raw, "retries", None), "history", ()
+            )
+            current.retries = len(history or ())
+            return api_response
+
+    session.request = request
+    return session
+
+
+class HttpResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+def urlopen(request_obj, timeout=None, name=None):
+    """urllib.request.urlopen that reads the body inside a span.
+
+    HTTPError is re-raised after its status is recorded.
+    """
+    url = getattr(request_obj, "full_url", request_obj)
+    name = name or f"http.{urlsplit(url).hostname}"
+    data = getattr(request_obj, "data", None)
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    with span(name, _body_size(data)) as current:
+        try:
+            with urllib.request.urlopen(request_obj, **kwargs) as resp:
+                body = resp.read()
+                current.status = resp.status
+                current.response_bytes = len(body)
+                return HttpResponse(resp.status, resp.headers, body)
+        except HTTPError as e:
+            current.status = e.code
+            raise
@@ -0,0 +1,145 @@
+"""Peak memory and time to first member of `/mc show <key> --contents`.
+
+Builds a world-shaped tar.gz (three dimensions of region files) in a
+local S3 stand-in, once as a single gzip member and once as several
+concatenated members like a parallel compressor writes, then lists it
+through ranged GETs under tracemalloc. The archive itself lives in the
+stand-in before tracing starts, so the peak is what listing allocates.
+The stream classes must match their canonical copy in the Docker
+image's backup_tool.py; the bench fails if they have drifted.
+
+    python bench/backup_contents.py
+    python bench/backup_contents.py --mb 1024 --rtt-ms 30 --max-mb 200
+"""
+
+import argparse
+import gzip
+import io
+import os
+import sys
+import tarfile
+import time
+import tracemalloc
+
+from standins import LocalS3
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "..", "fixtures", "python3.13")
+BACKUP_TOOL = os.path.join(
+    HERE,
+    "..",
+    "..",
+    "..",
+    "..",
+    "docker",
+    "minecraft",
+    "scripts",
+    "backup_tool.py",
+)
+DIMENSIONS = {
+    "world": "world/region",
+    "world_nether": "world_nether/DIM-1/region",
+    "world_the_end": "world_the_end/DIM1/region",
+}
+REGION_SIZE = 4 * 1024 * 1024
+
+
+def make_tar(total_mb):
+    """Uncompressed tar bytes with about ``total_mb`` of region files."""
+    # 1MiBの乱数を使い回す(deflateの窓は32KiBなので圧縮はほぼ効かない)
+    noise = os.urandom(1024 * 1024)
+    region = noise * (REGION_SIZE // len(noise))
+    buffer = io.BytesIO()
+    regions = max(1, total_mb * 1024 * 1024 // REGION_SIZE)
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, directory in DIMENSIONS.items():
+            info = tarfile.TarInfo(f"{name}/level.dat")
+            info.size = 1024
+            tar.addfile(info, io.BytesIO(b"\0" * 1024))
+        for i in range(regions):
+            directory = list(DIMENSIONS.values())[i % len(DIMENSIONS)]
+            info = tarfile.TarInfo(f"{directory}/r.{i}.0.mca")
+            info.size = len(region)
+            tar.addfile(info, io.BytesIO(region))
+    return buffer.getvalue(), regions + len(DIMENSIONS)
+
+
+def gzip_members(data, members):
+    step = -(-len(data) // members)
+    return b"".join(
+        gzip.compress(data[i : i + step], compresslevel=1)
+        for i in range(0, len(data), step)
+    )
+
+
+def streams_block(path):
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    return source[
+        source.index("# --- streams:") : source.index("# --- streams end")
+    ]
+
+
+def run(backup_contents, bucket, key, max_bytes):
+    first = []
+    start = time.perf_counter()
+    tracemalloc.start()
+    contents = backup_contents.inspect(
+        bucket,
+        "b",
+        key,
+        max_bytes=max_bytes,
+        on_member=lambda member: first
+        or first.append(time.perf_counter() - start),
+    )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return contents, time.perf_counter() - start, first[0], peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=256)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--max-mb", type=int, default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, FIXTURES)
+    import backup_contents
+
+    if streams_block(backup_contents.__file__) != streams_block(BACKUP_TOOL):
+        sys.exit("stream classes differ from docker/.../backup_tool.py")
+
+    data, files = make_tar(args.mb)
+    bucket = LocalS3(rtt_ms=args.rtt_ms)
+    archives = {
+        "single": gzip.compress(data, compresslevel=1),
+        f"{args.members} members": gzip_members(data, args.members),
+    }
+    del data
+    max_bytes = args.max_mb * 1024 * 1024 if args.max_mb else None
+    ok = True
+    for label, archive in archives.items():
+        key = f"backups/2024-06-24/minecraft-{label.replace(' ', '')}.tar.gz"
+        bucket.put(key, body=archive)
+        contents, elapsed, first_s, peak = run(
+            backup_contents, bucket, key, max_bytes
+        )
+        mb = 1024 * 1024
+        print(
+            f"{label:<11} object {len(archive) / mb:7.1f}MB  "
+            f"first member {first_s * 1000:6.1f}ms  total {elapsed:6.2f}s  "
+            f"peak {peak / mb:6.1f}MB  gets {contents.requests}  "
+            f"files {contents.files}  truncated={contents.truncated}"
+        )
+        for name, (count, size, regions) in contents.dimensions.items():
+            print(f"    {name:<14} {count:5d} files {size / mb:8.1f}MB")
+        if not contents.truncated:
+            ok = ok and contents.files == files
+        ok = ok and contents.gzip_members >= 1
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Check and time backup_listing against a 100k-key local S3 stand-in.
+
+The bucket spreads backups over a couple of years of date partitions,
+with one busy day holding more than a page of keys. Each query is checked
+against a brute-force sort of every key, and the list requests it took
+are reported next to what the old single list_objects_v2 call returned.
+
+    python bench/backup_listing.py
+    python bench/backup_listing.py --keys 20000 --busy-day 3000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from standins import LocalS3
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "..", "fixtures", "python3.13")
+JST = timezone(timedelta(hours=+9), "JST")
+START = datetime(2023, 1, 1, tzinfo=JST)
+DAYS = 730
+BUSY_DAY = START + timedelta(days=DAYS // 2)
+
+
+def make_bucket(keys, busy_day, seed=0):
+    rng = random.Random(seed)
+    created = [
+        START
+        + timedelta(days=rng.randrange(DAYS), seconds=rng.randrange(86400))
+        for _ in range(keys - busy_day)
+    ]
+    # 一日に1ページ(1000件)を超えるバックアップがあってもページングで拾えること
+    created += [BUSY_DAY + timedelta(seconds=i * 7) for i in range(busy_day)]
+    bucket = LocalS3()
+    for at in created:
+        bucket.put(
+            f"backups/{at:%Y-%m-%d}/minecraft-{at:%Y%m%d%H%M%S}.tar.gz",
+            at.astimezone(timezone.utc),
+            1 << 20,
+        )
+    return bucket
+
+
+def expected(bucket, k, date=None):
+    keys = [
+        key
+        for key in bucket.keys
+        if date is None or key.startswith(f"backups/{date}/")
+    ]
+    return sorted(keys, key=lambda key: key.rsplit("-", 1)[-1], reverse=True)[
+        :k
+    ]
+
+
+def measure(bucket, fn):
+    bucket.calls = 0
+    start = time.perf_counter()
+    result = fn()
+    return result, bucket.calls, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--busy-day", type=int, default=2500)
+    args = parser.parse_args()
+
+    sys.path.insert(0, FIXTURES)
+    import backup_listing
+
+    bucket = make_bucket(args.keys, args.busy_day)
+    print(f"{len(bucket.keys)} keys")
+    failures = 0
+
+    # 旧実装: 1回のlist_objects_v2を全件ソートして先頭5件
+    old, calls, ms = measure(
+        bucket,
+        lambda: bucket.list_objects_v2(Bucket="b", Prefix="backups/"),
+    )
+    old_top = [
+        obj["Key"]
+        for obj in sorted(
+            old["Contents"], key=lambda obj: obj["LastModified"], reverse=True
+        )[:5]
+    ]
+    print(
+        f"single list call   calls {calls:4d}  {ms:8.2f}ms  "
+        f"correct={old_top == expected(bucket, 5)}"
+    )
+
+    for k in (1, 5, 20, 1200):
+        found, calls, ms = measure(
+            bucket,
+            lambda: backup_listing.latest_backups(bucket, "b", k),
+        )
+        ok = [obj["Key"] for obj in found] == expected(bucket, k)
+        failures += not ok
+        print(f"latest {k:<5d}       calls {calls:4d}  {ms:8.2f}ms  {ok=}")
+
+    for date in (f"{BUSY_DAY:%Y-%m-%d}", "2023-03-03", "2030-01-01"):
+        found, calls, ms = measure(
+            bucket,
+            lambda: backup_listing.list_partition(
+                bucket, "b", f"backups/{date}/"
+            ),
+        )
+        ok = [obj["Key"] for obj in found] == expected(bucket, None, date)
+        failures += not ok
+        print(
+            f"partition {date} calls {calls:4d}  {ms:8.2f}ms  "
+            f"{len(found)} keys  {ok=}"
+        )
+
+    empty = LocalS3()
+    ok = backup_listing.latest_backup(empty, "b") is None
+    failures += not ok
+    print(f"empty bucket       {ok=}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
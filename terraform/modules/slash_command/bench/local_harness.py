@@ -0,0 +1,233 @@
+"""Drive both halves of a deferred slash command locally.
+
+The acknowledgement half runs lambda_handler with a Function URL style
+event; the async re-invocation is captured by a Lambda stand-in and fed
+back into lambda_handler as the worker half, which posts its result to a
+local response_url server. AWS and GitHub calls go to in-process
+stand-ins, so no credentials are needed. The stand-ins are traced like
+real clients, and each half prints where its time went.
+
+    python bench/local_harness.py                 # status, start, list
+    python bench/local_harness.py "restart" "stop"
+    python bench/local_harness.py "status all" "restart creative"
+
+Three servers (survival, creative, event) on two clusters are registered
+unless SERVERS is already set.
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlencode
+
+from standins import LocalEcs, LocalElbv2, LocalLambda, LocalS3, _Paginator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "..", "fixtures", "python3.13")
+SHARED = os.path.join(HERE, "..", "..", "shared", "python3.13")
+DEFAULT_COMMANDS = ("status", "start", "list")
+FLEET = {
+    "survival": {"cluster": "minecraft", "service": "survival"},
+    "creative": {"cluster": "minecraft", "service": "creative"},
+    "event": {"cluster": "minecraft-event", "service": "event"},
+}
+SIGNING_SECRET = "local-signing-secret"
+FUNCTION_ARN = (
+    "arn:aws:lambda:ap-northeast-1:123456789012:function:"
+    "dispatch_workflow_from_slack-function"
+)
+
+
+class _ResponseUrlHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.messages.append(json.loads(body))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalGitHub:
+    """Session stand-in that accepts every dispatch without sending it."""
+
+    class _Response:
+        status_code = 204
+        text = ""
+        headers = {}
+
+    def __init__(self):
+        self.dispatches = []
+
+    def post(self, url, json=None, **kwargs):
+        self.dispatches.append(json)
+        return self._Response()
+
+
+class Traced:
+    """Record every public method call of a stand-in as a tracing span."""
+
+    def __init__(self, standin, service):
+        self._standin = standin
+        self._service = service
+
+    def __getattr__(self, name):
+        import tracing
+
+        if name == "get_paginator":
+            # ページごとの呼び出しも記録されるよう、自分経由で呼ばせる
+            return lambda operation: _Paginator(getattr(self, operation))
+        attr = getattr(self._standin, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with tracing.span(f"{self._service}.{name}"):
+                return attr(*args, **kwargs)
+
+        return call
+
+
+def spans_line(log):
+    """``ecs 2x 301.2ms, s3 1x 0.4ms`` from a tracing log line."""
+    services = {}
+    for span in log["spans"]:
+        service = span["name"].split(".", 1)[0]
+        calls, ms = services.get(service, (0, 0.0))
+        services[service] = (calls + 1, ms + span["ms"])
+    return (
+        ", ".join(
+            f"{service} {calls}x {ms:.1f}ms"
+            for service, (calls, ms) in services.items()
+        )
+        or "no outbound calls"
+    )
+
+
+class LambdaContext:
+    invoked_function_arn = FUNCTION_ARN
+
+
+def slash_event(command_text, response_url):
+    """A signed Function URL event the way Slack posts a slash command."""
+    body = urlencode(
+        {
+            "command": "/mc",
+            "user_name": "harness",
+            "text": command_text,
+            "response_url": response_url,
+        }
+    ).encode()
+    timestamp = str(int(time.time()))
+    signature = hmac.new(
+        SIGNING_SECRET.encode(),
+        f"v0:{timestamp}:".encode() + body,
+        hashlib.sha256,
+    ).hexdigest()
+    return {
+        "headers": {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature": f"v0={signature}",
+        },
+        "body": base64.b64encode(body).decode(),
+        "isBase64Encoded": True,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("commands", nargs="*", default=DEFAULT_COMMANDS)
+    parser.add_argument("--aws-rtt-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    sys.path[:0] = [FIXTURES, SHARED]
+    os.environ.setdefault("GITHUB_TOKEN", "local")
+    os.environ.setdefault("REPO_OWNER", "local")
+    os.environ.setdefault("REPO_NAME", "minecraft")
+    os.environ.setdefault("S3_BUCKET_NAME", "local-backups")
+    os.environ.setdefault("ECS_CLUSTER_NAME", "minecraft")
+    os.environ.setdefault("ECS_SERVICE_NAME", "minecraft")
+    os.environ.setdefault("SERVERS", json.dumps(FLEET))
+    import clients
+    import github_auth
+    import github_dispatch
+    import index
+    import slack_auth
+    import tracing
+
+    lambda_standin = LocalLambda()
+    standins = {
+        "lambda": lambda_standin,
+        "ecs": LocalEcs(args.aws_rtt_ms),
+        "elbv2": LocalElbv2(args.aws_rtt_ms),
+        "s3": LocalS3(
+            (
+                f"backups/2024-06-{day:02d}/minecraft-202406{day:02d}120000"
+                ".tar.gz",
+                None,
+                1 << 20,
+            )
+            for day in range(20, 25)
+        ),
+    }
+    for service_name, client in standins.items():
+        clients.register(service_name, Traced(client, service_name))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ResponseUrlHandler)
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    response_url = f"http://127.0.0.1:{server.server_port}/commands/T/1/x"
+    github = LocalGitHub()
+    sink = tracing.MemorySink()
+    tracing.set_sink(sink)
+
+    with (
+        mock.patch.object(
+            github_dispatch, "_session", Traced(github, "github")
+        ),
+        mock.patch.object(github_auth, "get_github_token", lambda: "local"),
+        mock.patch.object(
+            slack_auth, "get_slack_signing_secret", lambda: SIGNING_SECRET
+        ),
+    ):
+        for command_text in args.commands:
+            start = time.perf_counter()
+            ack = index.lambda_handler(
+                slash_event(command_text, response_url), LambdaContext()
+            )
+            ack_ms = (time.perf_counter() - start) * 1000
+            print(f"/mc {command_text}")
+            print(f"  ack     {ack_ms:8.1f}ms  {json.loads(ack['body'])}")
+            print(f"          {spans_line(sink.logs()[-1])}")
+            if not lambda_standin.invocations:
+                print("  (answered inline, nothing deferred)")
+                continue
+            payload = lambda_standin.invocations.pop()
+            start = time.perf_counter()
+            index.lambda_handler(payload, LambdaContext())
+            work_ms = (time.perf_counter() - start) * 1000
+            posted = server.messages.pop() if server.messages else None
+            print(
+                f"  worker  {work_ms:8.1f}ms  posted={posted is not None}  "
+                f"github dispatches={len(github.dispatches)}"
+            )
+            print(f"          {spans_line(sink.logs()[-1])}")
+            if posted:
+                first_line = posted["text"].strip().splitlines()[0]
+                print(f"          {first_line}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Time a retention prune of ~50k stale backups on a local S3 stand-in.
+
+The bucket holds a backup every few minutes for a couple of years, so
+nearly everything falls outside the default hourly/daily/weekly/monthly
+rules. Every S3 request sleeps a fixed round trip, which makes request
+count and parallelism what the timing measures. The kept set is checked
+against the rules afterwards.
+
+    python bench/retention.py
+    python bench/retention.py --keys 20000 --rtt-ms 80 --workers 1
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from standins import LocalS3
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "..", "fixtures", "python3.13")
+JST = timezone(timedelta(hours=+9), "JST")
+
+
+def make_bucket(keys, rtt_ms):
+    bucket = LocalS3(rtt_ms=rtt_ms)
+    newest = datetime(2024, 6, 24, 12, tzinfo=JST)
+    # 約2年分を等間隔に並べる
+    step = timedelta(days=730) / keys
+    for i in range(keys):
+        at = newest - step * i
+        bucket.put(
+            f"backups/{at:%Y-%m-%d}/minecraft-{at:%Y%m%d%H%M%S}.tar.gz",
+            at.astimezone(timezone.utc),
+            1 << 20,
+        )
+    bucket.put("backups/README.txt", size=10)
+    return bucket
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=50_000)
+    parser.add_argument("--rtt-ms", type=float, default=50.0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, FIXTURES)
+    import retention
+
+    bucket = make_bucket(args.keys, args.rtt_ms)
+    print(f"{len(bucket.keys)} keys, {args.rtt_ms}ms per request")
+
+    start = time.perf_counter()
+    plan, _ = retention.prune(bucket, "b")
+    dry_run_s = time.perf_counter() - start
+    print(
+        f"dry-run  {dry_run_s:6.2f}s  list {bucket.calls}  "
+        f"keep {len(plan.keep)}  delete {len(plan.delete)}"
+    )
+    if bucket.deletes:
+        sys.exit("dry-run deleted objects")
+
+    bucket.calls = 0
+    start = time.perf_counter()
+    plan, (deleted, errors) = retention.prune(
+        bucket, "b", apply=True, workers=args.workers
+    )
+    apply_s = time.perf_counter() - start
+    print(
+        f"apply    {apply_s:6.2f}s  list {bucket.calls}  "
+        f"delete_objects {bucket.deletes}  deleted {len(deleted)}  "
+        f"errors {len(errors)}"
+    )
+
+    remaining = set(bucket.keys)
+    expected = {obj["Key"] for obj in plan.keep} | {"backups/README.txt"}
+    ok = (
+        remaining == expected
+        and len(plan.keep)
+        <= sum(count for count, _ in retention.RULES.values()) + 1
+    )
+    print(f"remaining {len(remaining)}  {ok=}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""In-process stand-ins for the AWS clients used by the slash command."""
+
+import bisect
+import hashlib
+import io
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+
+class LocalLambda:
+    """Records async invocations instead of queueing them."""
+
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.invocations.append(json.loads(Payload))
+        return {"StatusCode": 202}
+
+
+class LocalEcs:
+    """Every service it is asked about exists, with its own task
+    definition and target group."""
+
+    def __init__(self, rtt_ms):
+        self.rtt = rtt_ms / 1000
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _round_trip(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.rtt)
+
+    def describe_services(self, cluster, services):
+        self._round_trip()
+        now = datetime.now(timezone.utc)
+        return {
+            "services": [
+                {
+                    "serviceName": service,
+                    "status": "ACTIVE",
+                    "runningCount": 1,
+                    "desiredCount": 1,
+                    "taskDefinition": f"arn:aws:ecs:local:0:task/{service}:7",
+                    "loadBalancers": [
+                        {
+                            "targetGroupArn": "arn:aws:elasticloadbalancing:"
+                            f"local:0:targetgroup/{service}/abc"
+                        }
+                    ],
+                    "deployments": [{"createdAt": now}],
+                }
+                for service in services
+            ],
+            "failures": [],
+        }
+
+    def describe_task_definition(self, taskDefinition):
+        self._round_trip()
+        return {
+            "taskDefinition": {
+                "revision": 7,
+                "registeredAt": datetime.now(timezone.utc),
+                "containerDefinitions": [
+                    {
+                        "name": "minecraft",
+                        "environment": [
+                            {"name": "VERSION", "value": "1.21.1"},
+                            {"name": "SEED", "value": "12345"},
+                        ],
+                        "entryPoint": ["/entrypoint2.sh"],
+                    }
+                ],
+            }
+        }
+
+    def list_task_definitions(self, **kwargs):
+        self._round_trip()
+        return {"taskDefinitionArns": ["arn:aws:ecs:local:0:task/mc:7"]}
+
+    def update_service(self, **kwargs):
+        self._round_trip()
+        return {}
+
+
+class LocalElbv2:
+    def __init__(self, rtt_ms):
+        self.rtt = rtt_ms / 1000
+
+    def describe_target_health(self, TargetGroupArn):
+        time.sleep(self.rtt)
+        return {
+            "TargetHealthDescriptions": [
+                {
+                    "Target": {"Id": "10.0.0.10"},
+                    "TargetHealth": {"State": "healthy"},
+                }
+            ]
+        }
+
+
+class LocalS3:
+    """Sorted in-memory bucket with list_objects_v2 paging semantics.
+
+    Pages hold at most 1000 keys and CommonPrefixes count against the
+    page size like on S3, so call counts are comparable to the real
+    thing. ``calls`` counts list requests and ``deletes`` DeleteObjects
+    requests; both sleep ``rtt_ms``. Bodies are only kept for objects put
+    with one; others read back as zero bytes of their size.
+    """
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, objects=(), rtt_ms=0.0):
+        self.rtt = rtt_ms / 1000
+        self.deletes = 0
+        self.objects = {}
+        self.bodies = {}
+        self.keys = []
+        self.lock = threading.Lock()
+        self.calls = 0
+        for key, last_modified, size in objects:
+            self.put(key, last_modified, size)
+
+    def put(self, key, last_modified=None, size=0, body=None):
+        if key not in self.objects:
+            bisect.insort(self.keys, key)
+        self.objects[key] = {
+            "Key": key,
+            "LastModified": last_modified or datetime.now(timezone.utc),
+            "Size": size if body is None else len(body),
+            "ETag": f'"{hashlib.md5(body or key.encode()).hexdigest()}"',
+        }
+        if body is not None:
+            self.bodies[key] = body
+
+    @staticmethod
+    def _error(code, operation):
+        return ClientError(
+            {"Error": {"Code": code, "Message": code}}, operation
+        )
+
+    def _get(self, key, operation):
+        if key not in self.objects:
+            raise self._error("NoSuchKey", operation)
+        return self.objects[key]
+
+    def head_object(self, Bucket, Key):
+        obj = self._get(Key, "HeadObject")
+        return {
+            "ContentLength": obj["Size"],
+            "LastModified": obj["LastModified"],
+            "ETag": obj["ETag"],
+        }
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, Range=None):
+        obj = self._get(Key, "GetObject")
+        if IfNoneMatch == obj["ETag"]:
+            raise self._error("304", "GetObject")
+        body = self.bodies.get(Key)
+        if body is None:
+            body = bytes(obj["Size"])
+        if Range:
+            first, _, last = Range.removeprefix("bytes=").partition("-")
+            # memoryviewで切り出し、範囲分だけをコピーする
+            body = bytes(
+                memoryview(body)[int(first) : int(last) + 1 if last else None]
+            )
+        return {
+            "Body": io.BytesIO(body),
+            "ContentLength": len(body),
+            "ETag": obj["ETag"],
+            "LastModified": obj["LastModified"],
+        }
+
+    def put_object(
+        self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs
+    ):
+        with self.lock:
+            current = self.objects.get(Key)
+            if IfMatch is not None and (
+                current is None or current["ETag"] != IfMatch
+            ):
+                raise self._error("PreconditionFailed", "PutObject")
+            if IfNoneMatch == "*" and current is not None:
+                raise self._error("PreconditionFailed", "PutObject")
+            self.put(Key, body=bytes(Body))
+        return {"ETag": self.objects[Key]["ETag"]}
+
+    def delete_object(self, Bucket, Key):
+        with self.lock:
+            if Key in self.objects:
+                del self.objects[Key]
+                self.bodies.pop(Key, None)
+                self.keys.remove(Key)
+        return {}
+
+    def list_objects_v2(
+        self,
+        Bucket,
+        Prefix="",
+        Delimiter=None,
+        ContinuationToken=None,
+        StartAfter=None,
+        MaxKeys=PAGE_SIZE,
+    ):
+        with self.lock:
+            self.calls += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+        marker = ContinuationToken or StartAfter or ""
+        index = max(
+            bisect.bisect_right(self.keys, marker),
+            bisect.bisect_left(self.keys, Prefix),
+        )
+        contents, prefixes = [], []
+        while index < len(self.keys) and len(contents) + len(prefixes) < min(
+            MaxKeys, self.PAGE_SIZE
+        ):
+            key = self.keys[index]
+            if not key.startswith(Prefix):
+                break
+            rest = key[len(Prefix) :]
+            if Delimiter and Delimiter in rest:
+                common = Prefix + rest[: rest.index(Delimiter) + 1]
+                prefixes.append({"Prefix": common})
+                # 同じCommonPrefix配下のキーは読み飛ばす
+                index = bisect.bisect_left(self.keys, common + "\uffff")
+                marker = common + "\uffff"
+                continue
+            contents.append(self.objects[key])
+            marker = key
+            index += 1
+        truncated = index < len(self.keys) and self.keys[index].startswith(
+            Prefix
+        )
+        page = {"KeyCount": len(contents) + len(prefixes)}
+        if contents:
+            page["Contents"] = contents
+        if prefixes:
+            page["CommonPrefixes"] = prefixes
+        if truncated:
+            page["IsTruncated"] = True
+            page["NextContinuationToken"] = marker
+        return page
+
+    def delete_objects(self, Bucket, Delete):
+        if len(Delete["Objects"]) > self.PAGE_SIZE:
+            raise self._error("MalformedXML", "DeleteObjects")
+        if self.rtt:
+            time.sleep(self.rtt)
+        removed = {obj["Key"] for obj in Delete["Objects"]}
+        with self.lock:
+            self.deletes += 1
+            for key in removed:
+                self.objects.pop(key, None)
+                self.bodies.pop(key, None)
+            self.keys = [key for key in self.keys if key not in removed]
+        if Delete.get("Quiet"):
+            return {}
+        return {"Deleted": [{"Key": key} for key in removed]}
+
+    def get_paginator(self, operation):
+        return _Paginator(getattr(self, operation))
+
+
+class _Paginator:
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.operation(**kwargs)
+            yield page
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
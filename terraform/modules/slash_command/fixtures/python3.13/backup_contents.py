@@ -0,0 +1,242 @@
+"""List the members of a backup tar.gz without downloading it.
+
+The object is read front to back through ranged GETs of CHUNK_SIZE, with
+the next range already in flight while the current one is decompressed,
+so at most two chunks are held at a time and nothing touches disk.
+Backups written by parallel compressors are several concatenated gzip
+members; GunzipStream restarts the decompressor at each member boundary
+(tarfile's own "r|gz" stops after the first). Reading stops at
+``max_bytes`` of the object and the listing is marked truncated.
+
+Incremental backups (``*.manifest.json.gz``) already list every file,
+so for those only the manifest is read.
+"""
+
+import gzip
+import io
+import json
+import os
+import tarfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backup_listing import is_manifest
+
+CHUNK_SIZE = 8 * 1024 * 1024
+MAX_BYTES = int(os.environ.get("CONTENTS_MAX_BYTES", str(1024**3)))
+# 展開している間に先読みしておく範囲の数
+PREFETCH = 1
+GUNZIP_READ_SIZE = 256 * 1024
+
+
+# --- streams: backup_tool.pyが正。slash_commandのbackup_contents.pyに同じものを置く
+class OrderedRangeReader(io.RawIOBase):
+    """Read-only stream of an S3 object fetched as concurrent ranged GETs.
+
+    Up to ``concurrency`` chunks are in flight; they are handed out in
+    object order, so the consumer sees one sequential stream and at most
+    ``concurrency`` chunks besides the one being read are held in memory.
+    Only the first ``size`` bytes are read. With ``digest`` (a hashlib
+    object) the bytes are hashed as they are consumed.
+    """
+
+    def __init__(
+        self, s3, bucket, key, size, chunk_size, concurrency, digest=None
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.chunk_size = chunk_size
+        self.digest = digest
+        self.bytes_read = 0
+        self.requests = 0
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.window = deque()
+        self.next_offset = 0
+        self.chunk = memoryview(b"")
+        for _ in range(concurrency):
+            self._fetch_next()
+
+    def readable(self):
+        return True
+
+    def _fetch(self, first, last):
+        body = self.s3.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={first}-{last}"
+        )["Body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        if len(data) != last - first + 1:
+            raise IOError(f"short read at {first}: {len(data)} bytes")
+        return data
+
+    def _fetch_next(self):
+        if self.next_offset >= self.size:
+            return
+        first = self.next_offset
+        last = min(first + self.chunk_size, self.size) - 1
+        self.next_offset = last + 1
+        self.requests += 1
+        self.window.append(self.executor.submit(self._fetch, first, last))
+
+    def readinto(self, b):
+        if not self.chunk:
+            if not self.window:
+                return 0
+            data = self.window.popleft().result()
+            # 1つ受け取ったら次の範囲を投げて、常にconcurrency個を先読みする
+            self._fetch_next()
+            if self.digest is not None:
+                self.digest.update(data)
+            self.chunk = memoryview(data)
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        self.bytes_read += n
+        return n
+
+    def close(self):
+        # 読み終える前に閉じたときは、先読み中のGETを待たない
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().close()
+
+
+class GunzipStream(io.RawIOBase):
+    """Decompress a stream of one or more concatenated gzip members.
+
+    Parallel compressors write one member per block, and tarfile's own
+    "r|gz" stops after the first; ``members`` counts them. A stream that
+    ends inside a member raises EOFError.
+    """
+
+    def __init__(self, raw, read_size=1024 * 1024):
+        self.raw = raw
+        self.read_size = read_size
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.pending = b""
+        self.members = 1
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            if self.decompressor.eof:
+                # 次のgzipメンバーの先頭から展開し直す
+                data = self.decompressor.unused_data or self.raw.read(
+                    self.read_size
+                )
+                if not data:
+                    return 0
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self.members += 1
+            else:
+                data = self.decompressor.unconsumed_tail or self.raw.read(
+                    self.read_size
+                )
+                if not data:
+                    raise EOFError("compressed stream ended early")
+            self.pending = self.decompressor.decompress(data, len(b))
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+# --- streams end
+
+
+class Contents:
+    """What was found in the archive; only the first ``keep`` paths are
+    kept, the totals cover every member read."""
+
+    def __init__(self, key, object_size, keep):
+        self.key = key
+        self.object_size = object_size
+        self.keep = keep
+        self.members = []
+        self.files = 0
+        self.total_bytes = 0
+        # ディメンション(先頭ディレクトリ) -> [ファイル数, バイト数, regionファイル数]
+        self.dimensions = {}
+        self.bytes_read = 0
+        self.requests = 0
+        self.gzip_members = 0
+        self.truncated = False
+        # 差分バックアップ(マニフェスト)のときだけ使う
+        self.chunks = None
+        self.packs = None
+
+    def add(self, path, size):
+        self.files += 1
+        self.total_bytes += size
+        if len(self.members) < self.keep:
+            self.members.append((path, size))
+        totals = self.dimensions.setdefault(path.split("/", 1)[0], [0, 0, 0])
+        totals[0] += 1
+        totals[1] += size
+        if path.endswith(".mca") and "/region/" in path:
+            totals[2] += 1
+
+
+def inspect(s3, bucket, key, max_bytes=None, keep=50, on_member=None):
+    """Contents of the tar.gz at ``key``, reading at most ``max_bytes``.
+
+    ``on_member`` is called with each regular file's TarInfo as soon as
+    its header has been read.
+    """
+    if is_manifest(key):
+        return inspect_manifest(s3, bucket, key, keep, on_member)
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    contents = Contents(key, size, keep)
+    truncated = size > max_bytes
+    reader = OrderedRangeReader(
+        s3, bucket, key, min(size, max_bytes), CHUNK_SIZE, PREFETCH
+    )
+    stream = GunzipStream(reader, GUNZIP_READ_SIZE)
+    try:
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                contents.add(member.name, member.size)
+                if on_member is not None:
+                    on_member(member)
+                # ストリームモードでは読み終えたTarInfoを溜め込まない
+                tar.members = []
+    except (tarfile.ReadError, EOFError, zlib.error):
+        # 上限で打ち切った場合はアーカイブの途中で終わるのが正常
+        if not truncated:
+            raise
+    finally:
+        reader.close()
+    contents.truncated = truncated
+    contents.bytes_read = reader.bytes_read
+    contents.requests = reader.requests
+    contents.gzip_members = stream.members
+    return contents
+
+
+def inspect_manifest(s3, bucket, key, keep=50, on_member=None):
+    """Contents of an incremental backup, from its manifest alone.
+
+    ``on_member`` is called with each file's manifest entry.
+    """
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    manifest = json.loads(gzip.decompress(body))
+    contents = Contents(key, len(body), keep)
+    contents.chunks = 0
+    for entry in manifest["files"]:
+        contents.add(entry["path"], entry["size"])
+        contents.chunks += len(entry.get("chunks", ()))
+        if on_member is not None:
+            on_member(entry)
+    contents.packs = len(manifest["packs"])
+    contents.bytes_read = len(body)
+    contents.requests = 1
+    return contents
@@ -0,0 +1,91 @@
+"""Find backups under the ``backups/YYYY-MM-DD/`` date partitions.
+
+Backups are written by docker/minecraft/scripts as
+``<prefix>/<YYYY-MM-DD>/minecraft-<YYYYmmddHHMMSS>.tar.gz``, or as
+``minecraft-<YYYYmmddHHMMSS>.manifest.json.gz`` for incremental backups
+whose chunks live in packs under ``chunks/``. Instead of
+listing the whole prefix (which silently truncates at 1000 keys), the
+partitions are walked newest-first and the walk stops as soon as the
+requested number of backups is known.
+"""
+
+import heapq
+import re
+from datetime import timedelta, timezone
+
+BACKUP_PREFIX = "backups/"
+PARTITION = re.compile(r"(\d{4}-\d{2}-\d{2})/$")
+BACKUP_TIMESTAMP = re.compile(
+    r"minecraft-(\d{14})\.(?:tar\.gz|manifest\.json\.gz)$"
+)
+MANIFEST_SUFFIX = ".manifest.json.gz"
+CHUNK_PREFIX = "chunks/"
+JST = timezone(timedelta(hours=+9), "JST")
+
+
+def is_manifest(key):
+    return key.endswith(MANIFEST_SUFFIX)
+
+
+def backup_timestamp(obj):
+    """YYYYmmddHHMMSS of a backup, from its name or else LastModified."""
+    match = BACKUP_TIMESTAMP.search(obj["Key"])
+    if match:
+        return match.group(1)
+    # スクリプトはJSTで名前を付けているので、揃えて比較できるようにする
+    return obj["LastModified"].astimezone(JST).strftime("%Y%m%d%H%M%S")
+
+
+def _pages(s3_client, **kwargs):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return paginator.paginate(**kwargs)
+
+
+def list_partitions(s3_client, bucket, prefix=BACKUP_PREFIX):
+    """Date partition prefixes under ``prefix``, newest first."""
+    partitions = [
+        common["Prefix"]
+        for page in _pages(
+            s3_client, Bucket=bucket, Prefix=prefix, Delimiter="/"
+        )
+        for common in page.get("CommonPrefixes", [])
+        if PARTITION.search(common["Prefix"])
+    ]
+    return sorted(partitions, reverse=True)
+
+
+def list_partition(s3_client, bucket, partition):
+    """Every object in one partition (all pages), newest first."""
+    objs = [
+        obj
+        for page in _pages(s3_client, Bucket=bucket, Prefix=partition)
+        for obj in page.get("Contents", [])
+    ]
+    return sorted(objs, key=backup_timestamp, reverse=True)
+
+
+def latest_backups(s3_client, bucket, k=5, prefix=BACKUP_PREFIX):
+    """The ``k`` newest backups, newest first.
+
+    Partitions are dated, so once a partition has filled the top-k no
+    older partition can contribute and the walk stops there.
+    """
+    # キーは一意なので順序は (timestamp, key) で決まり、obj同士は比較されない
+    heap = []
+    for partition in list_partitions(s3_client, bucket, prefix):
+        for page in _pages(s3_client, Bucket=bucket, Prefix=partition):
+            for obj in page.get("Contents", []):
+                item = (backup_timestamp(obj), obj["Key"], obj)
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, item)
+        if len(heap) >= k:
+            break
+    return [obj for _, _, obj in sorted(heap, reverse=True)]
+
+
+def latest_backup(s3_client, bucket, prefix=BACKUP_PREFIX):
+    """The newest backup object, or None when there is none."""
+    found = latest_backups(s3_client, bucket, 1, prefix)
+    return found[0] if found else None
@@ -0,0 +1,164 @@
+"""Backup catalog kept as one object: ``catalog/backups.jsonl``.
+
+docker/minecraft/scripts/catalog.sh appends one JSON line per uploaded
+backup (key, size, timestamp, sha256, worlds), so list/show can answer
+from a single GET instead of a listing plus one HEAD per key. The parsed
+catalog is cached across warm invocations and revalidated by ETag.
+"""
+
+import json
+import logging
+import threading
+
+from botocore.exceptions import ClientError
+
+from backup_listing import BACKUP_PREFIX, backup_timestamp, is_manifest
+
+logger = logging.getLogger()
+
+CATALOG_KEY = "catalog/backups.jsonl"
+CONTENT_TYPE = "application/x-ndjson"
+MAX_ATTEMPTS = 3
+
+_lock = threading.Lock()
+_entries = []
+_etag = None
+
+
+def load(s3_client, bucket):
+    """Catalog entries ordered oldest first ([] when there is none yet)."""
+    global _entries, _etag
+    with _lock:
+        kwargs = {"Bucket": bucket, "Key": CATALOG_KEY}
+        if _etag is not None:
+            kwargs["IfNoneMatch"] = _etag
+        try:
+            obj = s3_client.get_object(**kwargs)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("304", "NotModified"):
+                return _entries
+            if code in ("404", "NoSuchKey"):
+                _entries, _etag = [], None
+                return _entries
+            raise
+        _entries = parse(obj["Body"].read().decode("utf-8"))
+        _etag = obj["ETag"]
+        return _entries
+
+
+def parse(text):
+    entries = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            key = entry["key"]
+            if not isinstance(entry["timestamp"], str):
+                raise ValueError("timestamp")
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"skipping catalog line {number}: {line[:200]}")
+            continue
+        entries[key] = entry
+    return sorted(entries.values(), key=lambda e: (e["timestamp"], e["key"]))
+
+
+def dump(entries):
+    return "".join(
+        json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries
+    )
+
+
+def find(entries, key):
+    for entry in entries:
+        if entry["key"] == key:
+            return entry
+    return None
+
+
+def between(entries, start_date, end_date):
+    """Entries whose backup date is within [start_date, end_date].
+
+    Dates are YYYY-MM-DD strings, compared against the JST timestamp in
+    the backup name.
+    """
+    start = start_date.replace("-", "")
+    end = end_date.replace("-", "")
+    return [e for e in entries if start <= e["timestamp"][:8] <= end]
+
+
+def save(s3_client, bucket, entries, if_match=None):
+    global _entries, _etag
+    kwargs = {
+        "Bucket": bucket,
+        "Key": CATALOG_KEY,
+        "Body": dump(entries).encode("utf-8"),
+        "ContentType": CONTENT_TYPE,
+    }
+    if if_match is not None:
+        kwargs["IfMatch"] = if_match
+    result = s3_client.put_object(**kwargs)
+    with _lock:
+        _entries, _etag = list(entries), result["ETag"]
+
+
+def remove(s3_client, bucket, keys):
+    """Drop ``keys`` from the catalog; returns how many entries went."""
+    keys = set(keys)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        entries = load(s3_client, bucket)
+        kept = [e for e in entries if e["key"] not in keys]
+        if len(kept) == len(entries):
+            return 0
+        try:
+            # コンテナ側の追記と競合したら読み直してやり直す
+            save(s3_client, bucket, kept, if_match=_etag)
+            return len(entries) - len(kept)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code not in (
+                "412",
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                raise
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.info(f"catalog changed while updating, retry {attempt}")
+
+
+def rebuild(s3_client, bucket, prefix=BACKUP_PREFIX):
+    """Rewrite the catalog from a full listing of ``prefix``.
+
+    A listing has no checksum, world names or incremental-backup details,
+    so those are carried over from the current catalog where it still
+    has the key and left null (or absent) otherwise.
+    """
+    try:
+        known = {e["key"]: e for e in load(s3_client, bucket)}
+    except ClientError as e:
+        logger.warning(f"rebuilding without the current catalog: {e}")
+        known = {}
+    paginator = s3_client.get_paginator("list_objects_v2")
+    entries = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            previous = known.get(obj["Key"], {})
+            entry = {
+                "key": obj["Key"],
+                "size": obj["Size"],
+                "timestamp": backup_timestamp(obj),
+                "sha256": previous.get("sha256"),
+                "worlds": previous.get("worlds"),
+            }
+            if is_manifest(obj["Key"]):
+                # sizeはpackを含めた増分なので、わかっていればそちらを残す
+                entry["format"] = "chunks"
+                for field in ("size", "world_size"):
+                    if previous.get(field) is not None:
+                        entry[field] = previous[field]
+            entries.append(entry)
+    entries.sort(key=lambda e: (e["timestamp"], e["key"]))
+    save(s3_client, bucket, entries)
+    return entries
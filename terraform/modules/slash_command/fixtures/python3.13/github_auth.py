@@ -1,67 +1,124 @@
+import threading
 import time
-import boto3
+from datetime import datetime
+import clients
+import tracing
 import json
 import logging
 import os
 import jwt
-from urllib.request import Request, urlopen
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from urllib.request import Request
 from urllib.error import URLError, HTTPError
 from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Installation tokens live for one hour; refresh a little before expiry so a
+# token handed out is still valid when the dispatch request reaches GitHub.
+REFRESH_MARGIN_SECONDS = 300
+
+# warm invocations reuse the secret, the parsed key and the current token
+_lock = threading.Lock()
+_secret = None
+_private_key = None
+_token = None
+_token_expires_at = 0.0
+
 
 def get_github_token():
     """
     Get a GitHub App Installation Token using credentials stored in AWS Secrets Manager.
     Secrets Manager must store a JSON with keys: GITHUB_APP_PRIVATE_KEY, GITHUB_APP_ID, GITHUB_APP_INSTALLATION_ID
     The environment variable SECRET_ID must be set to the secret name.
+
+    The token is cached until shortly before its expires_at. Concurrent
+    callers that find it expired wait for a single refresh.
     """
+    global _token, _token_expires_at
+    if _token is not None and time.time() < _token_expires_at:
+        return _token
+    with _lock:
+        # 待っている間に別スレッドが更新していればそれを使う
+        if _token is not None and time.time() < _token_expires_at:
+            return _token
+        try:
+            token, expires_at = request_installation_token()
+        except HTTPError as e:
+            if e.code != 401:
+                raise
+            # 秘密鍵がローテーションされた可能性があるので読み直して再試行
+            logger.info("GitHub rejected the app JWT, reloading secret")
+            clear_cache()
+            token, expires_at = request_installation_token()
+        _token = token
+        _token_expires_at = expires_at - REFRESH_MARGIN_SECONDS
+        return _token
+
+
+def clear_cache():
+    global _secret, _private_key, _token, _token_expires_at
+    _secret = None
+    _private_key = None
+    _token = None
+    _token_expires_at = 0.0
+
+
+def get_app_secret():
+    global _secret, _private_key
+    if _secret is not None:
+        return _secret, _private_key
     try:
-        client = boto3.client(
-            service_name="secretsmanager", region_name="ap-northeast-1"
-        )
+        client = clients.get("secretsmanager", region_name="ap-northeast-1")
         SecretId = os.environ["SECRET_ID"]
         get_secret_value_response = client.get_secret_value(SecretId=SecretId)
     except ClientError as e:
         logger.error(e)
         raise e
-    else:
-        secret = json.loads(get_secret_value_response["SecretString"])
-        GITHUB_APP_PRIVATE_KEY = secret["GITHUB_APP_PRIVATE_KEY"]
-        GITHUB_APP_ID = secret["GITHUB_APP_ID"]
-        GITHUB_APP_INSTALLATION_ID = secret["GITHUB_APP_INSTALLATION_ID"]
-        # Create JWT
-        payload = {
-            "iat": int(time.time()),
-            "exp": int(time.time()) + 600,
-            "iss": GITHUB_APP_ID,
-        }
-        encoded_jwt = jwt.encode(
-            payload, GITHUB_APP_PRIVATE_KEY, algorithm="RS256"
-        )
+    secret = json.loads(get_secret_value_response["SecretString"])
+    _private_key = load_pem_private_key(
+        secret["GITHUB_APP_PRIVATE_KEY"].encode("utf-8"), password=None
+    )
+    _secret = secret
+    return _secret, _private_key
 
-        # Get Access Token
-        url = (
-            "https://api.github.com/app/installations/"
-            + f"{GITHUB_APP_INSTALLATION_ID}/access_tokens"
-        )
-        headers = {
-            "Authorization": f"Bearer {encoded_jwt}",
-            "Accept": "application/vnd.github+json",
-        }
-        request_obj = Request(url, headers=headers, method="POST")
-        try:
-            response = urlopen(request_obj)
-            response_body = response.read().decode("utf-8")
-            response_json = json.loads(response_body)
-            GITHUB_ACCESS_TOKEN = response_json["token"]
-        except HTTPError as e:
-            logger.error(e)
-            raise e
-        except URLError as e:
-            logger.error(e)
-            raise e
-        else:
-            return GITHUB_ACCESS_TOKEN
+
+def request_installation_token():
+    """Exchange a freshly signed app JWT for (token, expires_at epoch)."""
+    secret, private_key = get_app_secret()
+    GITHUB_APP_ID = secret["GITHUB_APP_ID"]
+    GITHUB_APP_INSTALLATION_ID = secret["GITHUB_APP_INSTALLATION_ID"]
+    # Create JWT
+    payload = {
+        "iat": int(time.time()),
+        "exp": int(time.time()) + 600,
+        "iss": GITHUB_APP_ID,
+    }
+    encoded_jwt = jwt.encode(payload, private_key, algorithm="RS256")
+
+    # Get Access Token
+    url = (
+        "https://api.github.com/app/installations/"
+        + f"{GITHUB_APP_INSTALLATION_ID}/access_tokens"
+    )
+    headers = {
+        "Authorization": f"Bearer {encoded_jwt}",
+        "Accept": "application/vnd.github+json",
+    }
+    request_obj = Request(url, headers=headers, method="POST")
+    try:
+        response = tracing.urlopen(request_obj, name="github.access_token")
+        response_body = response.body.decode("utf-8")
+        response_json = json.loads(response_body)
+    except HTTPError as e:
+        logger.error(e)
+        raise e
+    except URLError as e:
+        logger.error(e)
+        raise e
+    else:
+        expires_at = datetime.fromisoformat(
+            response_json["expires_at"]
+        ).timestamp()
+        return response_json["token"], expires_at
@@ -0,0 +1,245 @@
+"""repository_dispatch client for the GitHub Actions workflows.
+
+All dispatches share one keep-alive ``requests.Session`` per warm
+container. urllib3 retries with backoff only where GitHub cannot have
+accepted the event: connection errors and 503. Other 5xx and read
+timeouts may follow an accepted dispatch, so retrying them could start a
+second workflow run; they fail and release the claim. GitHub's secondary
+rate limit (403/429 with Retry-After or an exhausted quota) is waited
+out.
+
+Identical dispatches (same event_type and client_payload) within
+DISPATCH_DEBOUNCE_SECONDS are coalesced, which absorbs double clicks and
+Slack retries. Concurrent slash commands run in different Lambda
+containers, so the claim is an S3 marker object written with a
+conditional put; an in-memory copy saves the S3 round trip for repeats
+in the same container.
+
+Events that change the same server state share one marker ("lane"), so
+``stop`` after ``start`` overwrites the start marker instead of being
+merged into it, and a later ``start`` is dispatched again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import clients
+import tracing
+
+logger = logging.getLogger()
+
+API_URL = "https://api.github.com"
+TIMEOUT_SECONDS = 10
+DEBOUNCE_SECONDS = int(os.environ.get("DISPATCH_DEBOUNCE_SECONDS", "30"))
+LOCK_PREFIX = "locks/dispatch/"
+MAX_RATE_LIMIT_WAIT_SECONDS = 60
+_CONFLICT_CODES = ("412", "PreconditionFailed", "ConditionalRequestConflict")
+# 逆向きの操作は同じレーンのマーカーを上書きし、直前の操作には合流しない
+LANES = {"start": "power", "stop": "power"}
+
+_lock = threading.Lock()
+_session = None
+# lane -> (digest, 直近にclaimした(またはS3で見つけた)時刻)
+_recent = {}
+
+
+class DispatchResult:
+    __slots__ = ("event_type", "status_code", "coalesced", "age")
+
+    def __init__(self, event_type, status_code=None, coalesced=False, age=0):
+        self.event_type = event_type
+        self.status_code = status_code
+        self.coalesced = coalesced
+        self.age = age
+
+    @property
+    def ok(self):
+        return self.status_code == 204
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                retry = Retry(
+                    total=3,
+                    connect=3,
+                    # 送信後のエラーはGitHubが受け付け済みかもしれないので再送しない
+                    read=0,
+                    other=0,
+                    backoff_factor=0.5,
+                    status_forcelist=(503,),
+                    allowed_methods=frozenset({"POST"}),
+                    raise_on_status=False,
+                )
+                session = requests.Session()
+                session.mount(
+                    "https://",
+                    HTTPAdapter(max_retries=retry, pool_maxsize=4),
+                )
+                _session = tracing.instrument_session(
+                    session, "github.dispatch"
+                )
+    return _session
+
+
+def dispatch(event_type, token, client_payload=None):
+    """Send one repository_dispatch unless an identical one is in flight."""
+    data = {"event_type": event_type}
+    if client_payload is not None:
+        data["client_payload"] = client_payload
+    digest = hashlib.sha256(
+        json.dumps(data, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:32]
+    lane = LANES.get(event_type, digest)
+
+    claimed, age = claim(lane, digest)
+    if not claimed:
+        logger.info(f"coalesced {event_type} dispatched {age:.0f}s ago")
+        return DispatchResult(event_type, coalesced=True, age=age)
+
+    repo_owner = os.environ["REPO_OWNER"]
+    repo_name = os.environ["REPO_NAME"]
+    url = f"{API_URL}/repos/{repo_owner}/{repo_name}/dispatches"
+    headers = {
+        "Authorization": f"bearer {token}",
+        "Accept": "application/vnd.github.v3+json",
+    }
+    try:
+        api_response = post(url, headers, data)
+    except requests.RequestException as e:
+        logger.error(f"dispatch {event_type} failed: {e}")
+        release(lane, digest)
+        return DispatchResult(event_type)
+    if api_response.status_code != 204:
+        logger.error(
+            f"dispatch {event_type} returned {api_response.status_code}: "
+            f"{api_response.text[:500]}"
+        )
+        # 失敗したものはすぐにやり直せるようにする
+        release(lane, digest)
+    return DispatchResult(event_type, api_response.status_code)
+
+
+def post(url, headers, data):
+    session = get_session()
+    api_response = session.post(
+        url, headers=headers, json=data, timeout=TIMEOUT_SECONDS
+    )
+    wait = rate_limit_wait(api_response)
+    if wait is not None and wait <= MAX_RATE_LIMIT_WAIT_SECONDS:
+        logger.info(f"GitHub rate limited the dispatch, retry in {wait}s")
+        time.sleep(wait)
+        api_response = session.post(
+            url, headers=headers, json=data, timeout=TIMEOUT_SECONDS
+        )
+    return api_response
+
+
+def rate_limit_wait(api_response):
+    """Seconds to wait for a secondary rate limit, or None."""
+    if api_response.status_code not in (403, 429):
+        return None
+    headers = api_response.headers
+    retry_after = headers.get("retry-after")
+    if retry_after is not None:
+        try:
+            return max(0, int(retry_after))
+        except ValueError:
+            return None
+    if headers.get("x-ratelimit-remaining") == "0":
+        reset = int(headers.get("x-ratelimit-reset", "0"))
+        return max(0, reset - int(time.time()))
+    if api_response.status_code == 429:
+        return 1
+    return None
+
+
+def claim(lane, digest):
+    """(True, 0) when this dispatch may go ahead, else (False, age).
+
+    Only the same ``digest`` in ``lane`` within DEBOUNCE_SECONDS is
+    coalesced; a different event in the lane takes the marker over.
+    """
+    now = time.time()
+    with _lock:
+        recent = _recent.get(lane)
+        if (
+            recent is not None
+            and recent[0] == digest
+            and now - recent[1] < DEBOUNCE_SECONDS
+        ):
+            return False, now - recent[1]
+        _recent[lane] = (digest, now)
+
+    bucket = os.environ.get("S3_BUCKET_NAME")
+    if not bucket:
+        return True, 0
+    try:
+        claimed, age = _claim_marker(
+            bucket, f"{LOCK_PREFIX}{lane}", digest, now
+        )
+    except ClientError as e:
+        # マーカーが使えなくても、dispatch自体は止めない
+        logger.warning(f"dispatch debounce marker unavailable: {e}")
+        return True, 0
+    if not claimed:
+        with _lock:
+            _recent[lane] = (digest, now - age)
+    return claimed, age
+
+
+def _claim_marker(bucket, key, digest, now):
+    s3_client = clients.get("s3")
+    body = json.dumps({"claimed_at": now, "digest": digest}).encode("utf-8")
+    try:
+        s3_client.put_object(
+            Bucket=bucket, Key=key, Body=body, IfNoneMatch="*"
+        )
+        return True, 0
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in _CONFLICT_CODES:
+            raise
+    current = s3_client.get_object(Bucket=bucket, Key=key)
+    try:
+        claimed_digest = json.loads(current["Body"].read()).get("digest")
+    except ValueError:
+        claimed_digest = None
+    age = max(0.0, now - current["LastModified"].timestamp())
+    if claimed_digest == digest and age < DEBOUNCE_SECONDS:
+        return False, age
+    try:
+        # 期限切れか別の操作のマーカーは、読んだものと同じ場合だけ上書きする
+        s3_client.put_object(
+            Bucket=bucket, Key=key, Body=body, IfMatch=current["ETag"]
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in _CONFLICT_CODES:
+            raise
+        return False, 0.0
+    return True, 0
+
+
+def release(lane, digest):
+    with _lock:
+        if _recent.get(lane, (None,))[0] == digest:
+            _recent.pop(lane, None)
+    bucket = os.environ.get("S3_BUCKET_NAME")
+    if not bucket:
+        return
+    try:
+        clients.get("s3").delete_object(
+            Bucket=bucket, Key=f"{LOCK_PREFIX}{lane}"
+        )
+    except ClientError as e:
+        logger.warning(f"failed to release dispatch marker: {e}")
@@ -1,62 +1,232 @@
 import json
 import os
-import boto3.exceptions
-import requests
-from urllib.parse import unquote_plus
-import base64
+from urllib.request import Request
 from datetime import datetime, timezone, timedelta
-import boto3
-from botocore.exceptions import ClientError
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import clients
+import servers
+import slack_auth
+import tracing
+from request_context import RequestContext
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# 期間指定のlistで一度に表示する件数の上限(Slackのメッセージ長対策)
+MAX_LIST_LINES = 50
+
+# statusの問い合わせを並列に投げるためのプール(warm起動の間使い回す)
+# 全サーバー分のタスク定義とヘルスチェックを一度に投げられる数にしておく
+STATUS_MAX_WORKERS = 16
+# describe_servicesに一度に渡せるサービス数の上限
+DESCRIBE_SERVICES_BATCH_SIZE = 10
+_status_executor = ThreadPoolExecutor(max_workers=STATUS_MAX_WORKERS)
+
+# タスク定義のリビジョンは不変なのでARNをキーにずっとキャッシュしてよい
+_task_definitions = {}
+_task_definitions_lock = threading.Lock()
+
+
+class Arg:
+    """One positional argument of a command.
+
+    ``parse`` turns the word into the value handed to the handler and
+    raises ValueError when it is not acceptable.
+    """
+
+    __slots__ = ("name", "parse", "required", "missing", "invalid")
+
+    def __init__(self, name, parse=str, required=True, missing="", invalid=""):
+        self.name = name
+        self.parse = parse
+        self.required = required
+        self.missing = missing
+        self.invalid = invalid
+
+
+class Command:
+    __slots__ = ("name", "handler", "args", "deferred")
+
+    def __init__(self, name, handler, args, deferred):
+        self.name = name
+        self.handler = handler
+        self.args = args
+        self.deferred = deferred
+
+    def defers(self, ctx):
+        """Whether this request runs asynchronously (ctx.args is filled)."""
+        if callable(self.deferred):
+            return self.deferred(ctx)
+        return self.deferred
+
+
+# コマンド名 -> Command。ハンドラ定義時に @command で登録する
+COMMANDS = {}
+
+
+def command(name, *args, deferred=False):
+    """Register a handler; ``deferred`` ones may exceed Slack's 3 seconds
+    and are acknowledged first, then run asynchronously. ``deferred`` may
+    also be a predicate on the validated ctx, for commands that are only
+    slow with some arguments."""
+
+    def register(handler):
+        COMMANDS[name] = Command(name, handler, args, deferred)
+        return handler
+
+    return register
+
 
 def lambda_handler(event, context):
+    mode = "worker" if event.get("deferred") else "ack"
+    with tracing.invocation("dispatch_workflow_from_slack", mode=mode):
+        return handle(event, context)
+
+
+def handle(event, context):
     try:
-        command_text = parse_command_text(event)
-        logger.info(f"event body: {event['body']}")
-        logger.info(f"command_text: {command_text}")
-        return parse_request(command_text)
+        if event.get("deferred"):
+            return run_deferred(event)
+        ctx = RequestContext.from_event(event)
+        if not slack_auth.enabled():
+            logger.warning("Slack request signature is not verified")
+        elif not slack_auth.authentication(ctx.headers, ctx.raw_body):
+            return non_authenticate_response()
+        tracing.annotate(command=ctx.command)
+        logger.info(f"command_text: {ctx.text} (by {ctx.user_name})")
+        spec = COMMANDS.get(ctx.command)
+        if spec is not None and spec.deferred and ctx.response_url:
+            # 引数の誤りは非同期にせずその場で返す
+            error = validate_args(spec, ctx)
+            if error is not None:
+                return error
+            if spec.defers(ctx):
+                defer_command(ctx, context)
+                return response(
+                    f"`{ctx.text}` を受け付けました。結果はこのチャンネルに通知します。"
+                )
+        return parse_request(ctx)
     except Exception as err:
         logger.error(f"lambda_handler exception: {err}")
         return some_error_happened_response()
 
 
-def parse_command_text(event):
-    return unquote_plus(
-        (
-            (base64.b64decode(event["body"]).decode("utf-8")).split("text=")[1]
-        ).split("&")[0]
+def defer_command(ctx, context):
+    """Re-invoke this function asynchronously to run the command."""
+    lambda_client = clients.get("lambda")
+    lambda_client.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(ctx.defer_payload()),
     )
 
 
-def parse_request(command_text):
-    commands = command_text.split()
+def run_deferred(event):
+    """Worker half: run the command and post its result to response_url."""
+    ctx = RequestContext.from_deferred(event)
+    tracing.annotate(command=ctx.command)
+    logger.info(f"deferred command_text: {ctx.text}")
+    try:
+        result = parse_request(ctx)
+        post_response_url(ctx.response_url, result)
+    except Exception as err:
+        # 非同期実行なので、ここで握りつぶすとユーザーには何も返らない
+        logger.error(f"deferred command exception: {err}")
+        result = ephemeral_response(
+            f"`{ctx.text}` の実行中にエラーが発生しました。"
+        )
+        try:
+            post_response_url(ctx.response_url, result)
+        except Exception as e:
+            logger.error(f"response_url post failed: {e}")
+    return result
+
+
+def post_response_url(url, result):
+    # requestsはdispatchするコマンドでしか使わないので、ここはurllibで送る
+    request_obj = Request(
+        url,
+        data=result["body"].encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    tracing.urlopen(request_obj, timeout=10, name="slack.response_url")
 
-    if not commands or commands[0] == "help":
-        return show_help()
 
-    command = commands[0]
-
-    command_functions = {
-        "backup": run_backup,
-        "restore": run_restore,
-        "list": list_backups,
-        "show": show_backup_details,
-        "delete": delete_backup,
-        "create": create_world,
-        "start": start_server,
-        "stop": stop_server,
-        "restart": restart_server,
-        "status": check_status,
-    }
+def parse_request(ctx):
+    if not ctx.command or ctx.command == "help":
+        return show_help()
 
-    if command not in command_functions:
+    spec = COMMANDS.get(ctx.command)
+    if spec is None:
         return response("現在そのコマンドは存在しません。")
 
-    return command_functions[command](commands)
+    error = validate_args(spec, ctx)
+    if error is not None:
+        return error
+    return spec.handler(ctx)
+
+
+def validate_args(spec, ctx):
+    """Fill ctx.args from the schema; returns an error response or None.
+
+    Runs before the handler so a bad argument never creates a client.
+    """
+    words = ctx.commands[1:]
+    args = {}
+    for i, arg in enumerate(spec.args):
+        if i >= len(words):
+            if arg.required:
+                return response(arg.missing)
+            continue
+        try:
+            args[arg.name] = arg.parse(words[i])
+        except ValueError:
+            return response(invalid_message(arg, words[i]))
+    ctx.args = args
+    return None
+
+
+def invalid_message(arg, value):
+    fields = {"value": value}
+    if "{servers}" in arg.invalid:
+        # 登録されているサーバー名は、案内に使うときだけ読む
+        fields["servers"] = servers.names()
+    return arg.invalid.format(**fields)
+
+
+def parse_timestamp(value):
+    datetime.strptime(value, "%Y%m%d%H%M%S")
+    return value
+
+
+def parse_list_target(value):
+    """YYYY-MM-DD or YYYY-MM-DD..YYYY-MM-DD (either order)."""
+    if ".." not in value:
+        datetime.strptime(value, "%Y-%m-%d")
+        return value
+    start, _, end = value.partition("..")
+    if datetime.strptime(start, "%Y-%m-%d") > datetime.strptime(
+        end, "%Y-%m-%d"
+    ):
+        start, end = end, start
+    return (start, end)
+
+
+def parse_seed(value):
+    int(value)
+    return value
+
+
+def choice(*values):
+    def parse(value):
+        if value not in values:
+            raise ValueError(value)
+        return value
+
+    return parse
 
 
 def show_help():
@@ -65,101 +235,91 @@ def show_help():
 *コマンド一覧* \n\n
 - `backup`: バックアップを実行します。\n
 - `restore`: timestampを指定して特定のbackupからrestoreします。\n
-- `list`: 直近5件のbackupファイルを表示します。日時(例：2024-06-24)を指定することもできます。 \n
-- `show`: バックアップファイルを指定するとファイルの詳細（作成日時やファイルサイズなど）を参照できます。\n
+- `list`: 直近5件のbackupファイルを表示します。日時(例：2024-06-24)や期間(例：2024-06-01..2024-06-30)を指定することもできます。 \n
+- `show`: バックアップファイルを指定するとファイルの詳細（作成日時やファイルサイズなど）を参照できます。`--contents`を付けるとアーカイブの中身(ファイルとディメンションごとの合計)を表示します。差分バックアップ(`.manifest.json.gz`)も指定できます。\n
 - `create`: Seed値を指定してworldを新たに生成します。 \n
 - `start`: 直近のセーブデータからサーバーを起動します。 \n
 - `stop`: セーブしてサーバーをシャットダウンします。 \n
 - `delete`: 特定のバックアップファイルを削除します。 \n
-- `restart`: サーバーを再起動して最新のコンテナ定義に更新します。 \n
-- `status`: サーバーの状態を確認します。 \n
+- `catalog rebuild`: バックアップ一覧からカタログを作り直します。 \n
+- `prune`: 保持ルール(時/日/週/月ごとの世代数)から外れたバックアップと、どのバックアップからも参照されないチャンクパックを表示します。`--apply`を付けると削除します。 \n
+- `restart`: サーバーを再起動して最新のコンテナ定義に更新します。サーバー名(例：creative)か`all`を指定できます。 \n
+- `status`: サーバーの状態を確認します。サーバー名か`all`で全サーバーをまとめて確認できます。 \n
 - `help`: 実行できるコマンド一覧を表示します。 \n
 """
     )
 
 
-def run_backup(commands):
+@command("backup", deferred=True)
+def run_backup(ctx):
+    import github_dispatch
     from github_auth import get_github_token
 
-    github_token = get_github_token()
-    repo_owner = os.environ["REPO_OWNER"]
-    repo_name = os.environ["REPO_NAME"]
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/dispatches"
-
-    headers = {
-        "Authorization": f"bearer {github_token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-
-    data = {"event_type": "backup"}
-
-    api_response = requests.post(url, headers=headers, json=data)
-    if api_response.status_code != 204:
-        return response("Failed to dispatch GitHub workflow.", 200)
-    return response(f"`{commands[0]} `が実行されました")
-
+    result = github_dispatch.dispatch("backup", get_github_token())
+    return dispatch_response(result, f"`{ctx.command} `が実行されました")
+
+
+@command(
+    "restore",
+    Arg(
+        "timestamp",
+        parse_timestamp,
+        missing="restoreコマンドにはtimestampの指定が必要です。例：20231118225051",
+        invalid="The second word is not a valid date: {value}",
+    ),
+    deferred=True,
+)
+def run_restore(ctx):
+    import github_dispatch
+    from github_auth import get_github_token
 
-def run_restore(commands):
-    if len(commands) > 1:
-        date_str = commands[1]
-        try:
-            datetime.strptime(date_str, "%Y%m%d%H%M%S")
-            from github_auth import get_github_token
-
-            github_token = get_github_token()
-            repo_owner = os.environ["REPO_OWNER"]
-            repo_name = os.environ["REPO_NAME"]
-            url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/dispatches"
-            headers = {
-                "Authorization": f"bearer {github_token}",
-                "Accept": "application/vnd.github.v3+json",
-            }
-
-            data = {
-                "event_type": "restore",
-                "client_payload": {"recovery_datetime": date_str},
-            }
-
-            api_response = requests.post(url, headers=headers, json=data)
-            if api_response.status_code != 204:
-                return response("Failed to dispatch GitHub workflow.", 200)
-            return response(f"`{commands[0]} `が実行されました")
+    result = github_dispatch.dispatch(
+        "restore",
+        get_github_token(),
+        {"recovery_datetime": ctx.args["timestamp"]},
+    )
+    return dispatch_response(result, f"`{ctx.command} `が実行されました")
 
-        except ValueError:
-            return response(f"The second word is not a valid date: {date_str}")
 
-    else:
+def dispatch_response(result, message):
+    if result.coalesced:
         return response(
-            "restoreコマンドにはtimestampの指定が必要です。例：20231118225051"
+            f"`{result.event_type}` は{int(result.age)}秒前に実行されたばかりです。"
+            "実行中のworkflowが終わるまでお待ちください。"
         )
-
-
-def list_backups(commands):
-    s3_client = boto3.client("s3")
+    if not result.ok:
+        return response("Failed to dispatch GitHub workflow.", 200)
+    return response(message)
+
+
+@command(
+    "list",
+    Arg(
+        "target",
+        parse_list_target,
+        required=False,
+        invalid="YYYY-MM-DD(例：2024-06-24)または期間YYYY-MM-DD..YYYY-MM-DD(例：2024-06-01..2024-06-30)のフォーマットで指定してください。: {value}",
+    ),
+)
+def list_backups(ctx):
+    from botocore.exceptions import ClientError
+    from backup_listing import BACKUP_PREFIX, latest_backups, list_partition
+
+    s3_client = clients.get("s3")
     bucket_name = os.environ["S3_BUCKET_NAME"]
-    backup_prefix = "backups/"
-
-    def get_last_modified(obj):
-        return int(obj["LastModified"].strftime("%s"))
+    target = ctx.args.get("target")
 
-    if len(commands) > 1:
-        date_str = commands[1]
+    if isinstance(target, tuple):
+        return list_backup_range(s3_client, bucket_name, *target)
+    if target is not None:
+        date_str = target
         try:
-            datetime.strptime(date_str, "%Y-%m-%d")
-            backup_prefix = f"backups/{date_str}/"
-
-            objs = s3_client.list_objects_v2(
-                Bucket=bucket_name, Prefix=backup_prefix
+            objs = list_partition(
+                s3_client, bucket_name, f"{BACKUP_PREFIX}{date_str}/"
             )
 
-            if "Contents" in objs:
-                files = [
-                    obj["Key"]
-                    for obj in sorted(
-                        objs["Contents"], key=get_last_modified, reverse=True
-                    )
-                ]
-                res = "\n".join([f"- {file}" for file in files])
+            if objs:
+                res = "\n".join([backup_line(obj["Key"]) for obj in objs])
                 return response(f"{date_str}のバックアップファイル \n\n{res}")
             else:
                 return response(
@@ -167,23 +327,11 @@ def list_backups(commands):
                 )
         except ClientError as e:
             return response(f"Error: {e.response['Error']['Message']}")
-        except ValueError:
-            return response(
-                f"YYYY-MM-DD(例：2024-06-24)のフォーマットで指定してください。: {date_str}"
-            )
     else:
         try:
-            objs = s3_client.list_objects_v2(
-                Bucket=bucket_name, Prefix=backup_prefix
-            )
-            if "Contents" in objs:
-                files = [
-                    obj["Key"]
-                    for obj in sorted(
-                        objs["Contents"], key=get_last_modified, reverse=True
-                    )[:5]
-                ]
-                res = "\n".join([f"- {file}" for file in files])
+            objs = latest_backups(s3_client, bucket_name, 5)
+            if objs:
+                res = "\n".join([backup_line(obj["Key"]) for obj in objs])
                 return response(f"直近5件のバックアップファイル \n\n{res}")
             else:
                 return response("Error: バックアップファイルが存在しません。")
@@ -191,293 +339,587 @@ def list_backups(commands):
             return response(f"Error: {e.response['Error']['Message']}")
 
 
-def show_backup_details(commands):
-    if len(commands) > 1:
-        s3_client = boto3.client("s3")
-        bucket_name = os.environ["S3_BUCKET_NAME"]
-        object_key = commands[1]
-        try:
-            obj = s3_client.head_object(Bucket=bucket_name, Key=object_key)
-            file_metadata = {
-                "File Name": object_key,
-                "Size (in MB)": round(obj["ContentLength"] / (1024 * 1024), 2),
-                "Last Modified (JST)": obj["LastModified"],
-            }
-            res = "\n".join(
-                [
-                    (
-                        f"{key}: `{value}`"
-                        if not isinstance(value, datetime)
-                        else f"{key}: `{value.astimezone(timezone(timedelta(hours=+9), 'JST')).strftime('%Y-%m-%d %H:%M:%S')}`"
-                    )
-                    for key, value in file_metadata.items()
-                ]
-            )
-            return response(f"{object_key}の詳細 \n\n{res}")
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "404":
-                return response(
-                    f"Error: `{object_key}` は存在しませんでした。"
-                )
-            else:
-                return response(f"Error: {e.response['Error']['Message']}")
-    else:
+def backup_line(key):
+    from backup_listing import is_manifest
+
+    # 差分バックアップはマニフェストだけなので、tar.gzと見分けられるようにする
+    return f"- {key} (差分)" if is_manifest(key) else f"- {key}"
+
+
+def list_backup_range(s3_client, bucket_name, start_str, end_str):
+    from botocore.exceptions import ClientError
+    import catalog
+
+    try:
+        entries = catalog.between(
+            catalog.load(s3_client, bucket_name), start_str, end_str
+        )
+    except ClientError as e:
+        return response(f"Error: {e.response['Error']['Message']}")
+    if not entries:
         return response(
-            """
-showコマンドにはファイル名の引数が必要です。\n
-例：'backups/2024-06-24/minecraft-20240622171734.tar.gz'
-"""
+            f"Error: {start_str}〜{end_str}にバックアップファイルはありません。"
         )
 
+    entries = entries[::-1]
+    mb = 1024 * 1024
+    total_mb = sum(entry["size"] for entry in entries) / mb
+    res = "\n".join(
+        f"{backup_line(entry['key'])} ({entry['size'] / mb:.2f} MB)"
+        for entry in entries[:MAX_LIST_LINES]
+    )
+    if len(entries) > MAX_LIST_LINES:
+        res += f"\n…ほか{len(entries) - MAX_LIST_LINES}件"
+    return response(
+        f"{start_str}〜{end_str}のバックアップファイル "
+        f"{len(entries)}件 / 合計 {total_mb:.2f} MB \n\n{res}"
+    )
 
-def delete_backup(commands):
-    if len(commands) > 1:
-        s3_client = boto3.client("s3")
-        bucket_name = os.environ["S3_BUCKET_NAME"]
-        object_key = commands[1]
-        try:
-            s3_client.delete_object(Bucket=bucket_name, Key=object_key)
-            return response(f"{object_key} を削除しました。")
-        except s3_client.exceptions.NoSuchKey:
-            return response(f"{object_key} は存在しません。")
-    else:
-        return response(
-            """
-deleteコマンドにはファイル名の引数が必要です。\n
+
+@command(
+    "show",
+    Arg(
+        "key",
+        missing="""
+showコマンドにはファイル名の引数が必要です。\n
 例：'backups/2024-06-24/minecraft-20240622171734.tar.gz'
-"""
+""",
+    ),
+    Arg(
+        "contents",
+        choice("--contents"),
+        required=False,
+        invalid="showコマンドのオプションは`--contents`だけです。: {value}",
+    ),
+    # 中身の一覧はアーカイブを展開しながら読むので時間がかかる
+    deferred=lambda ctx: "contents" in ctx.args,
+)
+def show_backup_details(ctx):
+    from botocore.exceptions import ClientError
+
+    s3_client = clients.get("s3")
+    bucket_name = os.environ["S3_BUCKET_NAME"]
+    object_key = ctx.args["key"]
+    if "contents" in ctx.args:
+        return show_backup_contents(s3_client, bucket_name, object_key)
+    try:
+        import catalog
+
+        entry = catalog.find(catalog.load(s3_client, bucket_name), object_key)
+    except ClientError as e:
+        logger.warning(f"backup catalog unavailable: {e}")
+        entry = None
+    if entry is not None:
+        return show_catalog_entry(entry)
+    # カタログに無ければ(作り直す前など)オブジェクトを直接見る
+    try:
+        obj = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        file_metadata = {
+            "File Name": object_key,
+            "Size (in MB)": round(obj["ContentLength"] / (1024 * 1024), 2),
+            "Last Modified (JST)": obj["LastModified"],
+        }
+        res = "\n".join(
+            [
+                (
+                    f"{key}: `{value}`"
+                    if not isinstance(value, datetime)
+                    else f"{key}: `{value.astimezone(timezone(timedelta(hours=+9), 'JST')).strftime('%Y-%m-%d %H:%M:%S')}`"
+                )
+                for key, value in file_metadata.items()
+            ]
         )
+        return response(f"{object_key}の詳細 \n\n{res}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "404":
+            return response(f"Error: `{object_key}` は存在しませんでした。")
+        else:
+            return response(f"Error: {e.response['Error']['Message']}")
 
 
-def create_world(commands):
-    if len(commands) > 1:
-        seed_value = commands[1]
-        try:
-            int(seed_value)
-            github_token = os.environ["GITHUB_TOKEN"]
-            repo_owner = os.environ["REPO_OWNER"]
-            repo_name = os.environ["REPO_NAME"]
-            url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/dispatches"
-            headers = {
-                "Authorization": f"bearer {github_token}",
-                "Accept": "application/vnd.github.v3+json",
-            }
-
-            data = {
-                "event_type": "create",
-                "client_payload": {"seed_value": str(seed_value)},
-            }
-
-            api_response = requests.post(url, headers=headers, json=data)
-            if api_response.status_code != 204:
-                return response("Failed to dispatch GitHub workflow.", 200)
-            return response(f"`{commands[0]} `が実行されました")
+def show_backup_contents(s3_client, bucket_name, object_key):
+    from botocore.exceptions import ClientError
+    import backup_contents
 
-        except ValueError:
-            return response(
-                f"The second word is not a valid value: {seed_value}"
-            )
+    try:
+        contents = backup_contents.inspect(
+            s3_client, bucket_name, object_key, keep=MAX_LIST_LINES
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return response(f"Error: `{object_key}` は存在しませんでした。")
+        return response(f"Error: {e.response['Error']['Message']}")
+    except Exception as e:
+        return response(f"Error: アーカイブを読めませんでした: {e}")
 
+    mb = 1024 * 1024
+    dimensions = "\n".join(
+        f"- {name}: {files}ファイル / {size / mb:.2f} MB / region {regions}"
+        for name, (files, size, regions) in contents.dimensions.items()
+    )
+    members = "\n".join(
+        f"- {path} ({size / mb:.2f} MB)" for path, size in contents.members
+    )
+    if contents.files > len(contents.members):
+        members += f"\n…ほか{contents.files - len(contents.members)}件"
+    if contents.chunks is not None:
+        detail = f"チャンク {contents.chunks} / pack {contents.packs}"
     else:
-        return response("restoreコマンドにはシード値の指定が必要です。")
+        detail = f"gzipメンバー {contents.gzip_members}"
+    res = (
+        f"{object_key}の中身 \n\n"
+        f"{contents.files}ファイル / 展開後 {contents.total_bytes / mb:.2f} MB"
+        f" ({detail}) \n\n"
+        f"*ディメンション別* \n{dimensions} \n\n"
+        f"*ファイル* \n{members}"
+    )
+    if contents.truncated:
+        res += (
+            f"\n\n先頭 {contents.bytes_read / mb:.0f} MB"
+            f"(全体 {contents.object_size / mb:.0f} MB)まで読んだところで"
+            "打ち切りました。"
+        )
+    return response(res)
+
+
+def show_catalog_entry(entry):
+    timestamp = datetime.strptime(entry["timestamp"], "%Y%m%d%H%M%S")
+    file_metadata = {
+        "File Name": entry["key"],
+        "Size (in MB)": round(entry["size"] / (1024 * 1024), 2),
+        "Backup Time (JST)": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "SHA-256": entry.get("sha256") or "不明",
+        "Worlds": ", ".join(entry.get("worlds") or []) or "不明",
+    }
+    if entry.get("format") == "chunks":
+        # sizeはこのバックアップで増えた分(新しいpackとマニフェスト)
+        file_metadata["Format"] = "差分 (チャンク単位)"
+        if entry.get("world_size") is not None:
+            file_metadata["World Size (in MB)"] = round(
+                entry["world_size"] / (1024 * 1024), 2
+            )
+    res = "\n".join(
+        f"{key}: `{value}`" for key, value in file_metadata.items()
+    )
+    return response(f"{entry['key']}の詳細 \n\n{res}")
 
 
-def start_server(commands):
+@command(
+    "delete",
+    Arg(
+        "key",
+        missing="""
+deleteコマンドにはファイル名の引数が必要です。\n
+例：'backups/2024-06-24/minecraft-20240622171734.tar.gz'
+""",
+    ),
+)
+def delete_backup(ctx):
+    s3_client = clients.get("s3")
+    bucket_name = os.environ["S3_BUCKET_NAME"]
+    object_key = ctx.args["key"]
     try:
-        github_token = os.environ["GITHUB_TOKEN"]
-        repo_owner = os.environ["REPO_OWNER"]
-        repo_name = os.environ["REPO_NAME"]
-        url = (
-            f"https://api.github.com/repos/{repo_owner}/{repo_name}/dispatches"
-        )
-        headers = {
-            "Authorization": f"bearer {github_token}",
-            "Accept": "application/vnd.github.v3+json",
-        }
-        data = {"event_type": "start"}
+        s3_client.delete_object(Bucket=bucket_name, Key=object_key)
+        remove_from_catalog(s3_client, bucket_name, [object_key])
+        return response(f"{object_key} を削除しました。")
+    except s3_client.exceptions.NoSuchKey:
+        return response(f"{object_key} は存在しません。")
 
-        api_response = requests.post(url, headers=headers, json=data)
-        if api_response.status_code != 204:
-            return response("Failed to dispatch GitHub workflow.", 200)
-        return response(f"{commands[0]}が実行されました")
-    except Exception as e:
-        return response(f"Error: {e}")
 
+def remove_from_catalog(s3_client, bucket_name, keys):
+    from botocore.exceptions import ClientError
+    import catalog
 
-def stop_server(commands):
     try:
-        github_token = os.environ["GITHUB_TOKEN"]
-        repo_owner = os.environ["REPO_OWNER"]
-        repo_name = os.environ["REPO_NAME"]
-        url = (
-            f"https://api.github.com/repos/{repo_owner}/{repo_name}/dispatches"
-        )
-        headers = {
-            "Authorization": f"bearer {github_token}",
-            "Accept": "application/vnd.github.v3+json",
-        }
-        data = {"event_type": "stop"}
-
-        api_response = requests.post(url, headers=headers, json=data)
-        if api_response.status_code != 204:
-            return response("Failed to dispatch GitHub workflow.", 200)
-        return response(f"{commands[0]}が実行されました")
-    except Exception as e:
-        return response(f"Error: {e}")
+        catalog.remove(s3_client, bucket_name, keys)
+    except ClientError as e:
+        # 削除自体は済んでいるので、カタログは後からrebuildで直せる
+        logger.error(f"failed to update backup catalog: {e}")
+
+
+CATALOG_USAGE = (
+    "catalogコマンドには`rebuild`を指定してください。例：`/mc catalog rebuild`"
+)
+
+
+@command(
+    "catalog",
+    Arg(
+        "action",
+        choice("rebuild"),
+        missing=CATALOG_USAGE,
+        invalid=CATALOG_USAGE,
+    ),
+    deferred=True,
+)
+def manage_catalog(ctx):
+    from botocore.exceptions import ClientError
+    import catalog
+
+    s3_client = clients.get("s3")
+    bucket_name = os.environ["S3_BUCKET_NAME"]
+    try:
+        entries = catalog.rebuild(s3_client, bucket_name)
+    except ClientError as e:
+        return response(f"Error: {e.response['Error']['Message']}")
+    total_mb = sum(entry["size"] for entry in entries) / (1024 * 1024)
+    return response(
+        f"カタログを作り直しました。{len(entries)}件 / 合計 {total_mb:.2f} MB"
+    )
 
 
-def restart_server(commands):
-    cluster_name = os.environ["ECS_CLUSTER_NAME"]
-    service_name = os.environ["ECS_SERVICE_NAME"]
-    ecs_client = boto3.client("ecs")
+@command(
+    "prune",
+    Arg(
+        "apply",
+        choice("--apply"),
+        required=False,
+        invalid="pruneコマンドに指定できるのは`--apply`だけです。: {value}",
+    ),
+    deferred=True,
+)
+def prune_backups(ctx):
+    from botocore.exceptions import ClientError
+    import retention
+    from backup_listing import CHUNK_PREFIX
+
+    apply = "apply" in ctx.args
+    s3_client = clients.get("s3")
+    bucket_name = os.environ["S3_BUCKET_NAME"]
     try:
-        list_task_response = ecs_client.list_task_definitions(
-            familyPrefix="minecraft-test",
-            status="ACTIVE",
-            sort="DESC",
-            maxResults=1,
+        backup_plan, (deleted, errors) = retention.prune(
+            s3_client, bucket_name, apply=apply
         )
-        if not list_task_response["taskDefinitionArns"]:
-            raise ValueError(
-                f"No active task definition found for family {service_name}"
-            )
-        latest_task_definition_arn = list_task_response["taskDefinitionArns"][
-            0
-        ]
-
-        ecs_client.update_service(
-            cluster=cluster_name,
-            service=service_name,
-            taskDefinition=latest_task_definition_arn,
-            forceNewDeployment=True,
+    except ClientError as e:
+        return response(f"Error: {e.response['Error']['Message']}")
+
+    rules = " / ".join(
+        f"{name} {count}" for name, (count, _) in retention.RULES.items()
+    )
+    summary = (
+        f"保持ルール: {rules}\n"
+        f"- 残す: *{len(backup_plan.keep)}*件\n"
+        f"- 削除対象: *{len(backup_plan.delete)}*件 "
+        f"({backup_plan.delete_bytes / (1024 * 1024):.2f} MB)\n"
+        f"- 参照されないチャンクパック: *{len(backup_plan.packs)}*件 "
+        f"({backup_plan.pack_bytes / (1024 * 1024):.2f} MB)"
+    )
+    if not apply:
+        candidates = backup_plan.delete + backup_plan.packs
+        sample = "\n".join(f"  - {obj['Key']}" for obj in candidates[:10])
+        if len(candidates) > 10:
+            sample += f"\n  …ほか{len(candidates) - 10}件"
+        return response(
+            f"*prune (dry-run)*\n{summary}\n{sample}\n\n"
+            "削除するには `/mc prune --apply` を実行してください。"
         )
-        return response(f"{commands[0]}が実行されました")
-    except boto3.exceptions.Boto3Error as e:
-        return response(f"Error: {e}")
+
+    packs = sum(1 for key in deleted if key.startswith(CHUNK_PREFIX))
+    deleted = [key for key in deleted if not key.startswith(CHUNK_PREFIX)]
+    remove_from_catalog(s3_client, bucket_name, deleted)
+    if errors:
+        logger.error(f"prune failed for {len(errors)} keys: {errors[:10]}")
+        return response(
+            f"*prune*\n{summary}\n{len(deleted)}件とパック{packs}件を"
+            f"削除しましたが、{len(errors)}件は削除できませんでした。"
+            f"(例: `{errors[0]['Key']}` {errors[0].get('Code')})"
+        )
+    return response(
+        f"*prune*\n{summary}\n{len(deleted)}件とパック{packs}件を削除しました。"
+    )
+
+
+@command(
+    "create",
+    Arg(
+        "seed",
+        parse_seed,
+        missing="restoreコマンドにはシード値の指定が必要です。",
+        invalid="The second word is not a valid value: {value}",
+    ),
+    deferred=True,
+)
+def create_world(ctx):
+    import github_dispatch
+
+    result = github_dispatch.dispatch(
+        "create",
+        os.environ["GITHUB_TOKEN"],
+        {"seed_value": ctx.args["seed"]},
+    )
+    return dispatch_response(result, f"`{ctx.command} `が実行されました")
+
+
+@command("start", deferred=True)
+def start_server(ctx):
+    import github_dispatch
+
+    try:
+        result = github_dispatch.dispatch("start", os.environ["GITHUB_TOKEN"])
+        return dispatch_response(result, f"{ctx.command}が実行されました")
     except Exception as e:
         return response(f"Error: {e}")
 
 
-def check_status(commands):
-    ecs_client = boto3.client("ecs")
-    elbv2_client = boto3.client("elbv2")
-    cluster_name = os.environ["ECS_CLUSTER_NAME"]
-    service_name = os.environ["ECS_SERVICE_NAME"]
+@command("stop", deferred=True)
+def stop_server(ctx):
+    import github_dispatch
 
     try:
-        # サービスの詳細を取得
-        service_response = ecs_client.describe_services(
-            cluster=cluster_name, services=[service_name]
-        )
-
-        if not service_response["services"]:
-            raise ValueError("No service found for the specified service name")
+        result = github_dispatch.dispatch("stop", os.environ["GITHUB_TOKEN"])
+        return dispatch_response(result, f"{ctx.command}が実行されました")
+    except Exception as e:
+        return response(f"Error: {e}")
 
-        service = service_response["services"][0]
-        task_definition_arn = service["taskDefinition"]
 
-        # ターゲットグループARNを取得
-        load_balancers = service.get("loadBalancers", [])
-        if not load_balancers:
-            raise ValueError(
-                "No load balancers found for the specified service"
-            )
+SERVER_TARGET = Arg(
+    "target",
+    servers.resolve,
+    required=False,
+    invalid="登録されていないサーバーです。サーバー名({servers})か`all`を指定してください。: {value}",
+)
 
-        # 各ターゲットグループのヘルス情報を取得
-        health_check_status_list = []
-        for lb in load_balancers:
-            target_group_arn = lb["targetGroupArn"]
-            target_group_name = target_group_arn.split(":")[-1].split("/")[
-                -1
-            ]  # ARNから識別子を抽出
-            target_health_response = elbv2_client.describe_target_health(
-                TargetGroupArn=target_group_arn
-            )
 
-            for target in target_health_response["TargetHealthDescriptions"]:
-                health_check_status_list.append(
-                    f"       - Target Group Name: *{target_group_name}*\n "
-                    f"        Target ID: *{target['Target']['Id']}* \n "
-                    f"        Health: `{target['TargetHealth']['State']}`\n"
-                )
+def fleet_response(results, header=""):
+    """One message for per-server (server, text) results.
 
-        health_check_status = "\n".join(health_check_status_list)
+    A single server keeps the plain one-server message.
+    """
+    if len(results) == 1:
+        return response(header + results[0][1])
+    return response(
+        header
+        + "\n".join(f"*{server.name}*\n{text}" for server, text in results)
+    )
 
-        # タスク定義の詳細を取得
-        task_definition_response = ecs_client.describe_task_definition(
-            taskDefinition=task_definition_arn
-        )
 
-        task_definition = task_definition_response["taskDefinition"]
-        task_definition_created_at = (
-            task_definition_response["taskDefinition"]["registeredAt"]
-            .astimezone(timezone(timedelta(hours=+9), "JST"))
-            .strftime("%Y-%m-%d %H:%M:%S")
+@command("restart", SERVER_TARGET, deferred=True)
+def restart_server(ctx):
+    targets = ctx.args.get("target") or servers.resolve()
+    ecs_client = clients.get("ecs")
+    futures = [
+        _status_executor.submit(restart_service, ecs_client, server)
+        for server in targets
+    ]
+    results = []
+    for server, future in zip(targets, futures):
+        try:
+            future.result()
+            results.append((server, f"{ctx.command}が実行されました"))
+        except Exception as e:
+            results.append((server, f"Error: {e}"))
+    return fleet_response(results)
+
+
+def restart_service(ecs_client, server):
+    list_task_response = ecs_client.list_task_definitions(
+        familyPrefix=server.task_family,
+        status="ACTIVE",
+        sort="DESC",
+        maxResults=1,
+    )
+    if not list_task_response["taskDefinitionArns"]:
+        raise ValueError(
+            f"No active task definition found for family {server.task_family}"
         )
+    latest_task_definition_arn = list_task_response["taskDefinitionArns"][0]
+    ecs_client.update_service(
+        cluster=server.cluster,
+        service=server.service,
+        taskDefinition=latest_task_definition_arn,
+        forceNewDeployment=True,
+    )
 
-        # minecraftコンテナの情報を取得
-        minecraft_container = None
-        for container in task_definition["containerDefinitions"]:
-            if container["name"] == "minecraft":
-                minecraft_container = container
-                break
-
-        if minecraft_container is None:
-            raise ValueError(
-                "No minecraft container found in the task definition"
-            )
 
-        # 環境変数の取得
-        environment = {
-            env["name"]: env["value"]
-            for env in minecraft_container.get("environment", [])
-        }
-        version = environment.get("VERSION", "指定なし")
-        seed = environment.get("SEED", "指定なし")
-
-        if not version:
-            version = "指定なし"
-        if not seed:
-            seed = "指定なし"
-
-        # commandとentrypointの取得
-        entrypoint = " ".join(minecraft_container.get("entryPoint", []))
-        command = " ".join(minecraft_container.get("command", []))
-
-        # サービス起動時刻の取得
-        # 最新のデプロイ時刻の取得
-        deployments = service.get("deployments", [])
-        if deployments:
-            latest_deployment = max(deployments, key=lambda d: d["createdAt"])
-            latest_deploy_time = (
-                latest_deployment["createdAt"]
-                .astimezone(timezone(timedelta(hours=+9), "JST"))
-                .strftime("%Y-%m-%d %H:%M:%S")
-            )
-        else:
-            latest_deploy_time = "情報が見つかりませんでした"
-
-        # テキストの作成
-        output_text = (
-            ":computer: *Get the status of the Minecraft server:computer:* \n\n"
-            f"- minecraftバージョン： `{version}` \n"
-            f"- SEED値： `{seed}` \n"
-            f"- サーバー起動時の実行コマンド： *{entrypoint} {command}* \n"
-            f"- サーバー起動時刻： `{latest_deploy_time}` \n"
-            f"- サーバーの状態：\n"
-            f"  - 起動状態： `{service['status']}` \n"
-            f"  - タスクの状態： *{service['runningCount']}/{service['desiredCount']}*\n"
-            f"  - タスク定義の作成日時： `{task_definition_created_at}` \n"
-            f"  - タスク定義のリビジョン： *{task_definition['revision']}* \n"
-            f"  - ターゲットグループのヘルスチェック状態：\n{health_check_status}"
+def describe_task_definition(ecs_client, task_definition_arn):
+    """describe_task_definition, cached by revision ARN across invocations."""
+    cached = _task_definitions.get(task_definition_arn)
+    if cached is not None:
+        return cached
+    task_definition = ecs_client.describe_task_definition(
+        taskDefinition=task_definition_arn
+    )["taskDefinition"]
+    with _task_definitions_lock:
+        _task_definitions[task_definition_arn] = task_definition
+    return task_definition
+
+
+def describe_target_health(elbv2_client, target_group_arn):
+    target_group_name = target_group_arn.split(":")[-1].split("/")[
+        -1
+    ]  # ARNから識別子を抽出
+    target_health_response = elbv2_client.describe_target_health(
+        TargetGroupArn=target_group_arn
+    )
+    return [
+        f"       - Target Group Name: *{target_group_name}*\n "
+        f"        Target ID: *{target['Target']['Id']}* \n "
+        f"        Health: `{target['TargetHealth']['State']}`\n"
+        for target in target_health_response["TargetHealthDescriptions"]
+    ]
+
+
+def describe_services(ecs_client, targets):
+    """(cluster, service name) -> service, one request per cluster batch.
+
+    The batches of all clusters are sent at the same time.
+    """
+    batches = [
+        (cluster, names[i : i + DESCRIBE_SERVICES_BATCH_SIZE])
+        for cluster, names in servers.by_cluster(targets).items()
+        for i in range(0, len(names), DESCRIBE_SERVICES_BATCH_SIZE)
+    ]
+    futures = [
+        _status_executor.submit(
+            ecs_client.describe_services, cluster=cluster, services=names
         )
-        return response(output_text)
+        for cluster, names in batches
+    ]
+    found = {}
+    for (cluster, _), future in zip(batches, futures):
+        for service in future.result()["services"]:
+            found[(cluster, service["serviceName"])] = service
+    return found
+
+
+@command("status", SERVER_TARGET, deferred=True)
+def check_status(ctx):
+    # 結果はキャッシュしない。start/stop/restartは別のコンテナのworkerや
+    # GitHub Actionsで進むので、このコンテナでは古くなったことがわからない
+    targets = ctx.args.get("target") or servers.resolve()
+    ecs_client = clients.get("ecs")
+    elbv2_client = clients.get("elbv2")
 
-    except boto3.exceptions.Boto3Error as e:
-        return response(f"Error: {e}")
+    try:
+        # サービスの詳細を取得(クラスタごとにまとめて、全クラスタ並列に)
+        found = describe_services(ecs_client, targets)
+
+        # タスク定義と各ターゲットグループのヘルス情報は互いに独立なので、
+        # 全サーバー分をまとめて並列に取得する
+        task_definition_futures = {}
+        health_futures = {}
+        for server in targets:
+            service = found.get((server.cluster, server.service))
+            if service is None:
+                continue
+            arn = service["taskDefinition"]
+            if arn not in task_definition_futures:
+                task_definition_futures[arn] = _status_executor.submit(
+                    describe_task_definition, ecs_client, arn
+                )
+            for lb in service.get("loadBalancers", []):
+                target_group_arn = lb["targetGroupArn"]
+                if target_group_arn not in health_futures:
+                    health_futures[target_group_arn] = _status_executor.submit(
+                        describe_target_health, elbv2_client, target_group_arn
+                    )
+
+        results = []
+        for server in targets:
+            try:
+                results.append(
+                    (
+                        server,
+                        server_status(
+                            found.get((server.cluster, server.service)),
+                            task_definition_futures,
+                            health_futures,
+                        ),
+                    )
+                )
+            except Exception as e:
+                if len(targets) == 1:
+                    raise
+                results.append((server, f"Error: {e}"))
     except Exception as e:
         return response(f"Error: {e}")
 
+    return fleet_response(
+        results,
+        ":computer: *Get the status of the Minecraft server:computer:* \n\n",
+    )
+
+
+def server_status(service, task_definition_futures, health_futures):
+    """Status text of one service from the already submitted queries."""
+    if service is None:
+        raise ValueError("No service found for the specified service name")
+
+    # ターゲットグループARNを取得
+    load_balancers = service.get("loadBalancers", [])
+    if not load_balancers:
+        raise ValueError("No load balancers found for the specified service")
+
+    health_check_status = "\n".join(
+        line
+        for lb in load_balancers
+        for line in health_futures[lb["targetGroupArn"]].result()
+    )
+
+    # タスク定義の詳細を取得
+    task_definition = task_definition_futures[
+        service["taskDefinition"]
+    ].result()
+    task_definition_created_at = (
+        task_definition["registeredAt"]
+        .astimezone(timezone(timedelta(hours=+9), "JST"))
+        .strftime("%Y-%m-%d %H:%M:%S")
+    )
+
+    # minecraftコンテナの情報を取得
+    minecraft_container = None
+    for container in task_definition["containerDefinitions"]:
+        if container["name"] == "minecraft":
+            minecraft_container = container
+            break
+
+    if minecraft_container is None:
+        raise ValueError("No minecraft container found in the task definition")
+
+    # 環境変数の取得
+    environment = {
+        env["name"]: env["value"]
+        for env in minecraft_container.get("environment", [])
+    }
+    version = environment.get("VERSION", "指定なし")
+    seed = environment.get("SEED", "指定なし")
+
+    if not version:
+        version = "指定なし"
+    if not seed:
+        seed = "指定なし"
+
+    # commandとentrypointの取得
+    entrypoint = " ".join(minecraft_container.get("entryPoint", []))
+    command = " ".join(minecraft_container.get("command", []))
+
+    # サービス起動時刻の取得
+    # 最新のデプロイ時刻の取得
+    deployments = service.get("deployments", [])
+    if deployments:
+        latest_deployment = max(deployments, key=lambda d: d["createdAt"])
+        latest_deploy_time = (
+            latest_deployment["createdAt"]
+            .astimezone(timezone(timedelta(hours=+9), "JST"))
+            .strftime("%Y-%m-%d %H:%M:%S")
+        )
+    else:
+        latest_deploy_time = "情報が見つかりませんでした"
+
+    # テキストの作成
+    return (
+        f"- minecraftバージョン： `{version}` \n"
+        f"- SEED値： `{seed}` \n"
+        f"- サーバー起動時の実行コマンド： *{entrypoint} {command}* \n"
+        f"- サーバー起動時刻： `{latest_deploy_time}` \n"
+        f"- サーバーの状態：\n"
+        f"  - 起動状態： `{service['status']}` \n"
+        f"  - タスクの状態： *{service['runningCount']}/{service['desiredCount']}*\n"
+        f"  - タスク定義の作成日時： `{task_definition_created_at}` \n"
+        f"  - タスク定義のリビジョン： *{task_definition['revision']}* \n"
+        f"  - ターゲットグループのヘルスチェック状態：\n{health_check_status}"
+    )
+
 
 def response(message, status_code=200):
     return {
@@ -486,6 +928,13 @@ def response(message, status_code=200):
     }
 
 
+def ephemeral_response(message, status_code=200):
+    return {
+        "statusCode": status_code,
+        "body": json.dumps({"text": message, "response_type": "ephemeral"}),
+    }
+
+
 def non_authenticate_response(message="unauthorized", status_code=401):
     return {
         "statusCode": status_code,
@@ -0,0 +1,73 @@
+"""One decoded view of a slash-command request.
+
+The Function URL event carries the form body base64-encoded. It is
+decoded and ``parse_qs``-parsed once here; signature verification reads
+``raw_body`` and routing and handlers read the parsed fields.
+"""
+
+import base64
+from urllib.parse import parse_qs
+
+
+class RequestContext:
+    __slots__ = (
+        "headers",
+        "raw_body",
+        "form",
+        "text",
+        "commands",
+        "response_url",
+        "user_name",
+        "args",
+    )
+
+    def __init__(self, headers, raw_body, form):
+        self.headers = headers
+        self.raw_body = raw_body
+        self.form = form
+        self.text = self.field("text").strip()
+        self.commands = self.text.split()
+        self.response_url = self.field("response_url") or None
+        self.user_name = self.field("user_name")
+        # コマンドの引数スキーマで検証した値(index.validate_args が埋める)
+        self.args = {}
+
+    @classmethod
+    def from_event(cls, event):
+        body = event.get("body") or ""
+        if event.get("isBase64Encoded", True):
+            raw_body = base64.b64decode(body)
+        else:
+            raw_body = body.encode("utf-8")
+        headers = {
+            name.lower(): value
+            for name, value in (event.get("headers") or {}).items()
+        }
+        form = parse_qs(raw_body.decode("utf-8"), keep_blank_values=True)
+        return cls(headers, raw_body, form)
+
+    @classmethod
+    def from_deferred(cls, event):
+        """Rebuild the context in the async worker from defer_payload()."""
+        form = {
+            "text": [event["text"]],
+            "response_url": [event["response_url"]],
+            "user_name": [event.get("user_name", "")],
+        }
+        return cls({}, b"", form)
+
+    def defer_payload(self):
+        return {
+            "deferred": True,
+            "text": self.text,
+            "response_url": self.response_url,
+            "user_name": self.user_name,
+        }
+
+    def field(self, name):
+        values = self.form.get(name)
+        return values[0] if values else ""
+
+    @property
+    def command(self):
+        return self.commands[0] if self.commands else ""
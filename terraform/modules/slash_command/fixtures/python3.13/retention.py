@@ -0,0 +1,216 @@
+"""Grandfather-father-son retention for the backups in S3.
+
+For each rule the newest backup of each of the most recent N hours, days,
+ISO weeks and months is kept; everything else under ``backups/`` that is
+named like a backup is deleted with DeleteObjects, 1000 keys per request
+on a few parallel workers. Objects not named ``minecraft-<timestamp>``
+are never touched, and the newest backup is always kept.
+
+Incremental backups share chunk packs under ``chunks/``, so packs are
+swept mark-and-sweep style: every pack referenced by a manifest that is
+kept is marked, and the unmarked ones are deleted once the manifests are
+gone. A snapshot uploads its packs before its manifest, so packs newer
+than the newest kept manifest (or, without one, the newest backup) may
+belong to a snapshot still in progress and are left alone. Manifests
+outside ``backups/`` (another S3_PREFIX_NAME) are never pruned but still
+mark their packs.
+"""
+
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from backup_listing import (
+    BACKUP_PREFIX,
+    BACKUP_TIMESTAMP,
+    CHUNK_PREFIX,
+    is_manifest,
+)
+
+RULES = {
+    "hourly": (int(os.environ.get("RETENTION_HOURLY", "24")), "%Y%m%d%H"),
+    "daily": (int(os.environ.get("RETENTION_DAILY", "7")), "%Y%m%d"),
+    "weekly": (int(os.environ.get("RETENTION_WEEKLY", "4")), "%G%V"),
+    "monthly": (int(os.environ.get("RETENTION_MONTHLY", "12")), "%Y%m"),
+}
+DELETE_BATCH_SIZE = 1000  # DeleteObjectsの上限
+DELETE_WORKERS = int(os.environ.get("PRUNE_WORKERS", "8"))
+
+
+class Plan:
+    """What a prune would keep and delete, newest first.
+
+    ``packs`` are the unreferenced chunk packs to sweep.
+    """
+
+    __slots__ = ("keep", "delete", "reasons", "packs")
+
+    def __init__(self, keep, delete, reasons, packs=()):
+        self.keep = keep
+        self.delete = delete
+        self.reasons = reasons
+        self.packs = list(packs)
+
+    @property
+    def delete_bytes(self):
+        return sum(obj["Size"] for obj in self.delete)
+
+    @property
+    def pack_bytes(self):
+        return sum(obj["Size"] for obj in self.packs)
+
+
+def list_backup_objects(s3_client, bucket, prefix=BACKUP_PREFIX):
+    """Every object under ``prefix`` named like a backup, newest first."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    found = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            match = BACKUP_TIMESTAMP.search(obj["Key"])
+            if match:
+                found.append((match.group(1), obj))
+    found.sort(key=lambda item: (item[0], item[1]["Key"]), reverse=True)
+    return found
+
+
+def plan(backups, rules=RULES):
+    """Split ``(timestamp, obj)`` pairs (newest first) into a Plan."""
+    reasons = {}
+    for name, (count, period_format) in rules.items():
+        periods = set()
+        for timestamp, obj in backups:
+            if len(periods) >= count:
+                break
+            period = datetime.strptime(timestamp, "%Y%m%d%H%M%S").strftime(
+                period_format
+            )
+            if period in periods:
+                continue
+            # 新しい順に見ているので、その期間で最初に出てきたものを残す
+            periods.add(period)
+            reasons.setdefault(obj["Key"], []).append(name)
+    if backups:
+        reasons.setdefault(backups[0][1]["Key"], []).append("latest")
+    keep = [obj for _, obj in backups if obj["Key"] in reasons]
+    delete = [obj for _, obj in backups if obj["Key"] not in reasons]
+    return Plan(keep, delete, reasons)
+
+
+def list_packs(s3_client, bucket, prefix=CHUNK_PREFIX):
+    """Every chunk pack object under ``prefix``."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [
+        obj
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(".pack")
+    ]
+
+
+def other_manifests(s3_client, bucket):
+    """Manifests outside BACKUP_PREFIX, which prune does not manage."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    prefixes = [
+        common["Prefix"]
+        for page in paginator.paginate(Bucket=bucket, Delimiter="/")
+        for common in page.get("CommonPrefixes", [])
+        if common["Prefix"] not in (BACKUP_PREFIX, CHUNK_PREFIX)
+    ]
+    return [
+        obj
+        for prefix in prefixes
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if is_manifest(obj["Key"])
+    ]
+
+
+def _manifest_packs(s3_client, bucket, key):
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return json.loads(gzip.decompress(body))["packs"]
+
+
+def referenced_packs(s3_client, bucket, manifests, workers=None):
+    """Pack keys referenced by the ``manifests`` objects."""
+    if not manifests:
+        return set()
+    workers = max(1, min(workers or DELETE_WORKERS, len(manifests)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 読めないmanifestがあれば例外のまま中断し、何も消さない
+        found = executor.map(
+            lambda obj: _manifest_packs(s3_client, bucket, obj["Key"]),
+            manifests,
+        )
+        return {pack for packs in found for pack in packs}
+
+
+def sweep(s3_client, bucket, backup_plan, workers=None):
+    """Unreferenced packs old enough to delete after ``backup_plan``."""
+    packs = list_packs(s3_client, bucket)
+    if not packs or not backup_plan.keep:
+        return []
+    manifests = [obj for obj in backup_plan.keep if is_manifest(obj["Key"])]
+    marked = referenced_packs(
+        s3_client,
+        bucket,
+        manifests + other_manifests(s3_client, bucket),
+        workers,
+    )
+    cutoff = max(obj["LastModified"] for obj in manifests or backup_plan.keep)
+    return [
+        obj
+        for obj in packs
+        if obj["Key"] not in marked and obj["LastModified"] < cutoff
+    ]
+
+
+def _delete_batch(s3_client, bucket, keys):
+    result = s3_client.delete_objects(
+        Bucket=bucket,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+    return result.get("Errors", [])
+
+
+def delete_keys(s3_client, bucket, keys, workers=None):
+    """Delete ``keys`` in batches; returns (deleted keys, error dicts)."""
+    batches = [
+        keys[i : i + DELETE_BATCH_SIZE]
+        for i in range(0, len(keys), DELETE_BATCH_SIZE)
+    ]
+    errors = []
+    workers = max(1, min(workers or DELETE_WORKERS, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_delete_batch, s3_client, bucket, batch)
+            for batch in batches
+        ]
+        for future in futures:
+            errors.extend(future.result())
+    failed = {error["Key"] for error in errors}
+    return [key for key in keys if key not in failed], errors
+
+
+def prune(s3_client, bucket, apply=False, rules=RULES, workers=None):
+    """Plan (and with ``apply`` carry out) a prune.
+
+    Returns the Plan and, when applied, the (deleted, errors) result for
+    backups and packs together. Packs are only swept once every backup
+    in the plan is gone, since a manifest that failed to delete may still
+    reference them.
+    """
+    backup_plan = plan(list_backup_objects(s3_client, bucket), rules)
+    backup_plan.packs = sweep(s3_client, bucket, backup_plan, workers)
+    if not apply:
+        return backup_plan, ([], [])
+    keys = [obj["Key"] for obj in backup_plan.delete]
+    deleted, errors = (
+        delete_keys(s3_client, bucket, keys, workers) if keys else ([], [])
+    )
+    if errors or not backup_plan.packs:
+        return backup_plan, (deleted, errors)
+    packs = [obj["Key"] for obj in backup_plan.packs]
+    swept, errors = delete_keys(s3_client, bucket, packs, workers)
+    return backup_plan, (deleted + swept, errors)
@@ -0,0 +1,92 @@
+"""Registry of the Minecraft servers the slash command can target.
+
+SERVERS holds a JSON object of server name -> {"cluster", "service",
+"task_family"}, e.g.::
+
+    {"survival": {"cluster": "mc-cluster", "service": "survival"},
+     "creative": {"cluster": "mc-cluster", "service": "creative"}}
+
+Without it the single server from ECS_CLUSTER_NAME / ECS_SERVICE_NAME is
+registered as "default", so existing deployments keep working. Commands
+without a target use DEFAULT_SERVER, or the first server listed.
+"""
+
+import json
+import os
+
+ALL = "all"
+DEFAULT_TASK_FAMILY = "minecraft-test"
+
+_registry = None
+
+
+class Server:
+    __slots__ = ("name", "cluster", "service", "task_family")
+
+    def __init__(self, name, cluster, service, task_family=None):
+        self.name = name
+        self.cluster = cluster
+        self.service = service
+        self.task_family = task_family or DEFAULT_TASK_FAMILY
+
+
+def load(environ=os.environ):
+    """name -> Server, in the order they are configured."""
+    raw = environ.get("SERVERS")
+    if not raw:
+        return {
+            "default": Server(
+                "default",
+                environ["ECS_CLUSTER_NAME"],
+                environ["ECS_SERVICE_NAME"],
+                environ.get("TASK_FAMILY"),
+            )
+        }
+    return {
+        name: Server(
+            name,
+            spec["cluster"],
+            spec["service"],
+            spec.get("task_family"),
+        )
+        for name, spec in json.loads(raw).items()
+    }
+
+
+def registry():
+    global _registry
+    if _registry is None:
+        _registry = load()
+    return _registry
+
+
+def default():
+    servers = registry()
+    name = os.environ.get("DEFAULT_SERVER")
+    if name in servers:
+        return servers[name]
+    return next(iter(servers.values()))
+
+
+def resolve(target=None):
+    """Servers for a command target: a name, "all", or None (default)."""
+    if target is None:
+        return [default()]
+    servers = registry()
+    if target == ALL:
+        return list(servers.values())
+    if target not in servers:
+        raise ValueError(target)
+    return [servers[target]]
+
+
+def by_cluster(targets):
+    """cluster -> services, for describe_services batched per cluster."""
+    clusters = {}
+    for server in targets:
+        clusters.setdefault(server.cluster, []).append(server.service)
+    return clusters
+
+
+def names():
+    return ", ".join(registry())
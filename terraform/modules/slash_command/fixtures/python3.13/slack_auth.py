@@ -1,27 +1,45 @@
-import boto3
+import os
+import threading
+import time
+import clients
 import hmac
 import hashlib
 from datetime import datetime
-import base64
 import logging
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# 署名シークレットを置いたSSMパラメータ名。空なら署名検証をしない
+SIGNING_SECRET_PARAMETER = os.environ.get("SLACK_SIGNING_SECRET_PARAMETER", "")
+SECRET_TTL_SECONDS = 300
+# 署名不一致時の再取得は、不正リクエストでSSMを叩かれないよう間隔を空ける
+MIN_REFRESH_INTERVAL_SECONDS = 30
 
-def authentication(headers, body):
-    logger.info("1 execute authentication!")
+# warm invocations reuse the decrypted secret and a keyed HMAC to copy from
+_lock = threading.Lock()
+_hmac_base = None
+_fetched_at = 0.0
+
+
+def enabled():
+    return bool(SIGNING_SECRET_PARAMETER)
+
+
+def authentication(headers, body: bytes):
+    """Verify Slack's request signature over the raw (decoded) body."""
     try:
         if suspected_replay_attack(headers):
             return False
 
-        actual_signature = headers.get("x-slack-signature")
-        expected_signature = calc_expected_signature(
-            headers, base64.b64decode(body).decode("utf-8")
-        )
-        logger.info(f"actual_signature: {actual_signature}")
-        logger.info(f"expected_signature: {expected_signature}")
-        return actual_signature == expected_signature
+        actual_signature = headers.get("x-slack-signature", "")
+        message = signing_message(headers, body)
+        if verify_signature(actual_signature, message):
+            return True
+        # 署名シークレットがローテーションされた可能性があるので取り直す
+        if not refresh_signing_key():
+            return False
+        return verify_signature(actual_signature, message)
     except Exception as e:
         logger.error(f"authentication exception: {e}")
         return False
@@ -34,25 +52,58 @@ def suspected_replay_attack(headers):
     return abs(request_ts - current_ts) > 60 * 5
 
 
-def calc_expected_signature(headers, body):
-    slack_secret = get_slack_signing_secret()
-    message = f"v0:{headers.get('x-slack-request-timestamp')}:{body}"
-    logger.info(f"slack signature message: {message}")
-    expected = (
-        "v0="
-        + hmac.new(
-            slack_secret.encode(), message.encode(), hashlib.sha256
-        ).hexdigest()
-    )
-    logger.info(f"expected signature: {expected}")
-    return expected
+def signing_message(headers, body: bytes) -> bytes:
+    timestamp = headers.get("x-slack-request-timestamp")
+    return f"v0:{timestamp}:".encode() + body
+
+
+def verify_signature(actual_signature: str, message: bytes) -> bool:
+    expected = calc_expected_signature(message)
+    return hmac.compare_digest(actual_signature.encode(), expected.encode())
+
+
+def calc_expected_signature(message: bytes) -> str:
+    mac = get_signing_key().copy()
+    mac.update(message)
+    return "v0=" + mac.hexdigest()
+
+
+def get_signing_key():
+    """HMAC-SHA256 keyed with the signing secret, cached for the TTL."""
+    if (
+        _hmac_base is not None
+        and time.time() - _fetched_at < SECRET_TTL_SECONDS
+    ):
+        return _hmac_base
+    with _lock:
+        if (
+            _hmac_base is None
+            or time.time() - _fetched_at >= SECRET_TTL_SECONDS
+        ):
+            _load_signing_key()
+        return _hmac_base
+
+
+def refresh_signing_key() -> bool:
+    """Reload the secret unless it was fetched moments ago."""
+    with _lock:
+        if time.time() - _fetched_at < MIN_REFRESH_INTERVAL_SECONDS:
+            return False
+        _load_signing_key()
+        return True
+
+
+def _load_signing_key():
+    global _hmac_base, _fetched_at
+    secret = get_slack_signing_secret()
+    _hmac_base = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+    _fetched_at = time.time()
 
 
 def get_slack_signing_secret():
-    logger.info("4 get_slack_signing_secret")
-    client = boto3.client("ssm")
+    client = clients.get("ssm")
     parameter = client.get_parameter(
-        Name="slack_signing_secret", WithDecryption=True
+        Name=SIGNING_SECRET_PARAMETER, WithDecryption=True
     )
     secret = parameter["Parameter"]["Value"]
 
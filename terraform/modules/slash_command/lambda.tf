@@ -13,12 +13,20 @@ module "dispatch_backup_function" {
 
   recreate_missing_package = true
 
-  source_path = [{
-    path             = "${path.module}/fixtures/python3.13"
-    pip_requirements = true
-  }]
+  # shared/ はclients.pyなど両Lambdaで共通のモジュール(zipの直下に入る)
+  source_path = [
+    {
+      path             = "${path.module}/fixtures/python3.13"
+      pip_requirements = true
+    },
+    "${path.module}/../shared/python3.13",
+  ]
   create_lambda_function_url = true
 
+  # 非同期実行(受付応答後のコマンド実行)は再試行するとworkflowが重複するため行わない
+  create_async_event_config = true
+  maximum_retry_attempts    = 0
+
   environment_variables = {
     GITHUB_TOKEN     = var.github_token
     REPO_OWNER       = var.github_user
@@ -26,6 +34,11 @@ module "dispatch_backup_function" {
     S3_BUCKET_NAME   = var.s3_bucket_name
     ECS_CLUSTER_NAME = "${local.name}-cluster"
     ECS_SERVICE_NAME = "${local.name}-service"
+    # 複数ワールド構成のときのサーバー一覧(未指定なら上の1台だけ)
+    SERVERS          = var.servers == null ? "" : jsonencode(var.servers)
+    DEFAULT_SERVER   = var.default_server
+    # 空なら署名検証をしない(パラメータを作ってから設定する)
+    SLACK_SIGNING_SECRET_PARAMETER = var.slack_signing_secret_parameter
   }
   attach_policy_json = true
   policy_json        = <<-EOT
@@ -55,6 +68,16 @@ module "dispatch_backup_function" {
       ],
       "Resource": "arn:aws:s3:::${var.s3_bucket_name}/*"
     },
+    {
+      "Effect": "Allow",
+      "Action": [
+        "s3:PutObject"
+      ],
+      "Resource": [
+        "arn:aws:s3:::${var.s3_bucket_name}/catalog/*",
+        "arn:aws:s3:::${var.s3_bucket_name}/locks/*"
+      ]
+    },
     {
       "Effect": "Allow",
       "Action": [
@@ -67,6 +90,13 @@ module "dispatch_backup_function" {
       ],
       "Resource": "*"
     },
+    {
+      "Effect": "Allow",
+      "Action": [
+        "lambda:InvokeFunction"
+      ],
+      "Resource": "arn:aws:lambda:ap-northeast-1:${var.aws_account_id}:function:dispatch_workflow_from_slack-function*"
+    },
     {
       "Action": [
           "iam:PassRole"
@@ -30,3 +30,25 @@ variable "aws_account_id" {
 }
 
 
+
+variable "servers" {
+  description = "Servers the slash command can target, by name. null keeps the single ECS_CLUSTER_NAME/ECS_SERVICE_NAME server"
+  type = map(object({
+    cluster     = string
+    service     = string
+    task_family = optional(string)
+  }))
+  default = null
+}
+
+variable "default_server" {
+  description = "Server used when a command names none (defaults to the first in servers)"
+  type        = string
+  default     = ""
+}
+
+variable "slack_signing_secret_parameter" {
+  description = "SSM SecureString parameter holding the Slack signing secret. When set, requests without a valid Slack signature get a 401; empty skips verification"
+  type        = string
+  default     = ""
+}
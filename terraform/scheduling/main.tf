@@ -116,7 +116,7 @@ module "custom_lambda" {
   source            = "../modules/lambda"
   log_group_name    = "/aws/ecs/minecraft-firelens-logs"
   log_group_arn     = "arn:aws:logs:ap-northeast-1:528163014577:log-group:/aws/ecs/minecraft-firelens-logs:*"
-  filter_patterns   = ["{ ($.level = \"ERROR\")}", "{${local.combined_string}}"]
+  filter_patterns   = ["{ ($.level = \"ERROR\") || ($.log = \"Can't keep up!*\") || ($.log = \"TPS from last*\") || ($.log = \"There are *\") }", "{${local.combined_string}}"]
   sns_kms_key_arn   = data.aws_kms_key.my_kms.arn
   sns_topic_arn     = data.aws_sns_topic.my_sns.arn
   slack_webhook_url = "https://hooks.slack.com/services/${var.WEBHOOK_PATH}"